@@ -0,0 +1,397 @@
+#app/audio_processing.py
+"""
+Preprocesamiento de audio previo a Speech-to-Text.
+
+Decodifica la grabación a PCM, recorta el silencio inicial y final con un
+detector de actividad de voz (VAD) por energía, mezcla a mono y remuestrea
+a 16 kHz LINEAR16. Así el audio que se sube a Google es más chico y el
+reconocimiento es más rápido.
+
+numpy es opcional: si no está instalado (o el audio no se puede decodificar)
+las funciones devuelven None y se envía el audio original sin cambios.
+"""
+
+import io
+import os
+import shutil
+import subprocess
+import wave
+from dataclasses import dataclass
+from typing import List, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - depende del entorno
+    np = None
+
+# ═══════════════════════════════════════════════════════════════════
+# CONFIGURACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+TARGET_SAMPLE_RATE = 16000
+TARGET_ENCODING = "LINEAR16"
+
+VAD_FRAME_MS = 30
+VAD_THRESHOLD_DB = float(os.getenv("VOICE_VAD_THRESHOLD_DB", "-45"))
+VAD_NOISE_MARGIN_DB = float(os.getenv("VOICE_VAD_NOISE_MARGIN_DB", "12"))
+VAD_PADDING_MS = int(os.getenv("VOICE_VAD_PADDING_MS", "200"))
+
+# Segmentación de audios largos (recognize sincrónico rechaza > ~60 s)
+LONG_AUDIO_SEGMENT_SECONDS = float(os.getenv("VOICE_LONG_AUDIO_SEGMENT_SECONDS", "50"))
+LONG_AUDIO_MIN_SILENCE_MS = int(os.getenv("VOICE_LONG_AUDIO_MIN_SILENCE_MS", "300"))
+
+FFMPEG_BIN = os.getenv("FFMPEG_BIN", "ffmpeg")
+FFMPEG_TIMEOUT_SECONDS = 20
+
+
+def preprocessing_enabled() -> bool:
+    """El preprocesamiento se puede desactivar con VOICE_PREPROCESS=false."""
+    if np is None:
+        return False
+    return os.getenv("VOICE_PREPROCESS", "true").lower() not in ("0", "false", "no")
+
+
+@dataclass
+class PreparedAudio:
+    """Audio listo para enviar a Speech-to-Text."""
+    content: bytes
+    encoding: str
+    sample_rate_hertz: int
+    original_bytes: int
+    duration_seconds: float
+    trimmed_seconds: float
+    speech_detected: bool = True
+
+    @property
+    def has_speech(self) -> bool:
+        return self.speech_detected and len(self.content) > 0
+
+# ═══════════════════════════════════════════════════════════════════
+# DECODIFICACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+def _is_wav(data) -> bool:
+    header = bytes(data[:12])
+    return header[:4] == b"RIFF" and header[8:12] == b"WAVE"
+
+
+def _decode_wav(data) -> Tuple["np.ndarray", int]:
+    """Decodificar WAV PCM a un array float32 (muestras, canales) en [-1, 1]."""
+    with wave.open(io.BytesIO(data), "rb") as wav:
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        frames = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(frames, dtype=np.uint8).astype(np.float32) - 128.0) / 128.0
+    elif sample_width == 2:
+        samples = np.frombuffer(frames, dtype="<i2").astype(np.float32) / 32768.0
+    elif sample_width == 4:
+        samples = np.frombuffer(frames, dtype="<i4").astype(np.float32) / 2147483648.0
+    else:
+        raise ValueError(f"Ancho de muestra no soportado: {sample_width} bytes")
+
+    return samples.reshape(-1, channels), sample_rate
+
+
+def ffmpeg_available() -> bool:
+    """Sin ffmpeg los formatos comprimidos se envían sin preprocesar."""
+    return shutil.which(FFMPEG_BIN) is not None
+
+
+def _decode_with_ffmpeg(data) -> Optional[Tuple["np.ndarray", int]]:
+    """Decodificar formatos comprimidos (WebM/Opus, OGG, MP3) usando ffmpeg."""
+    ffmpeg = shutil.which(FFMPEG_BIN)
+    if not ffmpeg:
+        return None
+
+    completed = subprocess.run(
+        [ffmpeg, "-hide_banner", "-loglevel", "error", "-i", "pipe:0", "-f", "wav", "pipe:1"],
+        input=bytes(data),
+        capture_output=True,
+        timeout=FFMPEG_TIMEOUT_SECONDS,
+        check=True,
+    )
+    return _decode_wav(completed.stdout)
+
+
+def decode_to_pcm(data) -> Optional[Tuple["np.ndarray", int]]:
+    """
+    Decodificar audio a PCM float32 con forma (muestras, canales).
+
+    Acepta cualquier objeto tipo bytes (bytes, memoryview, mmap).
+    Devuelve None si numpy no está disponible o el formato no se puede decodificar.
+    """
+    if np is None or not data:
+        return None
+    try:
+        if _is_wav(data):
+            return _decode_wav(data)
+        return _decode_with_ffmpeg(data)
+    except Exception as e:
+        print(f" No se pudo decodificar el audio para preprocesarlo: {str(e)}")
+        return None
+
+# ═══════════════════════════════════════════════════════════════════
+# TRANSFORMACIONES
+# ═══════════════════════════════════════════════════════════════════
+
+def downmix_to_mono(samples: "np.ndarray") -> "np.ndarray":
+    """Promediar los canales en una única señal mono."""
+    if samples.ndim == 1:
+        return samples
+    if samples.shape[1] == 1:
+        return samples[:, 0]
+    return samples.mean(axis=1, dtype=np.float32)
+
+
+def resample(samples: "np.ndarray", source_rate: int, target_rate: int = TARGET_SAMPLE_RATE) -> "np.ndarray":
+    """
+    Remuestrear una señal mono.
+
+    Para factores enteros (48 kHz → 16 kHz) se promedian bloques de muestras,
+    lo que actúa como filtro pasa-bajos simple antes de diezmar. Para el resto
+    se interpola linealmente.
+    """
+    if source_rate == target_rate or samples.size == 0:
+        return samples.astype(np.float32, copy=False)
+
+    if source_rate > target_rate and source_rate % target_rate == 0:
+        factor = source_rate // target_rate
+        usable = samples.size - (samples.size % factor)
+        return samples[:usable].reshape(-1, factor).mean(axis=1, dtype=np.float32)
+
+    duration = samples.size / source_rate
+    target_size = int(round(duration * target_rate))
+    source_times = np.arange(samples.size, dtype=np.float64) / source_rate
+    target_times = np.arange(target_size, dtype=np.float64) / target_rate
+    return np.interp(target_times, source_times, samples).astype(np.float32)
+
+
+def frame_energies_db(samples: "np.ndarray", sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> "np.ndarray":
+    """Energía RMS (dBFS) de cada frame de `frame_ms` milisegundos."""
+    frame_size = max(1, int(sample_rate * frame_ms / 1000))
+    frame_count = samples.size // frame_size
+    if frame_count == 0:
+        return np.zeros(0, dtype=np.float32)
+    frames = samples[:frame_count * frame_size].reshape(frame_count, frame_size)
+    rms = np.sqrt(np.mean(np.square(frames, dtype=np.float64), axis=1))
+    return (20.0 * np.log10(np.maximum(rms, 1e-10))).astype(np.float32)
+
+
+def detect_speech_frames(samples: "np.ndarray", sample_rate: int, frame_ms: int = VAD_FRAME_MS) -> "np.ndarray":
+    """
+    VAD por energía: un frame tiene voz si supera el umbral absoluto y
+    además queda `VAD_NOISE_MARGIN_DB` por encima del piso de ruido estimado.
+    """
+    energies = frame_energies_db(samples, sample_rate, frame_ms)
+    if energies.size == 0:
+        return np.zeros(0, dtype=bool)
+    noise_floor = float(np.percentile(energies, 10))
+    threshold = max(VAD_THRESHOLD_DB, noise_floor + VAD_NOISE_MARGIN_DB)
+    return energies > threshold
+
+
+def trim_silence(
+    samples: "np.ndarray",
+    sample_rate: int,
+    frame_ms: int = VAD_FRAME_MS,
+    padding_ms: int = VAD_PADDING_MS,
+) -> "np.ndarray":
+    """Recortar el silencio inicial y final. Devuelve un array vacío si no hay voz."""
+    speech = detect_speech_frames(samples, sample_rate, frame_ms)
+    voiced = np.flatnonzero(speech)
+    if voiced.size == 0:
+        return samples[:0]
+
+    frame_size = max(1, int(sample_rate * frame_ms / 1000))
+    padding = int(sample_rate * padding_ms / 1000)
+    start = max(0, int(voiced[0]) * frame_size - padding)
+    end = min(samples.size, (int(voiced[-1]) + 1) * frame_size + padding)
+    return samples[start:end]
+
+
+def split_on_silence(
+    samples: "np.ndarray",
+    sample_rate: int,
+    max_segment_seconds: float = LONG_AUDIO_SEGMENT_SECONDS,
+    min_silence_ms: int = LONG_AUDIO_MIN_SILENCE_MS,
+    frame_ms: int = VAD_FRAME_MS,
+) -> List["np.ndarray"]:
+    """
+    Dividir una señal mono en segmentos de hasta `max_segment_seconds`.
+
+    Los cortes se hacen en el centro de pausas de al menos `min_silence_ms`,
+    eligiendo la última pausa que entra en el segmento para no partir palabras.
+    Si no hay ninguna pausa disponible se corta en el máximo permitido.
+    """
+    max_samples = int(max_segment_seconds * sample_rate)
+    if samples.size <= max_samples:
+        return [samples]
+
+    frame_size = max(1, int(sample_rate * frame_ms / 1000))
+    min_silence_frames = max(1, int(min_silence_ms / frame_ms))
+    speech = detect_speech_frames(samples, sample_rate, frame_ms)
+
+    # Puntos de corte candidatos: centro de cada racha de silencio suficientemente larga
+    cut_points = []
+    run_start = None
+    for index, is_speech in enumerate(np.append(speech, True)):
+        if not is_speech and run_start is None:
+            run_start = index
+        elif is_speech and run_start is not None:
+            if index - run_start >= min_silence_frames:
+                cut_points.append(((run_start + index) // 2) * frame_size)
+            run_start = None
+
+    segments = []
+    start = 0
+    while samples.size - start > max_samples:
+        limit = start + max_samples
+        candidates = [point for point in cut_points if start < point <= limit]
+        end = candidates[-1] if candidates else limit
+        segments.append(samples[start:end])
+        start = end
+    segments.append(samples[start:])
+    return segments
+
+
+def to_linear16(samples: "np.ndarray") -> bytes:
+    """Convertir muestras float32 a PCM 16 bits little-endian."""
+    clipped = np.clip(samples, -1.0, 1.0)
+    return (clipped * 32767.0).astype("<i2").tobytes()
+
+
+def from_linear16(content) -> "np.ndarray":
+    """Convertir PCM 16 bits little-endian a muestras float32."""
+    return np.frombuffer(content, dtype="<i2").astype(np.float32) / 32768.0
+
+# ═══════════════════════════════════════════════════════════════════
+# ETAPA DE PREPROCESAMIENTO
+# ═══════════════════════════════════════════════════════════════════
+
+def preprocess_for_stt(audio_content) -> Optional[PreparedAudio]:
+    """
+    Preparar audio para Speech-to-Text: PCM → recorte de silencio → mono → 16 kHz.
+
+    Devuelve None si el preprocesamiento está desactivado o el audio no se
+    puede decodificar; en ese caso se debe enviar el audio original.
+
+    Si el VAD no encuentra voz (p. ej. audio sin frames silenciosos para
+    estimar el piso de ruido) no se recorta: `content` queda con el audio
+    remuestreado completo y `speech_detected` en False.
+    """
+    if not preprocessing_enabled():
+        return None
+
+    decoded = decode_to_pcm(audio_content)
+    if decoded is None:
+        return None
+
+    samples, sample_rate = decoded
+    mono = downmix_to_mono(samples)
+    original_duration = mono.size / sample_rate if sample_rate else 0.0
+
+    resampled = resample(mono, sample_rate, TARGET_SAMPLE_RATE)
+    trimmed = trim_silence(resampled, TARGET_SAMPLE_RATE)
+    speech_detected = trimmed.size > 0
+    if not speech_detected:
+        trimmed = resampled
+    duration = trimmed.size / TARGET_SAMPLE_RATE
+
+    return PreparedAudio(
+        content=to_linear16(trimmed),
+        encoding=TARGET_ENCODING,
+        sample_rate_hertz=TARGET_SAMPLE_RATE,
+        original_bytes=len(audio_content),
+        duration_seconds=duration,
+        trimmed_seconds=max(0.0, original_duration - duration),
+        speech_detected=speech_detected,
+    )
+
+
+def split_prepared_audio(
+    prepared: PreparedAudio,
+    max_segment_seconds: float = LONG_AUDIO_SEGMENT_SECONDS,
+) -> List[PreparedAudio]:
+    """
+    Dividir audio ya preprocesado en segmentos aptos para `recognize` sincrónico.
+
+    Cada segmento vuelve a recortarse para no enviar silencio en los bordes;
+    los que quedan sin voz se descartan (salvo que el VAD no haya detectado
+    voz en todo el audio: ahí se envían enteros). El orden original se conserva.
+    """
+    if prepared.duration_seconds <= max_segment_seconds:
+        return [prepared]
+
+    samples = from_linear16(prepared.content)
+    segments = []
+    for chunk in split_on_silence(samples, prepared.sample_rate_hertz, max_segment_seconds):
+        trimmed = trim_silence(chunk, prepared.sample_rate_hertz) if prepared.speech_detected else chunk
+        if trimmed.size == 0:
+            continue
+        content = to_linear16(trimmed)
+        segments.append(PreparedAudio(
+            content=content,
+            encoding=prepared.encoding,
+            sample_rate_hertz=prepared.sample_rate_hertz,
+            original_bytes=len(content),
+            duration_seconds=trimmed.size / prepared.sample_rate_hertz,
+            trimmed_seconds=(chunk.size - trimmed.size) / prepared.sample_rate_hertz,
+        ))
+    return segments
+
+# ═══════════════════════════════════════════════════════════════════
+# AUDIO DE MUESTRA (fixtures, benchmarks y diagnóstico)
+# ═══════════════════════════════════════════════════════════════════
+
+def generate_sample_wav(
+    speech_seconds: float = 2.0,
+    leading_silence_seconds: float = 1.5,
+    trailing_silence_seconds: float = 1.5,
+    sample_rate: int = 48000,
+    channels: int = 2,
+    seed: int = 0,
+    utterances: int = 1,
+    pause_seconds: float = 0.6,
+) -> bytes:
+    """
+    Generar un WAV determinístico con silencio + señal tipo voz + silencio.
+
+    La "voz" es una suma de armónicos modulada en amplitud (sílabas) sobre
+    un ruido de fondo muy bajo, suficiente para ejercitar el VAD. Con
+    `utterances` > 1 la voz se reparte en frases separadas por pausas.
+    """
+    if np is None:
+        raise RuntimeError("numpy es necesario para generar audio de muestra")
+
+    rng = np.random.default_rng(seed)
+    lead = int(leading_silence_seconds * sample_rate)
+    body = int(speech_seconds * sample_rate)
+    tail = int(trailing_silence_seconds * sample_rate)
+
+    t = np.arange(body, dtype=np.float64) / sample_rate
+    fundamental = 140.0 + 20.0 * np.sin(2 * np.pi * 0.7 * t)
+    phase = 2 * np.pi * np.cumsum(fundamental) / sample_rate
+    voice = sum(np.sin(k * phase) / k for k in range(1, 6))
+    syllables = 0.55 + 0.45 * np.sin(2 * np.pi * 4.0 * t)
+    voice = 0.25 * voice * syllables
+
+    if utterances > 1:
+        pause = np.zeros(int(pause_seconds * sample_rate))
+        parts = np.array_split(voice, utterances)
+        voice = np.concatenate([np.concatenate([part, pause]) for part in parts[:-1]] + [parts[-1]])
+
+    signal = np.concatenate([np.zeros(lead), voice, np.zeros(tail)])
+    signal += rng.normal(0.0, 0.0005, signal.size)
+    pcm = (np.clip(signal, -1.0, 1.0) * 32767.0).astype("<i2")
+    interleaved = np.repeat(pcm[:, None], channels, axis=1)
+
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(interleaved.tobytes())
+    return buffer.getvalue()
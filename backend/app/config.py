@@ -1,9 +1,9 @@
 #app/config.py
-from sqlalchemy import create_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 import os
 from dotenv import load_dotenv
+from app.database import create_db_engine, create_async_db_engine, db_settings
 
 
 load_dotenv()
@@ -25,18 +25,61 @@ if not DATABASE_URL:
 
 
 
-engine = create_engine(DATABASE_URL, echo=True)
+# Pool, timeouts y logging de SQL se configuran en app/database.py (variables DB_*)
+engine = create_db_engine(DATABASE_URL)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
-# --- nuevo ---
+# Única dependencia de sesión: todos los routers y guards de auth la importan
+# desde acá, así FastAPI la resuelve una sola vez por petición (una conexión)
 def get_db():
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
-# --- fin ---
+
+# Engine async opcional para lecturas públicas (DB_ASYNC_ENABLED=true, asyncpg)
+async_engine = None
+AsyncSessionLocal = None
+if db_settings.ASYNC_ENABLED:
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        async_engine = create_async_db_engine(db_settings.ASYNC_URL or DATABASE_URL)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    except (ImportError, ValueError) as e:
+        print(f"⚠️ Modo async de base de datos no disponible, se usa el engine sync: {e}")
+
+async def get_async_read_db():
+    """Sesión async para endpoints de solo lectura (usar con `run_read`)."""
+    async with AsyncSessionLocal() as db:
+        yield db
+
+# Sin modo async las lecturas comparten la sesión sync de la petición.
+# Con modo async, solo para rutas sin otras dependencias de base (guards de
+# auth, get_db): si no, la petición abre una conexión en cada pool
+get_read_db = get_async_read_db if AsyncSessionLocal is not None else get_db
+
+
+def _dependency_calls(dependant) -> set:
+    calls = {dependant.call}
+    for sub in dependant.dependencies:
+        calls |= _dependency_calls(sub)
+    return calls
+
+
+def read_db_conflicts(routes) -> list:
+    """Rutas que piden la sesión async de lectura junto con `get_db` (dos conexiones)."""
+    conflicts = []
+    for route in routes:
+        dependant = getattr(route, "dependant", None)
+        if dependant is None:
+            continue
+        calls = _dependency_calls(dependant)
+        if get_async_read_db in calls and get_db in calls:
+            conflicts.append(f"{','.join(sorted(route.methods or []))} {route.path}")
+    return conflicts
 
 SECRET_KEY = os.getenv("SECRET_KEY", "mi_clave_super_secreta")
 ALGORITHM = "HS256"
\ No newline at end of file
@@ -0,0 +1,404 @@
+#app/database.py
+"""
+Fábrica del engine de SQLAlchemy configurada por variables de entorno.
+
+- Pool dimensionado para el threadpool donde FastAPI corre los endpoints
+  sync (DB_POOL_SIZE + DB_MAX_OVERFLOW conexiones como máximo), con
+  pre-ping y reciclado para no usar conexiones cortadas por el servidor.
+- Timeouts de sentencia y de transacción inactiva en Postgres, con valores
+  por rol: el SQL que genera el chatbot tiene un límite más estricto.
+- En lugar de `echo=True` (todas las sentencias a stdout, de forma
+  sincrónica) se registran las consultas lentas y, opcionalmente, una
+  muestra de las demás.
+- Métricas de espera al pedir una conexión del pool.
+- Conteo de conexiones y consultas por petición HTTP (ver `track_request_db`).
+- Engine async opcional (asyncpg, DB_ASYNC_ENABLED) para las lecturas
+  públicas sin otras dependencias de base (ver `config.read_db_conflicts`):
+  `run_read` ejecuta la consulta en el event loop si la sesión es
+  async o en el threadpool si es la sesión sync de siempre.
+"""
+
+import contextvars
+import os
+import random
+import statistics
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Iterator, Optional
+
+from sqlalchemy import create_engine, event, text
+from sqlalchemy.engine import Engine
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from starlette.concurrency import run_in_threadpool
+
+try:
+    from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+except ImportError:  # pragma: no cover - requiere greenlet (sqlalchemy[asyncio])
+    AsyncEngine = None
+    AsyncSession = None
+    create_async_engine = None
+
+# ═══════════════════════════════════════════════════════════════════
+# CONFIGURACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+def _env_bool(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+class DatabaseSettings:
+    # Pool: por defecto 10 + 20 = 30 conexiones, por debajo de los 40 hilos del threadpool de AnyIO
+    POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+    MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+    POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+    POOL_PRE_PING = _env_bool("DB_POOL_PRE_PING", "true")
+
+    # Logging de SQL
+    ECHO = _env_bool("DB_ECHO", "false")
+    SLOW_QUERY_MS = float(os.getenv("DB_SLOW_QUERY_MS", "500"))
+    SLOW_QUERY_LOG_SAMPLE_RATE = float(os.getenv("DB_SLOW_QUERY_LOG_SAMPLE_RATE", "1.0"))
+    QUERY_LOG_SAMPLE_RATE = float(os.getenv("DB_QUERY_LOG_SAMPLE_RATE", "0"))
+
+    # Timeouts de Postgres (ms, 0 = sin límite)
+    STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "15000"))
+    IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.getenv("DB_IDLE_IN_TRANSACTION_TIMEOUT_MS", "60000"))
+    CHATBOT_STATEMENT_TIMEOUT_MS = int(os.getenv("DB_CHATBOT_STATEMENT_TIMEOUT_MS", "5000"))
+    CHATBOT_IDLE_IN_TRANSACTION_TIMEOUT_MS = int(os.getenv("DB_CHATBOT_IDLE_IN_TRANSACTION_TIMEOUT_MS", "10000"))
+
+    # Engine async para lecturas públicas (requiere asyncpg y greenlet)
+    ASYNC_ENABLED = _env_bool("DB_ASYNC_ENABLED", "false")
+    ASYNC_URL = os.getenv("DB_ASYNC_URL")
+
+
+db_settings = DatabaseSettings()
+
+# Roles de conexión: API general y SQL generado por el chatbot
+ROLE_API = "api"
+ROLE_CHATBOT = "chatbot"
+
+ROLE_TIMEOUTS_MS: Dict[str, Dict[str, int]] = {
+    ROLE_API: {
+        "statement_timeout": db_settings.STATEMENT_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": db_settings.IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    },
+    ROLE_CHATBOT: {
+        "statement_timeout": db_settings.CHATBOT_STATEMENT_TIMEOUT_MS,
+        "idle_in_transaction_session_timeout": db_settings.CHATBOT_IDLE_IN_TRANSACTION_TIMEOUT_MS,
+    },
+}
+
+# ═══════════════════════════════════════════════════════════════════
+# MÉTRICAS
+# ═══════════════════════════════════════════════════════════════════
+
+class DatabaseMetrics:
+    """Esperas del pool y consultas lentas (thread-safe, ventana acotada)."""
+
+    def __init__(self, window: int = 1000):
+        self._lock = threading.Lock()
+        self._waits_ms: deque = deque(maxlen=window)
+        self.reset()
+
+    def reset(self) -> None:
+        with self._lock:
+            self._waits_ms.clear()
+            self.checkouts = 0
+            self.checkout_timeouts = 0
+            self.queries = 0
+            self.slow_queries = 0
+
+    def record_checkout(self, wait_ms: float) -> None:
+        with self._lock:
+            self.checkouts += 1
+            self._waits_ms.append(wait_ms)
+
+    def record_checkout_timeout(self) -> None:
+        with self._lock:
+            self.checkout_timeouts += 1
+
+    def record_query(self, slow: bool) -> None:
+        with self._lock:
+            self.queries += 1
+            if slow:
+                self.slow_queries += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            waits = sorted(self._waits_ms)
+            summary = {
+                "checkouts": self.checkouts,
+                "checkout_timeouts": self.checkout_timeouts,
+                "queries": self.queries,
+                "slow_queries": self.slow_queries,
+                "slow_query_ms": db_settings.SLOW_QUERY_MS,
+            }
+        if waits:
+            summary["checkout_wait_ms"] = {
+                "p50": round(statistics.median(waits), 3),
+                "p95": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))], 3),
+                "max": round(waits[-1], 3),
+                "samples": len(waits),
+            }
+        return summary
+
+
+db_metrics = DatabaseMetrics()
+
+
+# ═══════════════════════════════════════════════════════════════════
+# ESTADÍSTICAS POR PETICIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+@dataclass
+class RequestDbStats:
+    """Conexiones tomadas del pool y consultas ejecutadas durante una petición."""
+    connections: int = 0
+    queries: int = 0
+
+
+_request_db_stats: contextvars.ContextVar[Optional[RequestDbStats]] = contextvars.ContextVar(
+    "request_db_stats", default=None
+)
+
+
+@contextmanager
+def track_request_db() -> Iterator[RequestDbStats]:
+    """
+    Contar conexiones y consultas del bloque. El contexto se copia al
+    threadpool de FastAPI, así que también cuenta lo que hacen los endpoints
+    y dependencias sync.
+    """
+    stats = RequestDbStats()
+    token = _request_db_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_db_stats.reset(token)
+
+
+def current_request_db_stats() -> Optional[RequestDbStats]:
+    return _request_db_stats.get()
+
+
+class _CheckoutTimingMixin:
+    """Mide cuánto espera cada pedido de conexión al pool."""
+
+    def __init__(self, *args, max_overflow: int = 10, **kwargs):
+        super().__init__(*args, max_overflow=max_overflow, **kwargs)
+        # QueuePool no expone el máximo configurado, solo el overflow actual
+        self.max_overflow = max_overflow
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except PoolTimeoutError:
+            db_metrics.record_checkout_timeout()
+            raise
+        db_metrics.record_checkout((time.perf_counter() - start) * 1000)
+        return connection
+
+
+class InstrumentedQueuePool(_CheckoutTimingMixin, QueuePool):
+    """QueuePool con métricas de espera."""
+
+
+class InstrumentedAsyncQueuePool(_CheckoutTimingMixin, AsyncAdaptedQueuePool):
+    """Pool del engine async con métricas de espera."""
+
+# ═══════════════════════════════════════════════════════════════════
+# FÁBRICA DEL ENGINE
+# ═══════════════════════════════════════════════════════════════════
+
+def _postgres_options(role: str) -> str:
+    timeouts = ROLE_TIMEOUTS_MS.get(role, ROLE_TIMEOUTS_MS[ROLE_API])
+    return " ".join(f"-c {name}={int(value)}" for name, value in timeouts.items())
+
+
+def _register_query_logging(engine: Engine) -> None:
+    @event.listens_for(engine, "checkout")
+    def _checkout(dbapi_connection, connection_record, connection_proxy):
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.connections += 1
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+        stats = _request_db_stats.get()
+        if stats is not None:
+            stats.queries += 1
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        elapsed_ms = (time.perf_counter() - conn.info["query_start"].pop()) * 1000
+        slow = elapsed_ms >= db_settings.SLOW_QUERY_MS
+        db_metrics.record_query(slow)
+        if slow and random.random() < db_settings.SLOW_QUERY_LOG_SAMPLE_RATE:
+            print(f"[DB] Consulta lenta ({elapsed_ms:.1f} ms): {statement}")
+        elif not slow and random.random() < db_settings.QUERY_LOG_SAMPLE_RATE:
+            print(f"[DB] ({elapsed_ms:.1f} ms): {statement}")
+
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(exception_context):
+        # Si la sentencia falla no hay after_cursor_execute: sin esto el inicio
+        # quedaría en conn.info mientras viva la conexión del pool
+        conn = exception_context.connection
+        starts = conn.info.get("query_start") if conn is not None else None
+        if starts:
+            starts.pop()
+
+
+def create_db_engine(url: str, role: str = ROLE_API, **overrides) -> Engine:
+    """
+    Crear un engine con el pool y los timeouts de `db_settings`.
+
+    En SQLite (tests y desarrollo local) no se aplican los timeouts de
+    Postgres y las bases en memoria conservan el pool por defecto.
+    """
+    parsed = make_url(url)
+    options = {
+        "echo": db_settings.ECHO,
+        "pool_pre_ping": db_settings.POOL_PRE_PING,
+    }
+
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not in_memory:
+        options.update(
+            poolclass=InstrumentedQueuePool,
+            pool_size=db_settings.POOL_SIZE,
+            max_overflow=db_settings.MAX_OVERFLOW,
+            pool_timeout=db_settings.POOL_TIMEOUT,
+            pool_recycle=db_settings.POOL_RECYCLE,
+        )
+    if parsed.get_backend_name() == "postgresql":
+        options["connect_args"] = {"options": _postgres_options(role)}
+
+    options.update(overrides)
+    engine = create_engine(url, **options)
+    _register_query_logging(engine)
+    return engine
+
+
+# Drivers async equivalentes a los sync de DATABASE_URL
+ASYNC_DRIVERS = {"postgresql": "asyncpg", "sqlite": "aiosqlite"}
+
+
+def to_async_url(url: str) -> str:
+    """`postgresql+psycopg2://…` → `postgresql+asyncpg://…` (idem sqlite → aiosqlite)."""
+    parsed = make_url(url)
+    backend = parsed.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise ValueError(f"No hay driver async configurado para {backend}")
+    return parsed.set(drivername=f"{backend}+{ASYNC_DRIVERS[backend]}").render_as_string(hide_password=False)
+
+
+def create_async_db_engine(url: str, role: str = ROLE_API, **overrides) -> "AsyncEngine":
+    """
+    Crear el engine async con el mismo pool, timeouts, logging y métricas
+    que `create_db_engine`. ImportError si faltan greenlet o el driver.
+    """
+    if create_async_engine is None:
+        raise ImportError("El modo async requiere greenlet: pip install 'sqlalchemy[asyncio]' asyncpg")
+
+    parsed = make_url(url)
+    if parsed.get_driver_name() not in ASYNC_DRIVERS.values():
+        parsed = make_url(to_async_url(url))
+    options = {
+        "echo": db_settings.ECHO,
+        "pool_pre_ping": db_settings.POOL_PRE_PING,
+    }
+    in_memory = parsed.get_backend_name() == "sqlite" and parsed.database in (None, "", ":memory:")
+    if not in_memory:
+        options.update(
+            poolclass=InstrumentedAsyncQueuePool,
+            pool_size=db_settings.POOL_SIZE,
+            max_overflow=db_settings.MAX_OVERFLOW,
+            pool_timeout=db_settings.POOL_TIMEOUT,
+            pool_recycle=db_settings.POOL_RECYCLE,
+        )
+    if parsed.get_backend_name() == "postgresql":
+        # asyncpg no acepta `options`: los timeouts van como server_settings
+        timeouts = ROLE_TIMEOUTS_MS.get(role, ROLE_TIMEOUTS_MS[ROLE_API])
+        options["connect_args"] = {
+            "server_settings": {name: str(int(value)) for name, value in timeouts.items()}
+        }
+
+    options.update(overrides)
+    engine = create_async_engine(parsed, **options)
+    _register_query_logging(engine.sync_engine)
+    return engine
+
+
+async def run_read(db, fn: Callable[..., Any], *args, **kwargs) -> Any:
+    """
+    Ejecutar `fn(session, *args)` (código ORM sync de siempre) sin ocupar un
+    hilo del threadpool cuando la sesión es async: corre con `run_sync` en el
+    event loop. Con una sesión sync se delega al threadpool como antes.
+
+    `fn` debe devolver datos ya serializables (schemas o valores), porque con
+    la sesión async no hay lazy loading fuera de `run_sync`.
+    """
+    if AsyncSession is not None and isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+def apply_role_timeouts(db, role: str) -> None:
+    """
+    Aplicar los timeouts de un rol a la transacción actual (SET LOCAL).
+    No hace nada fuera de Postgres.
+    """
+    bind = db.get_bind()
+    if bind.dialect.name != "postgresql":
+        return
+    for name, value in ROLE_TIMEOUTS_MS[role].items():
+        db.execute(text(f"SET LOCAL {name} = {int(value)}"))
+
+
+
+def insert_ignore(conn, table, rows: list) -> int:
+    """
+    INSERT de varias filas ignorando las que ya existen por clave primaria
+    (ON CONFLICT DO NOTHING en Postgres y SQLite). Para tablas auxiliares
+    que se crean al vuelo, como los contadores de usuarios. Devuelve
+    cuántas filas se insertaron.
+    """
+    if not rows:
+        return 0
+    dialect = conn.dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+        stmt = insert(table).on_conflict_do_nothing()
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(table).on_conflict_do_nothing()
+    else:
+        keys = [column.name for column in table.primary_key.columns]
+        existing = {tuple(row) for row in conn.execute(table.select().with_only_columns(*table.primary_key.columns))}
+        rows = [row for row in rows if tuple(row[key] for key in keys) not in existing]
+        if not rows:
+            return 0
+        stmt = table.insert()
+    return conn.execute(stmt, rows).rowcount
+
+def pool_metrics(engine: Engine) -> dict:
+    """Estado actual del pool más las métricas acumuladas de espera y consultas."""
+    pool = engine.pool
+    summary = {"pool": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        summary.update(
+            size=pool.size(),
+            checked_out=pool.checkedout(),
+            checked_in=pool.checkedin(),
+            overflow=pool.overflow(),
+            max_overflow=getattr(pool, "max_overflow", None),
+        )
+    summary.update(db_metrics.snapshot())
+    return summary
@@ -0,0 +1,384 @@
+#app/email_outbox.py
+"""
+Bandeja de salida de emails con envío en segundo plano.
+
+Cada email (bienvenida, recuperación de contraseña, avisos de cambio) abría
+una sesión SMTP nueva con STARTTLS y login dentro de la petición, y
+`create_user` o `/forgot-password` quedaban bloqueados varios segundos. Ahora:
+
+- `enqueue(db, ...)` agrega una fila a `email_pendiente` en la misma
+  transacción que la operación que lo origina: si la petición hace
+  rollback, el email no sale; si hace commit, no se pierde aunque se caiga
+  el proceso.
+- `OutboxWorker` (un hilo por proceso, arranca con la API) toma lotes de
+  EMAIL_OUTBOX_BATCH_SIZE pendientes (FOR UPDATE SKIP LOCKED en Postgres,
+  así varios workers no envían el mismo), los marca "enviando" con un lease
+  de EMAIL_OUTBOX_LEASE_SECONDS y hace commit antes de hablar con SMTP.
+  Los manda por una única conexión SMTP autenticada que se reutiliza entre
+  lotes mientras siga viva, y guarda cada resultado en su propia
+  transacción corta. Un lease vencido (proceso caído a mitad de lote)
+  vuelve a tomarse.
+- Un envío fallido se reintenta con backoff exponencial
+  (EMAIL_OUTBOX_BACKOFF_SECONDS × 2^intentos, máximo
+  EMAIL_OUTBOX_MAX_BACKOFF_SECONDS) hasta EMAIL_OUTBOX_MAX_ATTEMPTS; después
+  queda como "fallido".
+- Un commit con emails nuevos despierta al worker; si no, revisa la tabla
+  cada EMAIL_OUTBOX_POLL_SECONDS.
+- El cuerpo se borra al enviarse (puede tener contraseñas temporales).
+
+SMTP_SERVER, SMTP_PORT, SMTP_STARTTLS, EMAIL_USER y EMAIL_PASS configuran
+la conexión. Sin credenciales ni servidor propio los emails quedan
+pendientes. Para vaciar la cola a mano: `python -m app.email_outbox --once`.
+"""
+
+import argparse
+import os
+import smtplib
+import threading
+import time
+from datetime import datetime, timedelta
+from email.mime.text import MIMEText
+from typing import Optional
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from app import models
+from app.config import settings
+
+EMAIL_OUTBOX_ENABLED = os.getenv("EMAIL_OUTBOX_ENABLED", "true").strip().lower() in ("1", "true", "yes", "on")
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv("EMAIL_OUTBOX_BATCH_SIZE", "20"))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv("EMAIL_OUTBOX_POLL_SECONDS", "10"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_BACKOFF_SECONDS = float(os.getenv("EMAIL_OUTBOX_BACKOFF_SECONDS", "30"))
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = float(os.getenv("EMAIL_OUTBOX_MAX_BACKOFF_SECONDS", "3600"))
+EMAIL_OUTBOX_LEASE_SECONDS = float(os.getenv("EMAIL_OUTBOX_LEASE_SECONDS", "900"))
+
+SMTP_SERVER = os.getenv("SMTP_SERVER", "smtp.gmail.com")
+SMTP_PORT = int(os.getenv("SMTP_PORT", "587"))
+SMTP_STARTTLS = os.getenv("SMTP_STARTTLS", "true").strip().lower() in ("1", "true", "yes", "on")
+SMTP_TIMEOUT_SECONDS = float(os.getenv("SMTP_TIMEOUT_SECONDS", "30"))
+
+Email = models.EmailPendiente
+
+PENDIENTE = "pendiente"
+ENVIANDO = "enviando"
+ENVIADO = "enviado"
+FALLIDO = "fallido"
+
+# ═══════════════════════════════════════════════════════════════════
+# ENCOLADO (DENTRO DE LA TRANSACCIÓN DE LA PETICIÓN)
+# ═══════════════════════════════════════════════════════════════════
+
+def enqueue(db: Session, to: str, subject: str, body: str) -> models.EmailPendiente:
+    """Agregar un email a la bandeja; sale cuando la transacción hace commit."""
+    now = datetime.utcnow()
+    email = Email(
+        destinatario=to,
+        asunto=subject,
+        cuerpo=body,
+        estado=PENDIENTE,
+        intentos=0,
+        proximo_intento=now,
+        creado_en=now,
+    )
+    db.add(email)
+    db.info["email_outbox_enqueued"] = True
+    return email
+
+
+@event.listens_for(Session, "after_commit")
+def _wake_worker_after_commit(session):
+    if session.info.pop("email_outbox_enqueued", False):
+        outbox_worker.wake()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_enqueued(session):
+    session.info.pop("email_outbox_enqueued", None)
+
+# ═══════════════════════════════════════════════════════════════════
+# CONEXIÓN SMTP REUTILIZABLE
+# ═══════════════════════════════════════════════════════════════════
+
+class SmtpConnection:
+    """Una sesión SMTP autenticada que se mantiene abierta entre lotes."""
+
+    def __init__(self, host: str, port: int, user: Optional[str], password: Optional[str],
+                 starttls: bool = True, timeout: float = SMTP_TIMEOUT_SECONDS):
+        self.host = host
+        self.port = port
+        self.user = user
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+        self._server: Optional[smtplib.SMTP] = None
+        self.connections_opened = 0
+
+    @property
+    def sender(self) -> str:
+        return self.user or f"no-reply@{self.host}"
+
+    def _open(self) -> smtplib.SMTP:
+        server = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.starttls:
+            server.starttls()
+        if self.user and self.password:
+            server.login(self.user, self.password)
+        self.connections_opened += 1
+        return server
+
+    def _alive(self) -> bool:
+        try:
+            return self._server is not None and self._server.noop()[0] == 250
+        except smtplib.SMTPException:
+            return False
+        except OSError:
+            return False
+
+    def send(self, to: str, subject: str, body: str) -> None:
+        if not self._alive():
+            self.close()
+            self._server = self._open()
+        msg = MIMEText(body)
+        msg["Subject"] = subject
+        msg["From"] = self.sender
+        msg["To"] = to
+        try:
+            self._server.send_message(msg)
+        except smtplib.SMTPServerDisconnected:
+            # El servidor cortó la sesión entre el NOOP y el envío
+            self.close()
+            raise
+
+    def close(self) -> None:
+        if self._server is not None:
+            try:
+                self._server.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+            self._server = None
+
+
+def smtp_configured() -> bool:
+    """Credenciales de Gmail o un servidor propio (p. ej. un relay local)."""
+    return bool(settings.EMAIL_USER and settings.EMAIL_PASS) or "SMTP_SERVER" in os.environ
+
+
+def build_connection() -> SmtpConnection:
+    return SmtpConnection(SMTP_SERVER, SMTP_PORT, settings.EMAIL_USER, settings.EMAIL_PASS, SMTP_STARTTLS)
+
+# ═══════════════════════════════════════════════════════════════════
+# ENVÍO POR LOTES
+# ═══════════════════════════════════════════════════════════════════
+
+def backoff_seconds(attempts: int) -> float:
+    return min(EMAIL_OUTBOX_MAX_BACKOFF_SECONDS, EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** max(0, attempts - 1))
+
+
+def _claim(db: Session, batch_size: int, now: datetime) -> list:
+    """Reservar un lote: pendientes vencidos y envíos con el lease vencido.
+
+    Pasan a "enviando" con el lease en `proximo_intento` y se hace commit
+    enseguida: las filas no quedan bloqueadas mientras se habla con SMTP.
+    """
+    emails = db.execute(
+        select(Email)
+        .where(Email.estado.in_((PENDIENTE, ENVIANDO)), Email.proximo_intento <= now)
+        .order_by(Email.id)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)
+    ).scalars().all()
+    lease_until = now + timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS)
+    claimed = []
+    for email in emails:
+        email.estado = ENVIANDO
+        email.proximo_intento = lease_until
+        claimed.append((email.id, email.destinatario, email.asunto, email.cuerpo))
+    db.commit()
+    return claimed
+
+
+def _finish(db: Session, email_id: int, error: Optional[Exception], result: dict) -> None:
+    """Registrar el resultado de un envío en su propia transacción corta."""
+    email = db.get(Email, email_id, with_for_update=True)
+    if email is None or email.estado != ENVIANDO:
+        # Otro worker la tomó tras vencer el lease y ya la resolvió
+        db.rollback()
+        return
+    email.intentos += 1
+    if error is None:
+        email.estado = ENVIADO
+        email.enviado_en = datetime.utcnow()
+        email.cuerpo = ""
+        result["sent"] += 1
+    else:
+        email.ultimo_error = str(error)[:500]
+        if email.intentos >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+            email.estado = FALLIDO
+            result["failed"] += 1
+            print(f"[EMAIL] Descartado para {email.destinatario} tras {email.intentos} intentos: {error}")
+        else:
+            email.estado = PENDIENTE
+            email.proximo_intento = datetime.utcnow() + timedelta(seconds=backoff_seconds(email.intentos))
+            result["retried"] += 1
+    db.commit()
+
+
+def send_batch(db: Session, connection: SmtpConnection, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE) -> dict:
+    """Enviar un lote de pendientes vencidos; devuelve {sent, retried, failed}.
+
+    Ninguna transacción queda abierta durante el envío SMTP: si el proceso
+    muere a mitad de lote, las filas en "enviando" vuelven a tomarse cuando
+    vence su lease.
+    """
+    claimed = _claim(db, batch_size, datetime.utcnow())
+
+    result = {"sent": 0, "retried": 0, "failed": 0}
+    for email_id, to, subject, body in claimed:
+        try:
+            connection.send(to, subject, body)
+            error = None
+        except (smtplib.SMTPException, OSError) as e:
+            error = e
+        _finish(db, email_id, error, result)
+    result["batch"] = len(claimed)
+    return result
+
+
+def pending_count(db: Session) -> int:
+    return db.execute(select(func.count()).select_from(Email).where(Email.estado == PENDIENTE)).scalar_one()
+
+# ═══════════════════════════════════════════════════════════════════
+# WORKER EN SEGUNDO PLANO
+# ═══════════════════════════════════════════════════════════════════
+
+class OutboxWorker:
+    """Hilo que vacía la bandeja con una conexión SMTP reutilizada."""
+
+    def __init__(self, session_factory=None, connection_factory=build_connection,
+                 poll_seconds: float = EMAIL_OUTBOX_POLL_SECONDS, batch_size: int = EMAIL_OUTBOX_BATCH_SIZE):
+        self.session_factory = session_factory
+        self.connection_factory = connection_factory
+        self.poll_seconds = poll_seconds
+        self.batch_size = batch_size
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._connection: Optional[SmtpConnection] = None
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+        self.batches = 0
+
+    def _sessions(self):
+        if self.session_factory is None:
+            from app.config import SessionLocal
+
+            self.session_factory = SessionLocal
+        return self.session_factory
+
+    def run_once(self) -> int:
+        """Enviar lotes hasta vaciar los pendientes vencidos; devuelve cuántos salieron."""
+        with self._lock:
+            if self._connection is None:
+                self._connection = self.connection_factory()
+            sent = 0
+            while True:
+                db = self._sessions()()
+                try:
+                    result = send_batch(db, self._connection, self.batch_size)
+                finally:
+                    db.close()
+                self.batches += 1 if result["batch"] else 0
+                self.sent += result["sent"]
+                self.retried += result["retried"]
+                self.failed += result["failed"]
+                sent += result["sent"]
+                # Lote incompleto o con errores: esperar al próximo ciclo
+                if result["batch"] < self.batch_size or result["sent"] < result["batch"]:
+                    return sent
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as e:
+                print(f"[EMAIL] Error procesando la bandeja: {e}")
+            self._wake.wait(self.poll_seconds)
+            self._wake.clear()
+
+    def start(self) -> None:
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._loop, name="email-outbox", daemon=True)
+        self._thread.start()
+
+    def wake(self) -> None:
+        self._wake.set()
+
+    def stop(self, timeout: float = 5) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        with self._lock:
+            if self._connection is not None:
+                self._connection.close()
+                self._connection = None
+
+    def snapshot(self) -> dict:
+        return {
+            "running": self._thread is not None and self._thread.is_alive(),
+            "sent": self.sent,
+            "retried": self.retried,
+            "failed": self.failed,
+            "batches": self.batches,
+            "smtp_connections_opened": self._connection.connections_opened if self._connection else 0,
+        }
+
+
+outbox_worker = OutboxWorker()
+
+
+def ensure_schema(engine) -> None:
+    """Crear la tabla de la bandeja si no existe (no hay migraciones)."""
+    Email.__table__.create(bind=engine, checkfirst=True)
+
+
+def start_worker() -> bool:
+    """Arrancar el worker si está habilitado y hay SMTP configurado."""
+    if not EMAIL_OUTBOX_ENABLED:
+        return False
+    if not smtp_configured():
+        print("[EMAIL] SMTP no configurado: los emails quedan pendientes en la bandeja")
+        return False
+    outbox_worker.start()
+    return True
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Enviar los emails pendientes de la bandeja")
+    parser.add_argument("--once", action="store_true", help="Vaciar la cola y salir")
+    args = parser.parse_args()
+
+    from app.config import engine
+
+    ensure_schema(engine)
+    if args.once:
+        sent = outbox_worker.run_once()
+        outbox_worker.stop()
+        print(f"Enviados: {sent} · reintentos programados: {outbox_worker.retried} · fallidos: {outbox_worker.failed}")
+        return
+    outbox_worker.start()
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        outbox_worker.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,237 @@
+#app/hashing.py
+"""
+Hashing y verificación de contraseñas (bcrypt) en un pool de procesos.
+
+bcrypt es CPU puro a propósito: cada hash o verificación tarda decenas o
+cientos de ms. Corriendo en el hilo de la petición, un cambio de
+contraseña (hasta 6 verificaciones contra el historial) o una ráfaga de
+logins ocupa los hilos del threadpool de FastAPI y frena al resto de los
+endpoints. Este módulo:
+
+- Ejecuta bcrypt en un ProcessPoolExecutor de HASHING_MAX_WORKERS procesos.
+- `verify_any` compara una contraseña contra varios hashes en paralelo y
+  corta en la primera coincidencia (historial de contraseñas).
+- Acota el trabajo pendiente a HASHING_MAX_PENDING operaciones: si no hay
+  lugar en HASHING_QUEUE_TIMEOUT_SECONDS responde 503 en vez de encolar sin
+  límite.
+- Publica profundidad de cola y latencias (espera + bcrypt) en /health.
+
+HASHING_EXECUTOR elige "process" (por defecto), "thread" o "inline" (sin
+pool, útil para depurar). Si el pool de procesos no se puede crear se
+sigue con hilos.
+"""
+
+import multiprocessing
+import os
+import statistics
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Executor, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Iterable, Optional
+
+from fastapi import HTTPException
+
+# Esquemas y costo salen de app/hashing_policy.py (services re-exporta pwd_context)
+from app.hashing_policy import pwd_context
+
+HASHING_EXECUTOR = os.getenv("HASHING_EXECUTOR", "process")
+HASHING_MAX_WORKERS = int(os.getenv("HASHING_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+HASHING_MAX_PENDING = int(os.getenv("HASHING_MAX_PENDING", str(HASHING_MAX_WORKERS * 8)))
+HASHING_QUEUE_TIMEOUT_SECONDS = float(os.getenv("HASHING_QUEUE_TIMEOUT_SECONDS", "5"))
+
+# ═══════════════════════════════════════════════════════════════════
+# FUNCIONES DEL WORKER (nivel de módulo para poder serializarlas)
+# ═══════════════════════════════════════════════════════════════════
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify(password: str, hashed: str) -> bool:
+    return pwd_context.verify(password, hashed)
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple:
+    return pwd_context.verify_and_update(password, hashed)
+
+# ═══════════════════════════════════════════════════════════════════
+# SERVICIO
+# ═══════════════════════════════════════════════════════════════════
+
+class PasswordHasher:
+    """Pool acotado para bcrypt con métricas de cola y latencia."""
+
+    def __init__(self, mode: str, max_workers: int, max_pending: int, queue_timeout: float):
+        self.mode = mode
+        self.max_workers = max(1, max_workers)
+        self.max_pending = max(1, max_pending)
+        self.queue_timeout = queue_timeout
+        # Lugares libres en la cola; se toman todos juntos (ver _acquire)
+        self._free_slots = self.max_pending
+        self._slots_cond = threading.Condition()
+        self._executor: Optional[Executor] = None
+        self._executor_lock = threading.Lock()
+        self._metrics_lock = threading.Lock()
+        self.reset_metrics()
+
+    # ── pool ──────────────────────────────────────────────────────────
+
+    def _get_executor(self) -> Optional[Executor]:
+        if self.mode == "inline":
+            return None
+        with self._executor_lock:
+            if self._executor is None:
+                if self.mode == "process":
+                    try:
+                        # spawn: el proceso padre tiene hilos (threadpool, pools de DB)
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            mp_context=multiprocessing.get_context("spawn"),
+                        )
+                    except (OSError, NotImplementedError) as e:
+                        print(f"[HASH] Pool de procesos no disponible ({e}); usando hilos")
+                        self.mode = "thread"
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="bcrypt")
+            return self._executor
+
+    def _discard_executor(self, executor: Executor) -> None:
+        """Descartar un pool roto para que la próxima llamada cree otro."""
+        with self._executor_lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    def _with_executor(self, call):
+        """
+        Ejecutar `call(executor)`. Si un proceso del pool murió (p. ej. por
+        OOM) el ProcessPoolExecutor queda inutilizable: se recrea y se
+        reintenta una vez.
+        """
+        for attempt in range(2):
+            executor = self._get_executor()
+            try:
+                return call(executor)
+            except BrokenProcessPool:
+                self._discard_executor(executor)
+                if attempt:
+                    raise
+                print("[HASH] Pool de procesos roto; recreándolo")
+
+    def shutdown(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    # ── métricas ──────────────────────────────────────────────────────
+
+    def reset_metrics(self) -> None:
+        with self._metrics_lock:
+            self._pending = 0
+            self._max_pending_seen = 0
+            self._operations = 0
+            self._rejected = 0
+            self._latencies_ms = deque(maxlen=1000)
+
+    def _acquire(self, count: int) -> None:
+        # Todos los lugares de una vez: tomarlos de a uno permitía que varias
+        # verify_any retuvieran lugares parciales y vencieran todas juntas
+        with self._slots_cond:
+            if not self._slots_cond.wait_for(lambda: self._free_slots >= count, timeout=self.queue_timeout):
+                with self._metrics_lock:
+                    self._rejected += 1
+                raise HTTPException(
+                    status_code=503,
+                    detail="El servicio de contraseñas está saturado. Intentá nuevamente en unos segundos.",
+                )
+            self._free_slots -= count
+        with self._metrics_lock:
+            self._pending += count
+            self._max_pending_seen = max(self._max_pending_seen, self._pending)
+
+    def _release(self, count: int, started: float) -> None:
+        with self._metrics_lock:
+            self._pending -= count
+            self._operations += count
+            self._latencies_ms.append((time.perf_counter() - started) * 1000)
+        with self._slots_cond:
+            self._free_slots += count
+            self._slots_cond.notify_all()
+
+    def snapshot(self) -> dict:
+        with self._metrics_lock:
+            latencies = sorted(self._latencies_ms)
+            summary = {
+                "executor": self.mode,
+                "workers": self.max_workers,
+                "max_pending": self.max_pending,
+                "pending": self._pending,
+                "max_pending_seen": self._max_pending_seen,
+                "operations": self._operations,
+                "rejected": self._rejected,
+            }
+        if latencies:
+            summary["latency_ms"] = {
+                "p50": round(statistics.median(latencies), 2),
+                "p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+                "max": round(latencies[-1], 2),
+                "samples": len(latencies),
+            }
+        return summary
+
+    # ── operaciones ───────────────────────────────────────────────────
+
+    def _run(self, fn, *args):
+        started = time.perf_counter()
+        self._acquire(1)
+        try:
+            return self._with_executor(
+                lambda executor: fn(*args) if executor is None else executor.submit(fn, *args).result()
+            )
+        finally:
+            self._release(1, started)
+
+    def hash(self, password: str) -> str:
+        return self._run(_hash, password)
+
+    def verify(self, password: str, hashed: str) -> bool:
+        return self._run(_verify, password, hashed)
+
+    def verify_and_update(self, password: str, hashed: str) -> tuple:
+        """(válida, hash nuevo o None si el guardado cumple la política)."""
+        return self._run(_verify_and_update, password, hashed)
+
+    def verify_any(self, password: str, hashes: Iterable[str]) -> bool:
+        """True si la contraseña coincide con alguno de los hashes (en paralelo)."""
+        hashes = [hashed for hashed in hashes if hashed]
+        if not hashes:
+            return False
+        started = time.perf_counter()
+        slots = min(len(hashes), self.max_pending)
+        self._acquire(slots)
+        try:
+            return self._with_executor(lambda executor: self._verify_any_on(executor, password, hashes))
+        finally:
+            self._release(slots, started)
+
+
+    @staticmethod
+    def _verify_any_on(executor: Optional[Executor], password: str, hashes: list) -> bool:
+        if executor is None:
+            return any(_verify(password, hashed) for hashed in hashes)
+        pending = {executor.submit(_verify, password, hashed) for hashed in hashes}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(future.result() for future in done):
+                for future in pending:
+                    future.cancel()
+                return True
+        return False
+
+
+password_hasher = PasswordHasher(
+    HASHING_EXECUTOR, HASHING_MAX_WORKERS, HASHING_MAX_PENDING, HASHING_QUEUE_TIMEOUT_SECONDS
+)
@@ -0,0 +1,118 @@
+#app/hashing_policy.py
+"""
+Política de hashing de contraseñas: esquemas, costo y calibración.
+
+`pwd_context` se arma con variables de entorno en vez de los valores por
+defecto de passlib:
+
+- PASSWORD_HASH_SCHEMES ("bcrypt"): esquemas aceptados separados por coma.
+  El primero se usa para hashear; el resto solo se verifica y se marca
+  como desactualizado, así se puede migrar de esquema sin resetear.
+- PASSWORD_BCRYPT_ROUNDS (12): costo de bcrypt (2^rounds iteraciones). Los
+  hashes con otro costo también cuentan como desactualizados.
+
+En un login exitoso, auth.login llama a `verify_and_update`; si el hash
+guardado no cumple la política se reemplaza por uno nuevo con
+`apply_rehash` (sin tocar el historial ni revocar tokens).
+
+Para elegir el costo en el hardware real:
+    python -m app.hashing_policy --target-ms 250 [--min-rounds 8]
+        [--max-rounds 15] [--samples 3]
+mide el tiempo de hash por costo, sugiere el mayor que entra en el
+objetivo y estima logins por segundo por núcleo.
+"""
+
+import argparse
+import os
+import statistics
+import time
+
+from passlib.context import CryptContext
+
+PASSWORD_HASH_SCHEMES = [
+    scheme.strip() for scheme in os.getenv("PASSWORD_HASH_SCHEMES", "bcrypt").split(",") if scheme.strip()
+]
+PASSWORD_BCRYPT_ROUNDS = int(os.getenv("PASSWORD_BCRYPT_ROUNDS", "12"))
+
+
+def build_context(schemes: list, bcrypt_rounds: int) -> CryptContext:
+    """CryptContext con el primer esquema por defecto y costo fijo de bcrypt."""
+    options = {"schemes": schemes, "default": schemes[0], "deprecated": "auto"}
+    if "bcrypt" in schemes:
+        # min = max = default: cualquier hash con otro costo pide rehash
+        options.update(
+            bcrypt__default_rounds=bcrypt_rounds,
+            bcrypt__min_rounds=bcrypt_rounds,
+            bcrypt__max_rounds=bcrypt_rounds,
+        )
+    return CryptContext(**options)
+
+
+pwd_context = build_context(PASSWORD_HASH_SCHEMES, PASSWORD_BCRYPT_ROUNDS)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True si el hash usa un esquema o costo distinto al de la política."""
+    return pwd_context.needs_update(hashed)
+
+
+def apply_rehash(db, user, new_hash: str) -> None:
+    """
+    Guardar un hash actualizado de la misma contraseña. Se marca en la
+    sesión para que app/security_epochs.py no lo trate como un cambio de
+    contraseña (no revoca tokens) y no pasa por el historial.
+    """
+    user.contrasena = new_hash
+    db.info.setdefault("password_rehash", set()).add(user.id_usuario)
+
+# ═══════════════════════════════════════════════════════════════════
+# CALIBRACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+def measure_rounds(rounds: int, samples: int = 3) -> float:
+    """Mediana en ms de un hash bcrypt con el costo dado."""
+    context = build_context(["bcrypt"], rounds)
+    timings = []
+    for _ in range(samples):
+        start = time.perf_counter()
+        context.hash("Calibracion-123!")
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def calibrate(target_ms: float, min_rounds: int = 8, max_rounds: int = 15, samples: int = 3) -> tuple:
+    """
+    Medir cada costo y devolver (costo sugerido, [(costo, ms)]). El sugerido
+    es el mayor cuyo hash no supera target_ms (o min_rounds si ninguno).
+    """
+    results, suggested = [], min_rounds
+    for rounds in range(min_rounds, max_rounds + 1):
+        elapsed = measure_rounds(rounds, samples)
+        results.append((rounds, elapsed))
+        if elapsed <= target_ms:
+            suggested = rounds
+        else:
+            # Cada punto de costo duplica el tiempo: no hace falta seguir
+            break
+    return suggested, results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrar el costo de bcrypt contra una latencia objetivo")
+    parser.add_argument("--target-ms", type=float, default=250)
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=15)
+    parser.add_argument("--samples", type=int, default=3)
+    args = parser.parse_args()
+
+    suggested, results = calibrate(args.target_ms, args.min_rounds, args.max_rounds, args.samples)
+    print(f"Objetivo: {args.target_ms:.0f} ms por hash (costo actual: {PASSWORD_BCRYPT_ROUNDS})")
+    print("rounds  ms/hash    logins/s por núcleo")
+    for rounds, elapsed in results:
+        marker = " ←" if rounds == suggested else ""
+        print(f"{rounds:<7} {elapsed:<10.1f} {1000 / elapsed:<.1f}{marker}")
+    print(f"\nSugerido: PASSWORD_BCRYPT_ROUNDS={suggested}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#app/loaders.py
+"""
+Presets de carga (loader options) para las consultas que arman detalles de
+empresa.
+
+Los builders (`build_empresa_detail`, `build_empresa_detail_public`)
+recorren varias relaciones; con lazy loading cada una es una consulta por
+fila (N+1). Con estos presets las colecciones se cargan con `selectinload`
+(una consulta IN por relación para todas las empresas) y los many-to-one
+de catálogo con `joinedload` dentro de esa misma consulta, así un listado
+cuesta una cantidad fija de sentencias sin importar cuántas empresas tenga.
+
+Uso:
+    db.query(Empresa).options(*EMPRESA_DETAIL_PUBLIC).all()
+"""
+
+from typing import Iterable
+
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import (
+    Contacto,
+    Empresa,
+    EmpresaServicio,
+    Servicio,
+    ServicioPolo,
+    Usuario,
+    Vehiculo,
+    VehiculosEmpresa,
+)
+
+# ═══════════════════════════════════════════════════════════════════
+# RELACIONES DE EMPRESA
+# ═══════════════════════════════════════════════════════════════════
+
+# contactos → tipo_contacto
+EMPRESA_CONTACTOS = (
+    selectinload(Empresa.contactos).joinedload(Contacto.tipo_contacto),
+)
+
+# servicios_polo → tipo_servicio / lotes
+EMPRESA_SERVICIOS_POLO = (
+    selectinload(Empresa.servicios_polo).options(
+        joinedload(ServicioPolo.tipo_servicio),
+        selectinload(ServicioPolo.lotes),
+    ),
+)
+
+# vehiculos_emp → vehiculo → tipo_vehiculo
+EMPRESA_VEHICULOS = (
+    selectinload(Empresa.vehiculos_emp)
+    .joinedload(VehiculosEmpresa.vehiculo)
+    .joinedload(Vehiculo.tipo_vehiculo),
+)
+
+# servicios → servicio → tipo_servicio
+EMPRESA_SERVICIOS = (
+    selectinload(Empresa.servicios)
+    .joinedload(EmpresaServicio.servicio)
+    .joinedload(Servicio.tipo_servicio),
+)
+
+# ═══════════════════════════════════════════════════════════════════
+# PRESETS POR BUILDER
+# ═══════════════════════════════════════════════════════════════════
+
+# admin_users.build_empresa_detail_public (/all, /search)
+EMPRESA_DETAIL_PUBLIC = EMPRESA_CONTACTOS + EMPRESA_SERVICIOS_POLO
+
+# company_user.build_empresa_detail (/me)
+EMPRESA_DETAIL = EMPRESA_VEHICULOS + EMPRESA_CONTACTOS + EMPRESA_SERVICIOS + EMPRESA_SERVICIOS_POLO
+
+# /polo/me: ServicioPoloOut incluye lotes y UserOut incluye roles
+SERVICIO_POLO_DETAIL = (selectinload(ServicioPolo.lotes),)
+USUARIO_ROLES = (selectinload(Usuario.roles),)
+
+# app/principals.py: usuario + empresa + roles en una sola consulta con JOIN
+PRINCIPAL = (joinedload(Usuario.empresa), joinedload(Usuario.roles))
+
+# ═══════════════════════════════════════════════════════════════════
+# DIRECTORIO PAGINADO
+# ═══════════════════════════════════════════════════════════════════
+
+DIRECTORY_INCLUDES = ("contactos", "servicios_polo", "lotes")
+
+
+def directory_options(include: Iterable[str]) -> tuple:
+    """Opciones de carga para las expansiones pedidas en /directory?include=."""
+    include = set(include)
+    options = ()
+    if "contactos" in include:
+        options += EMPRESA_CONTACTOS
+    if "lotes" in include:
+        options += EMPRESA_SERVICIOS_POLO
+    elif "servicios_polo" in include:
+        options += (selectinload(Empresa.servicios_polo).joinedload(ServicioPolo.tipo_servicio),)
+    return options
@@ -1,7 +1,8 @@
 # app/main.py
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.config import SessionLocal
+from app.config import SessionLocal, read_db_conflicts
+from app.database import track_request_db
 from app.routes.auth import router as auth_router
 from app.routes.company_user import router as company_user_router
 from app.routes.admin_users import router as admin_users_router
@@ -10,7 +11,7 @@ from app.routes.tipos import router as tipos
 from app.routes.google_auth import router as google_auth_router
 
 # ✨ IMPORTAR EL NUEVO ROUTER DE VOZ
-from app.routes.voice import router as voice_router
+from app.routes.voice import router as voice_router, diagnostics_router as voice_diagnostics_router
 
 from dotenv import load_dotenv
 from starlette.middleware.sessions import SessionMiddleware 
@@ -48,6 +49,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Conexiones y consultas de base de datos por petición (cabeceras X-DB-*)
+@app.middleware("http")
+async def request_db_stats_middleware(request: Request, call_next):
+    with track_request_db() as stats:
+        response = await call_next(request)
+    response.headers["X-DB-Connections"] = str(stats.connections)
+    response.headers["X-DB-Queries"] = str(stats.queries)
+    if stats.connections > 1:
+        print(f"[DB] {request.method} {request.url.path} usó {stats.connections} conexiones en una petición")
+    return response
+
 # ═══════════════════════════════════════════════════════════════════
 # RUTAS
 # ═══════════════════════════════════════════════════════════════════
@@ -62,6 +74,15 @@ app.include_router(google_auth_router)
 
 # ✨ INCLUIR EL ROUTER DE VOZ
 app.include_router(voice_router)
+app.include_router(voice_diagnostics_router)  # Perfilado del pipeline (admin_polo)
+
+# Una conexión por petición: con DB_ASYNC_ENABLED ninguna ruta puede mezclar
+# la sesión async de lectura con get_db (p. ej. a través de un guard de auth)
+_read_db_conflicts = read_db_conflicts(app.routes)
+if _read_db_conflicts:
+    raise RuntimeError(
+        "Rutas con sesión async de lectura y get_db a la vez: " + ", ".join(_read_db_conflicts)
+    )
 
 # ═══════════════════════════════════════════════════════════════════
 # ENDPOINTS RAÍZ
@@ -104,6 +125,12 @@ def health_check():
     except:
         voice_provider = "error"
     
+    from app.config import engine
+    from app.database import pool_metrics
+    from app.hashing import password_hasher
+    from app import rate_limit
+    from app.email_outbox import outbox_worker
+
     return {
         "status": "healthy",
         "api_version": "0.2.0",
@@ -112,6 +139,10 @@ def health_check():
             "gemini_ai": " Configured",
             "voice_provider": voice_provider if voice_provider else "⚠️ Not configured",
         },
+        "database_pool": pool_metrics(engine),
+        "password_hashing": password_hasher.snapshot(),
+        "rate_limit": rate_limit.snapshot(),
+        "email_outbox": outbox_worker.snapshot(),
         "timestamp": os.popen('date').read().strip()
     }
 
@@ -144,8 +175,57 @@ async def startup_event():
         else:
             print(f"🎤 Servicios de voz: ⚠️ No configurado")
             print(f"   💡 Configura GOOGLE_APPLICATION_CREDENTIALS")
+
+        from app import audio_processing
+        if audio_processing.preprocessing_enabled() and not audio_processing.ffmpeg_available():
+            print(f"   ⚠️ ffmpeg no encontrado ({audio_processing.FFMPEG_BIN}): el audio WebM/Opus se envía sin preprocesar")
     except Exception as e:
         print(f"🎤 Servicios de voz:  Error - {str(e)}")
+
+    # Tablas e índices auxiliares (no hay migraciones): cada uno por separado,
+    # así una falla no saltea a los demás y el log dice cuál fue. Sin ellos
+    # fallan el alta de usuarios y los flujos de contraseña: no se arranca.
+    from app import email_outbox, rate_limit, reset_tokens, security_epochs, user_counters
+    from app.config import engine
+    import app.services as services
+
+    schema_steps = [
+        ("Contadores de usuarios (tabla)", user_counters.ensure_schema),
+        ("Épocas de seguridad", security_epochs.ensure_schema),
+        ("Índice de historial de contraseñas", services.ensure_password_history_index),
+        ("Tokens de recuperación consumidos", reset_tokens.ensure_schema),
+        ("Límites de tasa", rate_limit.ensure_schema),
+        ("Bandeja de emails (tabla)", email_outbox.ensure_schema),
+    ]
+    schema_errors = []
+    for label, ensure_schema in schema_steps:
+        try:
+            ensure_schema(engine)
+        except Exception as e:
+            schema_errors.append(label)
+            print(f" {label}: Error - {str(e)}")
+    if schema_errors:
+        raise RuntimeError(f"Esquema auxiliar incompleto: {', '.join(schema_errors)}")
+    print(" Tablas e índices auxiliares: OK")
+
+    # Reconciliación de contadores
+    try:
+        db = SessionLocal()
+        try:
+            corrections = user_counters.reconcile(db)
+            db.commit()
+        finally:
+            db.close()
+        print(f" Contadores de usuarios: OK ({len(corrections)} corregidos)")
+    except Exception as e:
+        print(f" Contadores de usuarios: Error - {str(e)}")
+
+    # Worker de la bandeja de emails
+    try:
+        if email_outbox.start_worker():
+            print(" Bandeja de emails: worker activo")
+    except Exception as e:
+        print(f" Bandeja de emails: Error - {str(e)}")
     
     print("="*70)
     print(" API lista en: http://localhost:8000")
@@ -158,6 +238,11 @@ async def shutdown_event():
     """
     Evento que se ejecuta al cerrar la aplicación
     """
+    from app.hashing import password_hasher
+    from app.email_outbox import outbox_worker
+    password_hasher.shutdown()
+    outbox_worker.stop()
+
     print("\n" + "="*70)
     print(" POLO 52 API - CERRANDO")
     print("="*70 + "\n")
@@ -10,7 +10,10 @@ from sqlalchemy import (
     ForeignKey,
     JSON,
     Time,
-    BigInteger
+    BigInteger,
+    DateTime,
+    Float,
+    Index
 )
 from sqlalchemy.dialects.postgresql import UUID
 from sqlalchemy.orm import relationship
@@ -143,6 +146,63 @@ class RolUsuario(Base):
      usuario = relationship("Usuario", back_populates="rol_usuario_links")
 
 
+class ContadorUsuariosActivos(Base):
+    """Usuarios activos por empresa y rol (lo mantiene app/user_counters.py)"""
+    __tablename__ = "contador_usuarios_activos"
+    cuil     = Column(BigInteger, primary_key=True)
+    tipo_rol = Column(String,     primary_key=True)
+    activos  = Column(Integer,    nullable=False, default=0)
+
+
+class EpocaSeguridadUsuario(Base):
+    """Época de seguridad por usuario: los tokens con una época menor quedan revocados"""
+    __tablename__ = "epoca_seguridad_usuario"
+    id_usuario = Column(
+        UUID(as_uuid=True),
+        ForeignKey("usuario.id_usuario", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    epoca      = Column(Integer, nullable=False, default=0)
+
+
+class TokenResetConsumido(Base):
+    """jti de tokens de recuperación ya usados, hasta su expiración (app/reset_tokens.py)"""
+    __tablename__ = "token_reset_consumido"
+    jti       = Column(String,   primary_key=True)
+    expira_en = Column(DateTime, nullable=False, index=True)
+
+
+class EmailPendiente(Base):
+    """Bandeja de salida de emails: la envía el worker de app/email_outbox.py"""
+    __tablename__ = "email_pendiente"
+    id              = Column(Integer,  primary_key=True)
+    destinatario    = Column(String,   nullable=False)
+    asunto          = Column(String,   nullable=False)
+    cuerpo          = Column(Text,     nullable=False)
+    estado          = Column(String,   nullable=False, default="pendiente")
+    intentos        = Column(Integer,  nullable=False, default=0)
+    proximo_intento = Column(DateTime, nullable=False)
+    creado_en       = Column(DateTime, nullable=False)
+    enviado_en      = Column(DateTime)
+    ultimo_error    = Column(Text)
+
+    # Pendientes vencidos en orden de llegada
+    __table_args__ = (
+        Index("ix_email_pendiente_estado_proximo", "estado", "proximo_intento"),
+    )
+
+
+class LimiteTasa(Base):
+    """Conteos de ventana deslizante por clave, backend compartido de app/rate_limit.py"""
+    __tablename__ = "limite_tasa"
+    clave           = Column(String,     primary_key=True)
+    ventana         = Column(BigInteger, nullable=False, default=0)
+    actual          = Column(Integer,    nullable=False, default=0)
+    anterior        = Column(Integer,    nullable=False, default=0)
+    bloqueado_hasta = Column(Float,      nullable=False, default=0)
+    expira          = Column(Float,      nullable=False, default=0, index=True)
+
+
 
 # ─── Vehículos ───────────────────────────────────────────────────────────────
 
@@ -330,4 +390,9 @@ class PasswordHistory(Base):
     password_hash = Column(String, nullable=False)
     created_at = Column(Date, nullable=False, default=date.today)
    
-    usuario = relationship("Usuario", back_populates="password_history")
\ No newline at end of file
+    usuario = relationship("Usuario", back_populates="password_history")
+
+    # Últimas N del usuario (prune y chequeo de reuso) sin recorrer la tabla
+    __table_args__ = (
+        Index("ix_password_history_usuario_recientes", "id_usuario", created_at.desc(), id.desc()),
+    )
\ No newline at end of file
@@ -0,0 +1,161 @@
+#app/principals.py
+"""
+Resolución del usuario autenticado (principal) con cache por sujeto.
+
+Antes cada petición autenticada consultaba `Usuario` en get_current_user,
+después `user.empresa` de forma lazy y otra vez el usuario con sus roles en
+require_admin_polo / require_empresa_role / require_public_role. Ahora:
+
+- `resolve_principal` trae usuario, empresa y roles en una sola consulta
+  (preset loaders.PRINCIPAL) y devuelve un `Principal` inmutable, sin
+  sesión asociada, con los mismos atributos que usan las rutas.
+- El resultado se cachea por sujeto del token durante
+  PRINCIPAL_CACHE_TTL_SECONDS, así la mayoría de las peticiones no tocan la
+  base para autenticarse.
+- Al confirmar cambios de usuarios, enlaces de rol o empresas (inhabilitar,
+  cambiar rol, desactivar empresa) las entradas afectadas se invalidan;
+  el TTL acota el desfase entre instancias o con cambios hechos por SQL.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Callable, Optional
+from uuid import UUID
+
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+from app import loaders, models
+
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+PRINCIPAL_CACHE_MAX_ENTRIES = int(os.getenv("PRINCIPAL_CACHE_MAX_ENTRIES", "2048"))
+
+
+@dataclass(frozen=True)
+class Principal:
+    """Usuario autenticado: lo que necesitan los guards y las rutas."""
+    id_usuario: UUID
+    nombre: str
+    email: str
+    cuil: int
+    estado: bool
+    empresa_estado: bool
+    roles: tuple
+
+    def has_role(self, tipo_rol: str) -> bool:
+        return tipo_rol in self.roles
+
+    @classmethod
+    def from_user(cls, user: models.Usuario) -> "Principal":
+        return cls(
+            id_usuario=user.id_usuario,
+            nombre=user.nombre,
+            email=user.email,
+            cuil=user.cuil,
+            estado=bool(user.estado),
+            empresa_estado=bool(user.empresa and user.empresa.estado),
+            roles=tuple(rol.tipo_rol for rol in user.roles),
+        )
+
+
+class PrincipalCache:
+    """LRU con TTL por sujeto (nombre de usuario del token)."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, subject: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None:
+                return None
+            principal, expires_at = entry
+            if time.monotonic() >= expires_at:
+                del self._entries[subject]
+                return None
+            self._entries.move_to_end(subject)
+            return principal
+
+    def set(self, subject: str, principal: Principal) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._entries[subject] = (principal, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(subject)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate_where(self, predicate: Callable[[Principal], bool]) -> None:
+        with self._lock:
+            for subject in [s for s, (p, _) in self._entries.items() if predicate(p)]:
+                del self._entries[subject]
+
+    def invalidate_subjects(self, subjects) -> None:
+        with self._lock:
+            for subject in subjects:
+                self._entries.pop(subject, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+principal_cache = PrincipalCache(PRINCIPAL_CACHE_TTL_SECONDS, PRINCIPAL_CACHE_MAX_ENTRIES)
+
+
+def resolve_principal(db: Session, subject: str) -> Optional[Principal]:
+    """Principal del sujeto, desde la cache o con una sola consulta."""
+    principal = principal_cache.get(subject)
+    if principal is not None:
+        return principal
+    user = (
+        db.query(models.Usuario)
+        .options(*loaders.PRINCIPAL)
+        .filter(models.Usuario.nombre == subject)
+        .first()
+    )
+    if user is None:
+        return None
+    principal = Principal.from_user(user)
+    principal_cache.set(subject, principal)
+    return principal
+
+# ═══════════════════════════════════════════════════════════════════
+# INVALIDACIÓN AL CONFIRMAR CAMBIOS
+# ═══════════════════════════════════════════════════════════════════
+
+@event.listens_for(Session, "after_flush")
+def _collect_principal_changes(session, flush_context):
+    pending = session.info.setdefault("principal_changes", {"subjects": set(), "users": set(), "cuils": set()})
+    for obj in itertools.chain(session.new, session.dirty, session.deleted):
+        if isinstance(obj, models.Usuario):
+            history = inspect(obj).attrs.nombre.history
+            pending["subjects"].update(itertools.chain(history.added, history.unchanged, history.deleted))
+        elif isinstance(obj, models.RolUsuario):
+            pending["users"].add(obj.id_usuario)
+        elif isinstance(obj, models.Empresa):
+            pending["cuils"].add(obj.cuil)
+    if not any(pending.values()):
+        session.info.pop("principal_changes")
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_principals(session):
+    pending = session.info.pop("principal_changes", None)
+    if not pending:
+        return
+    principal_cache.invalidate_subjects(pending["subjects"])
+    if pending["users"] or pending["cuils"]:
+        principal_cache.invalidate_where(
+            lambda p: p.id_usuario in pending["users"] or p.cuil in pending["cuils"]
+        )
+
+@event.listens_for(Session, "after_rollback")
+def _discard_principal_changes(session):
+    session.info.pop("principal_changes", None)
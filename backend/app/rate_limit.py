@@ -0,0 +1,323 @@
+#app/rate_limit.py
+"""
+Límites de tasa por ventana deslizante para las rutas de autenticación.
+
+Cada límite cuenta eventos por clave (IP, usuario o ambos) con el método
+de "ventana deslizante aproximada": se guardan solo el conteo de la ventana
+actual y el de la anterior, y el total se estima ponderando la anterior por
+la fracción que todavía se superpone. El estado por clave es de tamaño
+fijo, a diferencia de guardar un timestamp por intento.
+
+Dos usos:
+- `acquire(key)`: cuenta la petición y la rechaza si supera el límite
+  (registro, forgot-password, login por IP).
+- `blocked(key)` + `record_failure(key)`: solo cuentan los fallos; al llegar
+  al límite se bloquea la clave `lockout_seconds` (login por usuario,
+  cambio de contraseña).
+
+Las rutas llaman a `enforce`, que responde 429 con `Retry-After` antes de
+cualquier verificación bcrypt.
+
+RATE_LIMIT_BACKEND elige dónde vive el estado:
+- "memory" (por defecto): LRU de hasta RATE_LIMIT_MAX_KEYS claves por
+  proceso. Cada worker cuenta por separado.
+- "database": tabla `limite_tasa` compartida por todos los workers, con
+  actualización bajo SELECT ... FOR UPDATE; las filas vencidas se purgan
+  periódicamente.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from typing import Callable, Optional
+
+from fastapi import HTTPException, Request
+from sqlalchemy import delete, func, select
+
+from app import database, models
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")
+RATE_LIMIT_MAX_KEYS = int(os.getenv("RATE_LIMIT_MAX_KEYS", "10000"))
+RATE_LIMIT_PURGE_INTERVAL_SECONDS = float(os.getenv("RATE_LIMIT_PURGE_INTERVAL_SECONDS", "300"))
+# Proxies de confianza delante de la API que agregan la IP del cliente a
+# X-Forwarded-For (Cloud Run: 1). Con 0 se usa la IP de la conexión.
+RATE_LIMIT_TRUSTED_PROXY_HOPS = int(os.getenv("RATE_LIMIT_TRUSTED_PROXY_HOPS", "0"))
+
+
+def _parse_rule(value: str) -> tuple:
+    """'5/300' → (5 eventos, 300 segundos)."""
+    limit, window = value.split("/", 1)
+    return int(limit), float(window)
+
+
+# Formato "eventos/segundos"
+LOGIN_RATE_LIMIT = _parse_rule(os.getenv("LOGIN_RATE_LIMIT", "5/300"))
+LOGIN_IP_RATE_LIMIT = _parse_rule(os.getenv("LOGIN_IP_RATE_LIMIT", "30/60"))
+FORGOT_PASSWORD_RATE_LIMIT = _parse_rule(os.getenv("FORGOT_PASSWORD_RATE_LIMIT", "5/900"))
+REGISTER_RATE_LIMIT = _parse_rule(os.getenv("REGISTER_RATE_LIMIT", "10/3600"))
+
+Row = models.LimiteTasa
+
+
+@dataclass(frozen=True)
+class WindowState:
+    window: int = 0
+    current: int = 0
+    previous: int = 0
+    locked_until: float = 0.0
+
+# ═══════════════════════════════════════════════════════════════════
+# BACKENDS
+# ═══════════════════════════════════════════════════════════════════
+
+class MemoryBackend:
+    """Estado por clave en un LRU acotado (un proceso)."""
+
+    name = "memory"
+
+    def __init__(self, max_keys: int = RATE_LIMIT_MAX_KEYS):
+        self.max_keys = max(1, max_keys)
+        self._lock = threading.Lock()
+        self._states: OrderedDict = OrderedDict()
+        self.evicted = 0
+
+    def update(self, key: str, fn: Callable, expires_at: Callable, now: float) -> object:
+        with self._lock:
+            state = self._states.pop(key, WindowState())
+            state, result = fn(state)
+            self._states[key] = state
+            while len(self._states) > self.max_keys:
+                self._states.popitem(last=False)
+                self.evicted += 1
+            return result
+
+    def read(self, key: str) -> WindowState:
+        with self._lock:
+            return self._states.get(key, WindowState())
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._states.pop(key, None)
+
+    def clear(self, prefix: str = "") -> None:
+        with self._lock:
+            for key in [key for key in self._states if key.startswith(prefix)]:
+                del self._states[key]
+
+    def size(self) -> int:
+        return len(self._states)
+
+
+class DatabaseBackend:
+    """Estado por clave en `limite_tasa`, compartido entre workers."""
+
+    name = "database"
+
+    def __init__(self, engine, purge_interval: float = RATE_LIMIT_PURGE_INTERVAL_SECONDS):
+        self.engine = engine
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+        self.evicted = 0
+
+    def _maybe_purge(self, conn, now: float) -> None:
+        if now - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = now
+        self.evicted += conn.execute(delete(Row).where(Row.expira < now)).rowcount or 0
+
+    def update(self, key: str, fn: Callable, expires_at: Callable, now: float) -> object:
+        with self.engine.begin() as conn:
+            self._maybe_purge(conn, now)
+            database.insert_ignore(conn, Row.__table__, [
+                {"clave": key, "ventana": 0, "actual": 0, "anterior": 0, "bloqueado_hasta": 0.0, "expira": 0.0}
+            ])
+            row = conn.execute(select(Row).where(Row.clave == key).with_for_update()).one()
+            state, result = fn(WindowState(row.ventana, row.actual, row.anterior, row.bloqueado_hasta))
+            conn.execute(
+                Row.__table__.update().where(Row.clave == key).values(
+                    ventana=state.window, actual=state.current, anterior=state.previous,
+                    bloqueado_hasta=state.locked_until, expira=expires_at(state),
+                )
+            )
+            return result
+
+    def read(self, key: str) -> WindowState:
+        """Lectura simple, sin transacción de escritura ni FOR UPDATE."""
+        with self.engine.connect() as conn:
+            row = conn.execute(select(Row).where(Row.clave == key)).first()
+        if row is None:
+            return WindowState()
+        return WindowState(row.ventana, row.actual, row.anterior, row.bloqueado_hasta)
+
+    def delete(self, key: str) -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(Row).where(Row.clave == key))
+
+    def clear(self, prefix: str = "") -> None:
+        with self.engine.begin() as conn:
+            conn.execute(delete(Row).where(Row.clave.startswith(prefix)))
+
+    def size(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(select(func.count()).select_from(Row)).scalar_one()
+
+
+def build_backend(name: str = RATE_LIMIT_BACKEND):
+    if name == "database":
+        from app.config import engine
+
+        return DatabaseBackend(engine)
+    if name != "memory":
+        print(f"[RATE] RATE_LIMIT_BACKEND desconocido ({name}); usando memoria")
+    return MemoryBackend()
+
+
+backend = build_backend()
+
+
+def ensure_schema(engine) -> None:
+    """Crear la tabla del backend compartido si está activo (no hay migraciones)."""
+    if isinstance(backend, DatabaseBackend):
+        Row.__table__.create(bind=engine, checkfirst=True)
+
+# ═══════════════════════════════════════════════════════════════════
+# LÍMITE POR VENTANA DESLIZANTE
+# ═══════════════════════════════════════════════════════════════════
+
+class SlidingWindowLimiter:
+    """`limit` eventos por `window_seconds` y clave, con bloqueo opcional."""
+
+    def __init__(self, name: str, limit: int, window_seconds: float,
+                 lockout_seconds: Optional[float] = None, store=None, clock=time.time):
+        self.name = name
+        self.limit = max(1, limit)
+        self.window_seconds = window_seconds
+        self.lockout_seconds = lockout_seconds
+        self._store = store
+        self._clock = clock
+
+    @property
+    def store(self):
+        return self._store or backend
+
+    def _key(self, key) -> str:
+        return f"{self.name}:{key}"
+
+    def _roll(self, state: WindowState, now: float) -> WindowState:
+        window = int(now // self.window_seconds)
+        if window == state.window:
+            return state
+        previous = state.current if window == state.window + 1 else 0
+        return replace(state, window=window, current=0, previous=previous)
+
+    def _estimate(self, state: WindowState, now: float) -> float:
+        overlap = 1 - (now % self.window_seconds) / self.window_seconds
+        return state.previous * overlap + state.current
+
+    def _retry_after(self, state: WindowState, now: float) -> float:
+        """Segundos hasta que entre un evento más."""
+        if state.locked_until > now:
+            return state.locked_until - now
+        if self.lockout_seconds or self._estimate(state, now) + 1 <= self.limit:
+            return 0.0
+        offset = now % self.window_seconds
+        if state.current + 1 > self.limit:
+            # La ventana actual ya está llena: esperar a la próxima
+            return self.window_seconds - offset
+        # Esperar a que el peso de la ventana anterior baje lo suficiente
+        needed = 1 - (self.limit - state.current - 1) / state.previous
+        return max(0.0, needed * self.window_seconds - offset)
+
+    def _expires_at(self, state: WindowState) -> float:
+        return max(state.locked_until, (state.window + 2) * self.window_seconds)
+
+    def _update(self, key, fn):
+        now = self._clock()
+        return self.store.update(self._key(key), lambda state: fn(state, now), self._expires_at, now)
+
+    def acquire(self, key) -> float:
+        """Contar un evento; 0 si entra, o los segundos a esperar (no se cuenta)."""
+        def apply(state, now):
+            state = self._roll(state, now)
+            retry_after = self._retry_after(state, now)
+            if retry_after:
+                return state, retry_after
+            return replace(state, current=state.current + 1), 0.0
+        return self._update(key, apply)
+
+    def blocked(self, key) -> float:
+        """Segundos de bloqueo restantes sin contar nada (0 = habilitado)."""
+        now = self._clock()
+        state = self._roll(self.store.read(self._key(key)), now)
+        return self._retry_after(state, now)
+
+    def record_failure(self, key) -> float:
+        """Contar un fallo; al llegar al límite bloquea y devuelve la espera (requiere lockout_seconds)."""
+        def apply(state, now):
+            state = self._roll(state, now)
+            state = replace(state, current=state.current + 1)
+            if self._estimate(state, now) < self.limit:
+                return state, 0.0
+            locked = WindowState(window=state.window, locked_until=now + self.lockout_seconds)
+            return locked, float(self.lockout_seconds)
+        return self._update(key, apply)
+
+    def reset(self, key) -> None:
+        self.store.delete(self._key(key))
+
+    def clear(self) -> None:
+        self.store.clear(f"{self.name}:")
+
+
+def client_ip(request: Request, trusted_hops: Optional[int] = None) -> str:
+    """
+    IP del cliente para las claves de los límites.
+
+    Detrás de un proxy (Cloud Run) la conexión llega siempre desde el proxy
+    y todos los clientes compartirían el mismo límite. Con
+    RATE_LIMIT_TRUSTED_PROXY_HOPS = N se toma la N-ésima IP desde el final
+    de X-Forwarded-For: las anteriores las puede inventar el cliente.
+    """
+    trusted_hops = RATE_LIMIT_TRUSTED_PROXY_HOPS if trusted_hops is None else trusted_hops
+    if request is None:
+        return "desconocida"
+    if trusted_hops > 0:
+        forwarded = [ip.strip() for ip in request.headers.get("x-forwarded-for", "").split(",") if ip.strip()]
+        if len(forwarded) >= trusted_hops:
+            return forwarded[-trusted_hops]
+    return request.client.host if request.client else "desconocida"
+
+
+def enforce(retry_after: float) -> None:
+    """429 con Retry-After si el límite está agotado."""
+    if retry_after > 0:
+        seconds = max(1, math.ceil(retry_after))
+        raise HTTPException(
+            status_code=429,
+            detail=f"Demasiados intentos. Esperá {seconds} segundos para reintentar.",
+            headers={"Retry-After": str(seconds)},
+        )
+
+
+# Fallos por IP + usuario: al agotarlos se bloquea durante la ventana
+login_failures = SlidingWindowLimiter("login", *LOGIN_RATE_LIMIT, lockout_seconds=LOGIN_RATE_LIMIT[1])
+login_requests = SlidingWindowLimiter("login_ip", *LOGIN_IP_RATE_LIMIT)
+forgot_password_requests = SlidingWindowLimiter("forgot_password", *FORGOT_PASSWORD_RATE_LIMIT)
+register_requests = SlidingWindowLimiter("register", *REGISTER_RATE_LIMIT)
+
+LIMITERS = (login_failures, login_requests, forgot_password_requests, register_requests)
+
+
+def snapshot() -> dict:
+    return {
+        "backend": backend.name,
+        "keys": backend.size(),
+        "evicted": backend.evicted,
+        "limits": {
+            limiter.name: {"limit": limiter.limit, "window_seconds": limiter.window_seconds}
+            for limiter in LIMITERS
+        },
+    }
@@ -0,0 +1,145 @@
+#app/reference_data.py
+"""
+Catálogo en memoria de datos de referencia: roles y tablas Tipo*.
+
+Son tablas chicas que casi nunca cambian, pero se consultaban en cada
+llamada a /tipos/* y en cada validación de límites o alta de usuario. El
+catálogo carga todas juntas la primera vez que se piden y las comparte entre
+rutas y validadores:
+
+- Se recarga cuando vence REFERENCE_DATA_TTL_SECONDS (acota el desfase
+  entre instancias) o cuando una sesión de esta instancia confirma cambios
+  en alguna de esas tablas (listeners de sesión, igual que la cache de
+  /usuarios/limits-status).
+- Cada catálogo guarda sus filas como schemas (desacopladas de la sesión),
+  un índice por id y un ETag fuerte calculado sobre el contenido, que usan
+  los endpoints de /tipos para responder 304 a los clientes que revalidan.
+"""
+
+import hashlib
+import itertools
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from app import models, schemas
+
+REFERENCE_DATA_TTL_SECONDS = float(os.getenv("REFERENCE_DATA_TTL_SECONDS", "300"))
+TIPOS_CACHE_MAX_AGE_SECONDS = int(os.getenv("TIPOS_CACHE_MAX_AGE_SECONDS", "300"))
+
+# nombre → (modelo, schema de salida, columna id)
+CATALOGS = {
+    "vehiculo": (models.TipoVehiculo, schemas.TipoVehiculoOut, "id_tipo_vehiculo"),
+    "servicio": (models.TipoServicio, schemas.TipoServicioOut, "id_tipo_servicio"),
+    "contacto": (models.TipoContacto, schemas.TipoContactoOut, "id_tipo_contacto"),
+    "servicio_polo": (models.TipoServicioPolo, schemas.TipoServicioPoloOut, "id_tipo_servicio_polo"),
+    "rol": (models.Rol, schemas.RolOut, "id_rol"),
+}
+
+_CATALOG_MODELS = tuple(model for model, _, _ in CATALOGS.values())
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    items: tuple
+    by_id: dict
+    etag: str
+
+
+def _build_entry(db: Session, model, schema, id_column: str) -> CatalogEntry:
+    rows = db.query(model).order_by(getattr(model, id_column)).all()
+    items = tuple(schema.model_validate(row) for row in rows)
+    payload = json.dumps([item.model_dump() for item in items], sort_keys=True, default=str)
+    return CatalogEntry(
+        items=items,
+        by_id={getattr(item, id_column): item for item in items},
+        etag='"' + hashlib.sha256(payload.encode()).hexdigest()[:32] + '"',
+    )
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Comparación débil de If-None-Match (RFC 9110), admite lista y '*'."""
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(",")]
+    return "*" in candidates or any(value.removeprefix("W/") == etag for value in candidates)
+
+
+class ReferenceCatalog:
+    """Snapshot de todos los catálogos, compartido por el proceso."""
+
+    def __init__(self, ttl_seconds: float):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        # (catálogos, momento de carga): se reemplaza entero, sin estados a medias
+        self._snapshot: Optional[tuple] = None
+        self._generation = 0
+
+    def _fresh_entries(self) -> Optional[dict]:
+        snapshot = self._snapshot
+        if snapshot is None or self.ttl_seconds <= 0:
+            return None
+        entries, loaded_at = snapshot
+        return entries if time.monotonic() - loaded_at < self.ttl_seconds else None
+
+    def cached(self, name: str) -> Optional[CatalogEntry]:
+        """Catálogo en memoria si sigue vigente, sin tocar la base."""
+        entries = self._fresh_entries()
+        return entries[name] if entries is not None else None
+
+    def load(self, db: Session) -> dict:
+        """Cargar (o devolver, si sigue vigente) el snapshot completo."""
+        entries = self._fresh_entries()
+        if entries is not None:
+            return entries
+        # La consulta va fuera del lock: con el engine async corre en el
+        # event loop y bloquearlo ahí trabaría a las demás peticiones
+        generation = self._generation
+        entries = {name: _build_entry(db, *spec) for name, spec in CATALOGS.items()}
+        with self._lock:
+            # Si se invalidó mientras cargábamos, servir sin guardar
+            if generation == self._generation:
+                self._snapshot = (entries, time.monotonic())
+        return entries
+
+    def get(self, db: Session, name: str) -> CatalogEntry:
+        return self.cached(name) or self.load(db)[name]
+
+    def get_by_id(self, db: Session, name: str, item_id):
+        return self.get(db, name).by_id.get(item_id)
+
+    def rol(self, db: Session, id_rol: int) -> Optional[schemas.RolOut]:
+        return self.get_by_id(db, "rol", id_rol)
+
+    def rol_by_tipo(self, db: Session, tipo_rol: str) -> Optional[schemas.RolOut]:
+        return next((rol for rol in self.get(db, "rol").items if rol.tipo_rol == tipo_rol), None)
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._snapshot = None
+
+
+reference_catalog = ReferenceCatalog(REFERENCE_DATA_TTL_SECONDS)
+
+# Invalidar al confirmar cambios en roles o tipos hechos en esta instancia
+@event.listens_for(Session, "after_flush")
+def _mark_reference_data_changes(session, flush_context):
+    changed = itertools.chain(session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, _CATALOG_MODELS) for obj in changed):
+        session.info["reference_data_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_reference_data(session):
+    if session.info.pop("reference_data_changed", False):
+        reference_catalog.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_reference_data_changes(session):
+    session.info.pop("reference_data_changed", None)
@@ -0,0 +1,234 @@
+#app/reset_tokens.py
+"""
+Registro de tokens de recuperación de contraseña ya consumidos.
+
+Antes era un `set` en memoria que se vaciaba entero al pasar los 1000
+elementos (los tokens usados volvían a servir) y que cada worker de uvicorn
+tenía por separado. Ahora cada `jti` se guarda hasta el `exp` del propio
+token: después ya no hace falta recordarlo porque el JWT vence solo.
+
+- `consume(jti, exp)` es atómico: devuelve False si el token ya se había
+  usado, así dos peticiones con el mismo enlace no pasan las dos.
+- Backend "memory": diccionario + rueda de tiempo (buckets de
+  RESET_TOKEN_WHEEL_SLOT_SECONDS). Cada operación desaloja los buckets ya
+  vencidos sin recorrer los demás. Sirve con un solo worker.
+- Backend "database": tabla `token_reset_consumido` compartida por todos
+  los workers; la clave primaria garantiza un solo consumo y las filas
+  vencidas se borran cada RESET_TOKEN_PURGE_INTERVAL_SECONDS.
+
+RESET_TOKEN_STORE elige el backend ("memory" por defecto). Las dos
+variantes exponen `in`, `len()` y `clear()` como el set anterior, más
+`stats()` para /password-reset/cache-status.
+"""
+
+import heapq
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import delete, func, select
+from sqlalchemy.exc import IntegrityError
+
+from app import models
+
+RESET_TOKEN_STORE = os.getenv("RESET_TOKEN_STORE", "memory")
+RESET_TOKEN_WHEEL_SLOT_SECONDS = float(os.getenv("RESET_TOKEN_WHEEL_SLOT_SECONDS", "60"))
+RESET_TOKEN_PURGE_INTERVAL_SECONDS = float(os.getenv("RESET_TOKEN_PURGE_INTERVAL_SECONDS", "300"))
+
+# Sin `exp` (no debería pasar: el JWT lo exige) se recuerda una hora
+DEFAULT_TTL_SECONDS = 3600
+
+Consumed = models.TokenResetConsumido
+
+
+def _expiry(exp: Optional[float]) -> float:
+    return float(exp) if exp else time.time() + DEFAULT_TTL_SECONDS
+
+# ═══════════════════════════════════════════════════════════════════
+# BACKEND EN MEMORIA (UN WORKER)
+# ═══════════════════════════════════════════════════════════════════
+
+class MemoryTokenStore:
+    """jti → exp con desalojo por rueda de tiempo."""
+
+    backend = "memory"
+
+    def __init__(self, slot_seconds: float = RESET_TOKEN_WHEEL_SLOT_SECONDS, clock=time.time):
+        self.slot_seconds = max(1.0, slot_seconds)
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._expires: dict = {}
+        self._buckets: dict = {}
+        self._slots: list = []
+        self._consumed = 0
+        self._reuse_rejected = 0
+        self._evicted = 0
+
+    def _slot(self, timestamp: float) -> int:
+        return int(timestamp // self.slot_seconds)
+
+    def _evict(self, now: float) -> None:
+        # Un bucket se desaloja cuando todo su intervalo quedó en el pasado
+        current = self._slot(now)
+        while self._slots and self._slots[0] < current:
+            slot = heapq.heappop(self._slots)
+            for jti in self._buckets.pop(slot, ()):
+                if self._expires.get(jti, now) < now:
+                    del self._expires[jti]
+                    self._evicted += 1
+
+    def consume(self, jti: str, exp: Optional[float] = None) -> bool:
+        expires_at = _expiry(exp)
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            if jti in self._expires:
+                self._reuse_rejected += 1
+                return False
+            self._expires[jti] = expires_at
+            slot = self._slot(expires_at)
+            if slot not in self._buckets:
+                self._buckets[slot] = set()
+                heapq.heappush(self._slots, slot)
+            self._buckets[slot].add(jti)
+            self._consumed += 1
+            return True
+
+    def add(self, jti: str, exp: Optional[float] = None) -> None:
+        self.consume(jti, exp)
+
+    def __contains__(self, jti: str) -> bool:
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            expires_at = self._expires.get(jti)
+            return expires_at is not None and expires_at >= now
+
+    def __len__(self) -> int:
+        with self._lock:
+            self._evict(self._clock())
+            return len(self._expires)
+
+    def clear(self) -> int:
+        with self._lock:
+            removed = len(self._expires)
+            self._expires.clear()
+            self._buckets.clear()
+            self._slots.clear()
+            return removed
+
+    def stats(self) -> dict:
+        size = len(self)
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "size": size,
+                "buckets": len(self._buckets),
+                "slot_seconds": self.slot_seconds,
+                "consumed": self._consumed,
+                "reuse_rejected": self._reuse_rejected,
+                "evicted": self._evicted,
+            }
+
+# ═══════════════════════════════════════════════════════════════════
+# BACKEND COMPARTIDO (TABLA, VARIOS WORKERS)
+# ═══════════════════════════════════════════════════════════════════
+
+class DatabaseTokenStore:
+    """jti en `token_reset_consumido`, compartido entre workers e instancias."""
+
+    backend = "database"
+
+    def __init__(self, engine, purge_interval: float = RESET_TOKEN_PURGE_INTERVAL_SECONDS, clock=time.time):
+        self.engine = engine
+        self.purge_interval = purge_interval
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_purge = 0.0
+        self._consumed = 0
+        self._reuse_rejected = 0
+        self._evicted = 0
+
+    def _now(self) -> datetime:
+        return datetime.utcfromtimestamp(self._clock())
+
+    def purge(self) -> int:
+        """Borrar las filas vencidas; devuelve cuántas se borraron."""
+        with self.engine.begin() as conn:
+            removed = conn.execute(delete(Consumed).where(Consumed.expira_en < self._now())).rowcount or 0
+        with self._lock:
+            self._evicted += removed
+            self._last_purge = self._clock()
+        return removed
+
+    def _maybe_purge(self) -> None:
+        if self._clock() - self._last_purge >= self.purge_interval:
+            self.purge()
+
+    def consume(self, jti: str, exp: Optional[float] = None) -> bool:
+        self._maybe_purge()
+        expires_at = datetime.utcfromtimestamp(_expiry(exp))
+        try:
+            # La clave primaria decide: si otro worker ya lo insertó, falla
+            with self.engine.begin() as conn:
+                conn.execute(Consumed.__table__.insert().values(jti=jti, expira_en=expires_at))
+        except IntegrityError:
+            with self._lock:
+                self._reuse_rejected += 1
+            return False
+        with self._lock:
+            self._consumed += 1
+        return True
+
+    def add(self, jti: str, exp: Optional[float] = None) -> None:
+        self.consume(jti, exp)
+
+    def __contains__(self, jti: str) -> bool:
+        with self.engine.connect() as conn:
+            found = conn.execute(
+                select(Consumed.jti).where(Consumed.jti == jti, Consumed.expira_en >= self._now())
+            ).first()
+        return found is not None
+
+    def __len__(self) -> int:
+        with self.engine.connect() as conn:
+            return conn.execute(
+                select(func.count()).select_from(Consumed).where(Consumed.expira_en >= self._now())
+            ).scalar_one()
+
+    def clear(self) -> int:
+        with self.engine.begin() as conn:
+            return conn.execute(delete(Consumed)).rowcount or 0
+
+    def stats(self) -> dict:
+        size = len(self)
+        with self._lock:
+            return {
+                "backend": self.backend,
+                "size": size,
+                "purge_interval_seconds": self.purge_interval,
+                "consumed": self._consumed,
+                "reuse_rejected": self._reuse_rejected,
+                "evicted": self._evicted,
+            }
+
+
+def build_store(backend: str = RESET_TOKEN_STORE):
+    if backend == "database":
+        from app.config import engine
+
+        return DatabaseTokenStore(engine)
+    if backend != "memory":
+        print(f"[RESET] RESET_TOKEN_STORE desconocido ({backend}); usando memoria")
+    return MemoryTokenStore()
+
+
+consumed_tokens = build_store()
+
+
+def ensure_schema(engine) -> None:
+    """Crear la tabla del backend compartido si está activo (no hay migraciones)."""
+    if isinstance(consumed_tokens, DatabaseTokenStore):
+        Consumed.__table__.create(bind=engine, checkfirst=True)
@@ -1,18 +1,28 @@
 #app/routes/admin_users.py
 from fastapi import APIRouter, HTTPException, Depends, status
+from sqlalchemy import and_, event, func, or_
 from sqlalchemy.orm import Session
 from datetime import date
 from uuid import UUID
 from typing import List
-from app.config import SessionLocal
-from app import models, schemas, services
-from app.models import Empresa, ServicioPolo, TipoServicioPolo, Rol
+from app.config import get_db
+from app.database import run_read
+from app import email_outbox, loaders, models, schemas, services, user_counters
+from app.reference_data import reference_catalog
+from app.models import Empresa, ServicioPolo, TipoServicioPolo
 from app.schemas import (
     EmpresaOut, EmpresaCreate, RolOut, EmpresaDetailOutPublic, 
     ContactoOutPublic, LoteOutPublic
 )
 from app.routes.auth import require_admin_polo, get_current_user
+import base64
+import copy
+import itertools
+import json
+import os
 import re
+import threading
+import time
 NAME_RE = re.compile(r"^[A-Za-zÁÉÍÓÚáéíóúÑñÜü\s]+$")
 
 router = APIRouter(
@@ -20,6 +30,8 @@ router = APIRouter(
     tags=["Admin_polo"],
     dependencies=[Depends(require_admin_polo)],
 )
+# Todas las rutas pasan por el guard (get_db): las lecturas usan esa misma
+# sesión sync con `run_read`, nunca la async (serían dos conexiones)
 
 # ═══════════════════════════════════════════════════════════════════
 # CONFIGURACIÓN Y CONSTANTES
@@ -32,18 +44,60 @@ POLO_CUIL = 44123456789  # Reemplaza con el CUIL real del polo en tu BD
 MAX_ADMIN_EMPRESA_PER_COMPANY = 3
 MAX_ADMIN_POLO_TOTAL = 3
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Cache de /usuarios/limits-status: se invalida al confirmar cambios de
+# usuarios, roles o empresas; el TTL acota lo desactualizado entre instancias
+LIMITS_STATUS_CACHE_TTL_SECONDS = float(os.getenv("LIMITS_STATUS_CACHE_TTL_SECONDS", "30"))
+
+class LimitsStatusCache:
+    """Último resultado de limits-status con vencimiento (thread-safe)."""
+
+    def __init__(self, ttl_seconds: float = LIMITS_STATUS_CACHE_TTL_SECONDS):
+        self.ttl_seconds = ttl_seconds
+        self._lock = threading.Lock()
+        self._value = None
+        self._expires_at = 0.0
+
+    def get(self):
+        with self._lock:
+            if self._value is None or time.monotonic() >= self._expires_at:
+                return None
+            return copy.deepcopy(self._value)
+
+    def set(self, value) -> None:
+        if self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._value = copy.deepcopy(value)
+            self._expires_at = time.monotonic() + self.ttl_seconds
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._value = None
+
+limits_status_cache = LimitsStatusCache()
+
+_LIMITS_STATUS_MODELS = (models.Usuario, models.RolUsuario, models.Empresa)
+
+@event.listens_for(Session, "after_flush")
+def _mark_limits_status_changes(session, flush_context):
+    changed = itertools.chain(session.new, session.dirty, session.deleted)
+    if any(isinstance(obj, _LIMITS_STATUS_MODELS) for obj in changed):
+        session.info["limits_status_changed"] = True
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_limits_status(session):
+    if session.info.pop("limits_status_changed", False):
+        limits_status_cache.invalidate()
+
+@event.listens_for(Session, "after_rollback")
+def _discard_limits_status_changes(session):
+    session.info.pop("limits_status_changed", None)
 
 def validate_user_creation_limits(db: Session, dto: schemas.UserCreate):
     """Validar límites de creación de usuarios según el rol y empresa"""
     
     # Obtener información del rol
-    rol = db.query(models.Rol).filter(models.Rol.id_rol == dto.id_rol).first()
+    rol = reference_catalog.rol(db, dto.id_rol)
     if not rol:
         raise HTTPException(status_code=400, detail="Rol inválido")
     
@@ -56,14 +110,9 @@ def validate_user_creation_limits(db: Session, dto: schemas.UserCreate):
                 detail="El rol admin_polo solo puede asignarse a usuarios de la empresa Polo"
             )
         
-        # Contar admin_polo existentes
-        admin_polo_count = (
-            db.query(models.Usuario)
-            .join(models.RolUsuario)
-            .join(models.Rol)
-            .filter(models.Rol.tipo_rol == "admin_polo")
-            .filter(models.Usuario.estado == True)
-            .count()
+        # Contar admin_polo activos (bloquea el contador hasta el commit)
+        admin_polo_count = user_counters.locked_active_count(
+            db, POLO_CUIL, "admin_polo", all_companies=True
         )
         
         if admin_polo_count >= MAX_ADMIN_POLO_TOTAL:
@@ -84,16 +133,8 @@ def validate_user_creation_limits(db: Session, dto: schemas.UserCreate):
                        "Solo puede tener usuarios admin_polo y publicos."
             )
         
-        # Contar admin_empresa existentes para esta empresa específica
-        admin_empresa_count = (
-            db.query(models.Usuario)
-            .join(models.RolUsuario)
-            .join(models.Rol)
-            .filter(models.Rol.tipo_rol == "admin_empresa")
-            .filter(models.Usuario.cuil == dto.cuil)
-            .filter(models.Usuario.estado == True)
-            .count()
-        )
+        # Contar admin_empresa activos de esta empresa (bloquea el contador hasta el commit)
+        admin_empresa_count = user_counters.locked_active_count(db, dto.cuil, "admin_empresa")
         
         if admin_empresa_count >= MAX_ADMIN_EMPRESA_PER_COMPANY:
             empresa = db.query(models.Empresa).filter(models.Empresa.cuil == dto.cuil).first()
@@ -125,19 +166,14 @@ def validate_user_activation_limits(db: Session, user: models.Usuario):
         raise HTTPException(status_code=400, detail="Usuario sin rol asignado")
     
     rol_id = user.rol_usuario_links[0].id_rol
-    rol = db.query(models.Rol).filter(models.Rol.id_rol == rol_id).first()
+    rol = reference_catalog.rol(db, rol_id)
     if not rol:
         raise HTTPException(status_code=400, detail="Rol del usuario inválido")
     
     # Validación para admin_polo
     if rol.tipo_rol == "admin_polo":
-        admin_polo_count = (
-            db.query(models.Usuario)
-            .join(models.RolUsuario)
-            .join(models.Rol)
-            .filter(models.Rol.tipo_rol == "admin_polo")
-            .filter(models.Usuario.estado == True)
-            .count()
+        admin_polo_count = user_counters.locked_active_count(
+            db, POLO_CUIL, "admin_polo", all_companies=True
         )
         
         if admin_polo_count >= MAX_ADMIN_POLO_TOTAL:
@@ -150,15 +186,7 @@ def validate_user_activation_limits(db: Session, user: models.Usuario):
     
     # Validación para admin_empresa
     elif rol.tipo_rol == "admin_empresa":
-        admin_empresa_count = (
-            db.query(models.Usuario)
-            .join(models.RolUsuario)
-            .join(models.Rol)
-            .filter(models.Rol.tipo_rol == "admin_empresa")
-            .filter(models.Usuario.cuil == user.cuil)
-            .filter(models.Usuario.estado == True)
-            .count()
-        )
+        admin_empresa_count = user_counters.locked_active_count(db, user.cuil, "admin_empresa")
         
         if admin_empresa_count >= MAX_ADMIN_EMPRESA_PER_COMPANY:
             empresa = db.query(models.Empresa).filter(models.Empresa.cuil == user.cuil).first()
@@ -226,7 +254,7 @@ def build_empresa_detail_public(emp: models.Empresa) -> schemas.EmpresaDetailOut
     response_model=schemas.PoloDetailOut, 
     summary="Obtener información completa del polo"
 )
-def get_polo_details(db: Session = Depends(get_db)):
+async def get_polo_details(db: Session = Depends(get_db)):
     """
     Devuelve la información completa del polo incluyendo:
     - Datos básicos del polo (empresa con CUIL específico)
@@ -235,6 +263,9 @@ def get_polo_details(db: Session = Depends(get_db)):
     - Lista de todos los usuarios
     - Lista de todos los lotes
     """
+    return await run_read(db, _polo_details)
+
+def _polo_details(db: Session) -> schemas.PoloDetailOut:
     # Obtener los datos del polo (empresa específica)
     polo_empresa = db.query(models.Empresa).filter(models.Empresa.cuil == POLO_CUIL).first()
     
@@ -245,10 +276,10 @@ def get_polo_details(db: Session = Depends(get_db)):
     empresas = db.query(models.Empresa).filter(models.Empresa.cuil != POLO_CUIL).all()
     
     # Obtener todos los servicios del polo
-    servicios_polo = db.query(models.ServicioPolo).all()
+    servicios_polo = db.query(models.ServicioPolo).options(*loaders.SERVICIO_POLO_DETAIL).all()
     
     # Obtener todos los usuarios
-    usuarios = db.query(models.Usuario).all()
+    usuarios = db.query(models.Usuario).options(*loaders.USUARIO_ROLES).all()
     
     # Obtener todos los lotes
     lotes = db.query(models.Lote).all()
@@ -304,13 +335,8 @@ def polo_change_password_request(
     token = services.create_password_reset_token(current_user.email)
     reset_link = f"http://localhost:4200/password-reset?token={token}"
     
-    # Enviar email (reutilizar lógica de auth.py)
-    try:
-        from email.mime.text import MIMEText
-        import smtplib
-        from app.config import settings
-        
-        email_body = f"""
+    # Encolar email (lo envía el worker de app/email_outbox.py)
+    email_body = f"""
 Hola {current_user.nombre},
 
 Has solicitado cambiar tu contraseña como administrador del polo.
@@ -328,20 +354,10 @@ Si no solicitaste este cambio, ignora este email.
 
 Saludos,
 Sistema Polo 52
-        """
-        
-        msg = MIMEText(email_body)
-        msg["Subject"] = "Cambio de Contraseña Admin Polo - Polo 52"
-        msg["From"] = settings.EMAIL_USER
-        msg["To"] = current_user.email
-        
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(settings.EMAIL_USER, settings.EMAIL_PASS)
-            server.send_message(msg)
-            
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error enviando email: {str(e)}")
+    """
+    
+    email_outbox.enqueue(db, current_user.email, "Cambio de Contraseña Admin Polo - Polo 52", email_body)
+    db.commit()
     
     return {
         "message": "Se ha enviado un enlace de cambio de contraseña a tu email",
@@ -375,7 +391,73 @@ def list_lotes(db: Session = Depends(get_db)):
 @router.get("/roles", response_model=List[RolOut], summary="Listar roles disponibles")
 def list_roles(db: Session = Depends(get_db)):
     """Devuelve todos los roles que existen en la tabla rol"""
-    return db.query(Rol).all()
+    return list(reference_catalog.get(db, "rol").items)
+
+# ═══════════════════════════════════════════════════════════════════
+# ENDPOINTS DE LÍMITES Y CONSULTAS
+# ═══════════════════════════════════════════════════════════════════
+
+# Declarada antes de /usuarios/{user_id} para que la ruta literal no quede capturada
+@router.get("/usuarios/limits-status", summary="Consultar límites de usuarios por empresa")
+def get_users_limits_status(db: Session = Depends(get_db)):
+    """Obtener información sobre límites de usuarios y estado actual"""
+    cached = limits_status_cache.get()
+    if cached is not None:
+        return cached
+
+    # Usuarios activos por (rol, cuil) en una sola consulta agrupada
+    counts = {
+        (tipo_rol, cuil): total
+        for tipo_rol, cuil, total in (
+            db.query(models.Rol.tipo_rol, models.Usuario.cuil, func.count(models.Usuario.id_usuario))
+            .join(models.RolUsuario, models.RolUsuario.id_usuario == models.Usuario.id_usuario)
+            .join(models.Rol, models.Rol.id_rol == models.RolUsuario.id_rol)
+            .filter(models.Usuario.estado == True)
+            .filter(models.Rol.tipo_rol.in_(("admin_polo", "admin_empresa", "publico")))
+            .group_by(models.Rol.tipo_rol, models.Usuario.cuil)
+            .all()
+        )
+    }
+
+    # Información del Polo
+    polo_admin_count = sum(total for (tipo_rol, _), total in counts.items() if tipo_rol == "admin_polo")
+    polo_public_count = counts.get(("publico", POLO_CUIL), 0)
+    
+    # Información por empresa (admin_empresa)
+    empresas_info = []
+    empresas = (
+        db.query(models.Empresa.cuil, models.Empresa.nombre)
+        .filter(models.Empresa.cuil != POLO_CUIL)
+        .all()
+    )
+    
+    for cuil, nombre in empresas:
+        admin_count = counts.get(("admin_empresa", cuil), 0)
+        empresas_info.append({
+            "cuil": cuil,
+            "nombre": nombre,
+            "admin_empresa_actuales": admin_count,
+            "limite_admin_empresa": MAX_ADMIN_EMPRESA_PER_COMPANY,
+            "puede_crear_mas": admin_count < MAX_ADMIN_EMPRESA_PER_COMPANY
+        })
+    
+    status_info = {
+        "polo_info": {
+            "admin_polo_actuales": polo_admin_count,
+            "usuarios_publicos_actuales": polo_public_count,
+            "limite_admin_polo": MAX_ADMIN_POLO_TOTAL,
+            "puede_crear_admin_polo": polo_admin_count < MAX_ADMIN_POLO_TOTAL,
+            "puede_crear_publico": True  # Sin límite para públicos
+        },
+        "empresas_info": empresas_info,
+        "limites_configurados": {
+            "max_admin_empresa_per_company": MAX_ADMIN_EMPRESA_PER_COMPANY,
+            "max_admin_polo_total": MAX_ADMIN_POLO_TOTAL,
+            "polo_cuil": POLO_CUIL
+        }
+    }
+    limits_status_cache.set(status_info)
+    return status_info
 
 # ═══════════════════════════════════════════════════════════════════
 # GESTIÓN DE USUARIOS
@@ -412,7 +494,7 @@ def create_user(dto: schemas.UserCreate, db: Session = Depends(get_db)):
         )
     
     # Verificar que el rol existe
-    rol = db.query(models.Rol).filter(models.Rol.id_rol == dto.id_rol).first()
+    rol = reference_catalog.rol(db, dto.id_rol)
     if not rol:
         raise HTTPException(status_code=400, detail="Rol inválido")
     
@@ -439,19 +521,17 @@ def create_user(dto: schemas.UserCreate, db: Session = Depends(get_db)):
     )
     db.add(enlace)
     
-    db.commit()
-    db.refresh(new_user)
-    
-    # Enviar email con credenciales
-    email_sent = services.send_welcome_email(
+    # Email con credenciales: se encola en la misma transacción que el alta
+    services.send_welcome_email(
+        db,
         email=dto.email,
         nombre=dto.nombre,
         username=dto.nombre,
         password=generated_password
     )
     
-    if not email_sent:
-        print(f"Usuario creado pero email no enviado para: {dto.email}")
+    db.commit()
+    db.refresh(new_user)
     
     return new_user
 
@@ -497,74 +577,6 @@ def delete_user(user_id: UUID, db: Session = Depends(get_db)):
     db.commit()
     return {"msg": "Usuario inhabilitado exitosamente"}
 
-# ═══════════════════════════════════════════════════════════════════
-# ENDPOINTS DE LÍMITES Y CONSULTAS
-# ═══════════════════════════════════════════════════════════════════
-
-@router.get("/usuarios/limits-status", summary="Consultar límites de usuarios por empresa")
-def get_users_limits_status(db: Session = Depends(get_db)):
-    """Obtener información sobre límites de usuarios y estado actual"""
-    
-    # Información del Polo
-    polo_admin_count = (
-        db.query(models.Usuario)
-        .join(models.RolUsuario)
-        .join(models.Rol)
-        .filter(models.Rol.tipo_rol == "admin_polo")
-        .filter(models.Usuario.estado == True)
-        .count()
-    )
-    
-    # Contar usuarios públicos en el polo
-    polo_public_count = (
-        db.query(models.Usuario)
-        .join(models.RolUsuario)
-        .join(models.Rol)
-        .filter(models.Rol.tipo_rol == "publico")
-        .filter(models.Usuario.cuil == POLO_CUIL)
-        .filter(models.Usuario.estado == True)
-        .count()
-    )
-    
-    # Información por empresa (admin_empresa)
-    empresas_info = []
-    empresas = db.query(models.Empresa).filter(models.Empresa.cuil != POLO_CUIL).all()
-    
-    for empresa in empresas:
-        admin_count = (
-            db.query(models.Usuario)
-            .join(models.RolUsuario)
-            .join(models.Rol)
-            .filter(models.Rol.tipo_rol == "admin_empresa")
-            .filter(models.Usuario.cuil == empresa.cuil)
-            .filter(models.Usuario.estado == True)
-            .count()
-        )
-        
-        empresas_info.append({
-            "cuil": empresa.cuil,
-            "nombre": empresa.nombre,
-            "admin_empresa_actuales": admin_count,
-            "limite_admin_empresa": MAX_ADMIN_EMPRESA_PER_COMPANY,
-            "puede_crear_mas": admin_count < MAX_ADMIN_EMPRESA_PER_COMPANY
-        })
-    
-    return {
-        "polo_info": {
-            "admin_polo_actuales": polo_admin_count,
-            "usuarios_publicos_actuales": polo_public_count,
-            "limite_admin_polo": MAX_ADMIN_POLO_TOTAL,
-            "puede_crear_admin_polo": polo_admin_count < MAX_ADMIN_POLO_TOTAL,
-            "puede_crear_publico": True  # Sin límite para públicos
-        },
-        "empresas_info": empresas_info,
-        "limites_configurados": {
-            "max_admin_empresa_per_company": MAX_ADMIN_EMPRESA_PER_COMPANY,
-            "max_admin_polo_total": MAX_ADMIN_POLO_TOTAL,
-            "polo_cuil": POLO_CUIL
-        }
-    }
-
 # ═══════════════════════════════════════════════════════════════════
 # GESTIÓN DE EMPRESAS
 # ═══════════════════════════════════════════════════════════════════
@@ -812,9 +824,12 @@ def delete_lote(id_lotes: int, db: Session = Depends(get_db)):
 # ═══════════════════════════════════════════════════════════════════
 
 @router.get("/all", response_model=List[EmpresaDetailOutPublic], summary="Obtener todas las empresas con detalles completos")
-def get_all_companies(db: Session = Depends(get_db)):
+async def get_all_companies(db: Session = Depends(get_db)):
     """Listar todas las empresas con información detallada para consulta pública"""
-    empresas = db.query(Empresa).all()
+    return await run_read(db, _list_all_companies)
+
+def _list_all_companies(db: Session):
+    empresas = db.query(Empresa).options(*loaders.EMPRESA_DETAIL_PUBLIC).all()
     if not empresas:
         raise HTTPException(status_code=404, detail="No se encontraron empresas")
     
@@ -825,14 +840,17 @@ def get_all_companies(db: Session = Depends(get_db)):
     return empresa_details
 
 @router.get("/search", response_model=List[EmpresaDetailOutPublic], summary="Buscar empresas por criterios específicos")
-def search_companies(
+async def search_companies(
     name: str = None,
     rubro: str = None,
     servicio_polo: str = None,
     db: Session = Depends(get_db)
 ):
     """Buscar empresas por nombre, rubro o tipo de servicio del polo"""
-    query = db.query(Empresa)
+    return await run_read(db, _search_companies, name, rubro, servicio_polo)
+
+def _search_companies(db: Session, name: str, rubro: str, servicio_polo: str):
+    query = db.query(Empresa).options(*loaders.EMPRESA_DETAIL_PUBLIC)
     
     # Filtrar por nombre
     if name:
@@ -860,9 +878,12 @@ def search_companies(
     return empresa_details
 
 @router.get("/search/contactos", response_model=List[ContactoOutPublic], summary="Buscar contactos por empresa")
-def search_companies_contacts(name: str = None, db: Session = Depends(get_db)):
+async def search_companies_contacts(name: str = None, db: Session = Depends(get_db)):
     """Buscar empresas por nombre y devolver solo los contactos"""
-    query = db.query(Empresa)
+    return await run_read(db, _search_companies_contacts, name)
+
+def _search_companies_contacts(db: Session, name: str):
+    query = db.query(Empresa).options(*loaders.EMPRESA_CONTACTOS)
     
     if name:
         query = query.filter(Empresa.nombre.ilike(f"%{name}%"))
@@ -890,9 +911,12 @@ def search_companies_contacts(name: str = None, db: Session = Depends(get_db)):
     return all_contacts
 
 @router.get("/search/lotes", response_model=List[LoteOutPublic], summary="Buscar lotes por empresa")
-def search_companies_lotes(name: str = None, db: Session = Depends(get_db)):
+async def search_companies_lotes(name: str = None, db: Session = Depends(get_db)):
     """Buscar empresas por nombre y devolver solo los lotes"""
-    query = db.query(Empresa)
+    return await run_read(db, _search_companies_lotes, name)
+
+def _search_companies_lotes(db: Session, name: str):
+    query = db.query(Empresa).options(*loaders.EMPRESA_SERVICIOS_POLO)
     
     if name:
         query = query.filter(Empresa.nombre.ilike(f"%{name}%"))
@@ -914,3 +938,126 @@ def search_companies_lotes(name: str = None, db: Session = Depends(get_db)):
                 all_lotes.append(lote_data)
     
     return all_lotes
+
+# ═══════════════════════════════════════════════════════════════════
+# DIRECTORIO PAGINADO (KEYSET)
+# ═══════════════════════════════════════════════════════════════════
+
+DIRECTORY_DEFAULT_PAGE_SIZE = int(os.getenv("DIRECTORY_DEFAULT_PAGE_SIZE", "20"))
+DIRECTORY_MAX_PAGE_SIZE = int(os.getenv("DIRECTORY_MAX_PAGE_SIZE", "100"))
+
+def _encode_cursor(empresa: models.Empresa) -> str:
+    raw = json.dumps([empresa.nombre, empresa.cuil], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        nombre, cuil = json.loads(raw)
+        if not isinstance(nombre, str) or not isinstance(cuil, int):
+            raise ValueError(cursor)
+        return nombre, cuil
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _parse_include(include: str) -> set:
+    requested = {item.strip() for item in (include or "").split(",") if item.strip()}
+    unknown = requested - set(loaders.DIRECTORY_INCLUDES)
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"include no soportado: {', '.join(sorted(unknown))}. Usa {', '.join(loaders.DIRECTORY_INCLUDES)}."
+        )
+    return requested
+
+def build_empresa_directory_item(emp: models.Empresa, include: set) -> schemas.EmpresaDirectoryItem:
+    """Construir un ítem del directorio con solo las relaciones pedidas"""
+    item = schemas.EmpresaDirectoryItem(
+        nombre=emp.nombre,
+        rubro=emp.rubro,
+        fecha_ingreso=emp.fecha_ingreso,
+        horario_trabajo=emp.horario_trabajo,
+    )
+    if "contactos" in include:
+        item.contactos = [
+            schemas.ContactoOutPublic(
+                empresa_nombre=emp.nombre,
+                nombre=c.nombre,
+                telefono=c.telefono,
+                datos=c.datos,
+                direccion=c.direccion,
+                tipo_contacto=c.tipo_contacto.tipo if c.tipo_contacto else None
+            )
+            for c in emp.contactos
+        ]
+    if "servicios_polo" in include or "lotes" in include:
+        item.servicios_polo = [
+            schemas.ServicioPoloDirectoryOut(
+                nombre=svc.nombre,
+                horario=svc.horario,
+                tipo_servicio_polo=svc.tipo_servicio.tipo if svc.tipo_servicio else None,
+                lotes=[schemas.LoteOut.from_orm(l) for l in svc.lotes] if "lotes" in include else None
+            )
+            for svc in emp.servicios_polo
+        ]
+    return item
+
+@router.get("/directory", response_model=schemas.EmpresaDirectoryPage, summary="Directorio de empresas paginado")
+async def get_company_directory(
+    limit: int = DIRECTORY_DEFAULT_PAGE_SIZE,
+    cursor: str = None,
+    name: str = None,
+    rubro: str = None,
+    servicio_polo: str = None,
+    include: str = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Directorio de empresas ordenado por nombre, de a `limit` por página
+    (máximo DIRECTORY_MAX_PAGE_SIZE). Para la página siguiente se envía el
+    `next_cursor` recibido. `include=contactos,servicios_polo,lotes` agrega
+    esas relaciones a cada empresa; por defecto solo vienen los datos básicos.
+    """
+    limit = max(1, min(limit, DIRECTORY_MAX_PAGE_SIZE))
+    after = _decode_cursor(cursor) if cursor else None
+    return await run_read(db, _company_directory_page, limit, after, name, rubro, servicio_polo, _parse_include(include))
+
+def _company_directory_page(db: Session, limit: int, after, name: str, rubro: str, servicio_polo: str, include: set):
+    query = db.query(Empresa)
+    if name:
+        query = query.filter(Empresa.nombre.ilike(f"%{name}%"))
+    if rubro:
+        query = query.filter(Empresa.rubro.ilike(f"%{rubro}%"))
+    if servicio_polo:
+        # EXISTS en lugar de JOIN: no duplica empresas con varios servicios
+        query = query.filter(
+            Empresa.servicios_polo.any(
+                ServicioPolo.tipo_servicio.has(TipoServicioPolo.tipo.ilike(f"%{servicio_polo}%"))
+            )
+        )
+
+    total = query.order_by(None).count()
+
+    if after:
+        nombre, cuil = after
+        query = query.filter(or_(
+            Empresa.nombre > nombre,
+            and_(Empresa.nombre == nombre, Empresa.cuil > cuil)
+        ))
+
+    # Se pide una fila de más para saber si hay página siguiente
+    empresas = (
+        query.options(*loaders.directory_options(include))
+        .order_by(Empresa.nombre, Empresa.cuil)
+        .limit(limit + 1)
+        .all()
+    )
+    has_more = len(empresas) > limit
+    empresas = empresas[:limit]
+
+    return schemas.EmpresaDirectoryPage(
+        items=[build_empresa_directory_item(emp, include) for emp in empresas],
+        total=total,
+        limit=limit,
+        next_cursor=_encode_cursor(empresas[-1]) if has_more else None
+    )
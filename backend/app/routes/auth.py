@@ -1,17 +1,17 @@
 #auth.py
 from fastapi import Depends, HTTPException, APIRouter, Response, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy.orm import Session
 from sqlalchemy import or_
 from jose import JWTError, jwt
 from datetime import date, datetime, timedelta
-from app.config import SessionLocal, SECRET_KEY, ALGORITHM
+from typing import Optional
+from app.config import get_db, SECRET_KEY, ALGORITHM
 from app import models, schemas, services
-from app.models import Usuario
+from app import email_outbox, hashing_policy, rate_limit, security_epochs
+from app.principals import Principal, resolve_principal
 from app.schemas import PasswordResetRequest, PasswordResetConfirm, PasswordResetConfirmSecure, ChangePasswordDirect, ForgotPasswordReset
-from email.mime.text import MIMEText
-import smtplib
-from app.config import settings
+import math
 from app.services import (
     secure_password_reset_confirm, 
     forgot_password_reset_confirm,
@@ -32,52 +32,57 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 # CONFIGURACIÓN Y UTILIDADES
 # ═══════════════════════════════════════════════════════════════════
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+def _check_principal_active(principal: Principal) -> None:
+    # Usuario deshabilitado
+    if not principal.estado:
+        raise HTTPException(
+            status_code=403,
+            detail="Su cuenta ha sido deshabilitada. Contacte con el administrador."
+        )
+
+    # Empresa desactivada
+    if not principal.empresa_estado:
+        raise HTTPException(
+            status_code=403,
+            detail="La empresa asociada está desactivada."
+        )
+
 
 def get_current_user(
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
-) -> models.Usuario:
+) -> Principal:
+    """
+    Usuario del token como Principal (usuario + empresa + roles).
+    Con claims de rol/empresa (app/security_epochs.py) se arma desde el
+    token y solo se compara la época de seguridad; si no, se resuelve con
+    una consulta cacheada por sujeto (app/principals.py).
+    FastAPI lo resuelve una vez por petición y los guards de rol lo reusan.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         nombre = payload.get("sub")
         if not nombre:
             raise HTTPException(401, "Token inválido")
 
-        user = (
-            db.query(models.Usuario)
-            .filter(models.Usuario.nombre == nombre)
-            .first()
-        )
-        if not user:
-            raise HTTPException(401, "Usuario no encontrado")
+        principal = security_epochs.principal_from_claims(payload)
+        if principal is not None:
+            if not security_epochs.is_current(db, principal.id_usuario, payload["ep"]):
+                raise HTTPException(401, "La sesión fue revocada. Iniciá sesión nuevamente.")
+            return principal
 
-        # Usuario deshabilitado
-        if not user.estado:
-            raise HTTPException(
-                status_code=403,
-                detail="Su cuenta ha sido deshabilitada. Contacte con el administrador."
-            )
-
-        # Empresa desactivada
-        if not user.empresa or not user.empresa.estado:
-            raise HTTPException(
-                status_code=403,
-                detail="La empresa asociada está desactivada."
-            )
+        principal = resolve_principal(db, nombre)
+        if not principal:
+            raise HTTPException(401, "Usuario no encontrado")
 
-        return user
+        _check_principal_active(principal)
+        return principal
     except JWTError:
         raise HTTPException(401, "Token inválido")
 
 
 # Función para obtener usuario desde cookie de "recordarme"
-def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -> models.Usuario:
+def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -> Optional[Principal]:
     """
     Obtiene el usuario actual desde token Bearer o cookie de "recordarme"
     Usado para endpoints que pueden funcionar con o sin autenticación
@@ -90,9 +95,9 @@ def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -
             payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
             nombre = payload.get("sub")
             if nombre:
-                user = db.query(models.Usuario).filter(models.Usuario.nombre == nombre).first()
-                if user and user.estado and user.empresa and user.empresa.estado:
-                    return user
+                principal = resolve_principal(db, nombre)
+                if principal and principal.estado and principal.empresa_estado:
+                    return principal
         except JWTError:
             pass  # ignorar y seguir a cookie
 
@@ -104,9 +109,9 @@ def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -
             nombre = payload.get("sub")
             token_type = payload.get("type")
             if nombre and token_type == "remember":
-                user = db.query(models.Usuario).filter(models.Usuario.nombre == nombre).first()
-                if user and user.estado and user.empresa and user.empresa.estado:
-                    return user
+                principal = resolve_principal(db, nombre)
+                if principal and principal.estado and principal.empresa_estado:
+                    return principal
         except JWTError:
             pass
 
@@ -114,10 +119,17 @@ def get_current_user_optional(request: Request, db: Session = Depends(get_db)) -
     return None
 
 
+def create_user_access_token(db: Session, principal: Principal) -> str:
+    """Access token con `sub` más claims de rol, empresa y época de seguridad."""
+    return services.create_access_token(
+        data={"sub": principal.nombre, **security_epochs.token_claims(db, principal)}
+    )
+
+
 # ═══════════════════════════════════════════════════════════════════
 # >>> AGREGADO: Helpers de email para cambio de contraseña (éxito / fallo)
-# Reutiliza Gmail SMTP como en /forgot-password
-def _send_change_password_success_email(to_email: str, nombre: str):
+# Se encolan en la bandeja de salida (app/email_outbox.py)
+def _send_change_password_success_email(db: Session, to_email: str, nombre: str):
     cuerpo = f"""
 Hola {nombre},
 
@@ -128,22 +140,10 @@ Saludos,
 Administración Polo 52
 """.strip()
 
-    msg = MIMEText(cuerpo)
-    msg["Subject"] = "Polo 52 - Tu contraseña fue actualizada"
-    msg["From"] = settings.EMAIL_USER
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(settings.EMAIL_USER, settings.EMAIL_PASS)
-            server.send_message(msg)
-    except Exception:
-        # No interrumpir el flujo por error de email
-        pass
+    email_outbox.enqueue(db, to_email, "Polo 52 - Tu contraseña fue actualizada", cuerpo)
 
 
-def _send_change_password_failure_email(to_email: str, nombre: str, reason: str):
+def _send_change_password_failure_email(db: Session, to_email: str, nombre: str, reason: str):
     cuerpo = f"""
 Hola {nombre},
 
@@ -156,96 +156,49 @@ Saludos,
 Administración Polo 52
 """.strip()
 
-    msg = MIMEText(cuerpo)
-    msg["Subject"] = "Polo 52 - No pudimos actualizar tu contraseña"
-    msg["From"] = settings.EMAIL_USER
-    msg["To"] = to_email
-
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(settings.EMAIL_USER, settings.EMAIL_PASS)
-            server.send_message(msg)
-    except Exception:
-        # No interrumpir el flujo por error de email
-        pass
+    email_outbox.enqueue(db, to_email, "Polo 52 - No pudimos actualizar tu contraseña", cuerpo)
 # <<< AGREGADO
 
 # ═══════════════════════════════════════════════════════════════════
 # >>> AGREGADO: Cooldown por intentos fallidos en cambio de contraseña
 _MAX_FAILS_CHANGE_PW = 3          # intentos fallidos permitidos antes del bloqueo
 _COOLDOWN_SECONDS_CHANGE_PW = 60  # segundos de espera al alcanzar el límite
+_FAILS_WINDOW_SECONDS_CHANGE_PW = 900  # ventana en la que se cuentan los fallos
+
+# Fallos por usuario en el backend de app/rate_limit.py (acotado y compartible)
+_change_pw_attempts = rate_limit.SlidingWindowLimiter(
+    "change_password", _MAX_FAILS_CHANGE_PW, _FAILS_WINDOW_SECONDS_CHANGE_PW,
+    lockout_seconds=_COOLDOWN_SECONDS_CHANGE_PW,
+)
+
+def _is_change_pw_locked(user_id):
+    remaining = _change_pw_attempts.blocked(user_id)
+    return remaining > 0, math.ceil(remaining)
+
+def _register_change_pw_failure(user_id):
+    return _change_pw_attempts.record_failure(user_id)
 
-# Estructura en memoria: { user_id: {"fails": int, "lock_until": datetime|None} }
-_change_pw_attempts = {}
-
-def _is_change_pw_locked(user_id: int):
-    info = _change_pw_attempts.get(user_id)
-    if not info:
-        return False, 0
-    lock_until = info.get("lock_until")
-    if lock_until and datetime.utcnow() < lock_until:
-        remaining = int((lock_until - datetime.utcnow()).total_seconds())
-        return True, max(0, remaining)
-    return False, 0
-
-def _register_change_pw_failure(user_id: int):
-    info = _change_pw_attempts.get(user_id, {"fails": 0, "lock_until": None})
-    info["fails"] = info.get("fails", 0) + 1
-    if info["fails"] >= _MAX_FAILS_CHANGE_PW:
-        info["lock_until"] = datetime.utcnow() + timedelta(seconds=_COOLDOWN_SECONDS_CHANGE_PW)
-        info["fails"] = 0  # opcional: resetea contador al iniciar cooldown
-    _change_pw_attempts[user_id] = info
-    return info
-
-def _reset_change_pw_attempts(user_id: int):
-    if user_id in _change_pw_attempts:
-        _change_pw_attempts.pop(user_id, None)
+def _reset_change_pw_attempts(user_id):
+    _change_pw_attempts.reset(user_id)
 # <<< AGREGADO
 
 # ═══════════════════════════════════════════════════════════════════
 # VALIDACIÓN DE ROLES
 # ═══════════════════════════════════════════════════════════════════
 
-def require_admin_polo(
-    current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Usuario:
-    user = (
-        db.query(Usuario)
-        .options(joinedload(Usuario.roles))
-        .filter(Usuario.id_usuario == current_user.id_usuario)
-        .first()
-    )
-    if not any(r.tipo_rol == "admin_polo" for r in user.roles):
+# Los roles ya vienen en el Principal: los guards no consultan la base
+def require_admin_polo(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if not current_user.has_role("admin_polo"):
         raise HTTPException(403, "Se requiere rol admin_polo")
-    return user
+    return current_user
 
-def require_empresa_role(
-    current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Usuario:
-    user = (
-        db.query(Usuario)
-        .options(joinedload(Usuario.roles))
-        .filter(Usuario.id_usuario == current_user.id_usuario)
-        .first()
-    )
-    if not any(r.tipo_rol == "admin_empresa" for r in user.roles):
+def require_empresa_role(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if not current_user.has_role("admin_empresa"):
         raise HTTPException(403, "Se requiere rol admin_empresa")
-    return user
+    return current_user
 
-def require_public_role(
-    current_user: Usuario = Depends(get_current_user),
-    db: Session = Depends(get_db)
-) -> Usuario:
-    user = (
-        db.query(Usuario)
-        .options(joinedload(Usuario.roles))
-        .filter(Usuario.id_usuario == current_user.id_usuario)
-        .first()
-    )
-    if not any(r.tipo_rol == "publico" for r in user.roles):
+def require_public_role(current_user: Principal = Depends(get_current_user)) -> Principal:
+    if not current_user.has_role("publico"):
         raise HTTPException(403, "Se requiere rol 'publico'")
     return current_user
 
@@ -254,7 +207,8 @@ def require_public_role(
 # ═══════════════════════════════════════════════════════════════════
 
 @router.post("/register", tags=["auth"])
-def register(dto: schemas.UserRegister, db: Session = Depends(get_db)):
+def register(dto: schemas.UserRegister, request: Request, db: Session = Depends(get_db)):
+    rate_limit.enforce(rate_limit.register_requests.acquire(rate_limit.client_ip(request)))
     if db.query(models.Usuario).filter(models.Usuario.nombre == dto.nombre).first():
         raise HTTPException(status_code=400, detail="Nombre ya existe")
     new = models.Usuario(
@@ -271,11 +225,18 @@ def register(dto: schemas.UserRegister, db: Session = Depends(get_db)):
 
 @router.post("/login", response_model=schemas.Token, tags=["auth"])
 def login(
+    request: Request,
     response: Response,
     form_data: OAuth2PasswordRequestForm = Depends(),
     db: Session = Depends(get_db),
     remember_me: bool = False
 ):
+    # Límites antes de tocar bcrypt: peticiones por IP y fallos por IP + usuario
+    ip = rate_limit.client_ip(request)
+    rate_limit.enforce(rate_limit.login_requests.acquire(ip))
+    login_key = f"{ip}:{form_data.username.lower()}"
+    rate_limit.enforce(rate_limit.login_failures.blocked(login_key))
+
     user = (
         db.query(models.Usuario)
         .filter(
@@ -285,8 +246,13 @@ def login(
         .first()
     )
 
-    if not user or not services.verify_password(form_data.password, user.contrasena):
+    valid, new_hash = (
+        services.verify_and_update_password(form_data.password, user.contrasena) if user else (False, None)
+    )
+    if not valid:
+        rate_limit.login_failures.record_failure(login_key)
         raise HTTPException(status_code=401, detail="Credenciales inválidas")
+    rate_limit.login_failures.reset(login_key)
 
     # Usuario deshabilitado
     if not user.estado:
@@ -302,17 +268,18 @@ def login(
             detail="La empresa asociada está desactivada."
         )
 
+    # Hash con esquema o costo viejo: reemplazarlo ahora que tenemos la
+    # contraseña en claro (app/hashing_policy.py)
+    if new_hash:
+        hashing_policy.apply_rehash(db, user, new_hash)
+        db.commit()
+
     # Roles
-    roles = (
-        db.query(models.Rol.tipo_rol)
-        .join(models.RolUsuario, models.Rol.id_rol == models.RolUsuario.id_rol)
-        .filter(models.RolUsuario.id_usuario == user.id_usuario)
-        .all()
-    )
-    rol = roles[0][0] if roles else "usuario"
+    principal = Principal.from_user(user)
+    rol = principal.roles[0] if principal.roles else "usuario"
 
-    # Access token
-    access_token = services.create_access_token(data={"sub": user.nombre})
+    # Access token con claims de rol/empresa y época de seguridad
+    access_token = create_user_access_token(db, principal)
 
     # Cookie remember opcional
     if remember_me:
@@ -363,17 +330,11 @@ def check_remember_session(
     user = get_current_user_optional(request, db)
     
     if user:
-        # Obtener roles del usuario
-        roles = (
-            db.query(models.Rol.tipo_rol)
-            .join(models.RolUsuario, models.Rol.id_rol == models.RolUsuario.id_rol)
-            .filter(models.RolUsuario.id_usuario == user.id_usuario)
-            .all()
-        )
-        rol = roles[0][0] if roles else "usuario"
+        # Los roles ya vienen en el Principal
+        rol = user.roles[0] if user.roles else "usuario"
         
         # Crear nuevo access token para la sesión
-        access_token = services.create_access_token(data={"sub": user.nombre})
+        access_token = create_user_access_token(db, user)
         
         return {
             "logged_in": True,
@@ -395,12 +356,14 @@ def check_remember_session(
 @router.post("/change-password-direct", tags=["auth"])
 def change_password_direct(
     dto: schemas.ChangePasswordDirect,
-    current_user: models.Usuario = Depends(get_current_user),
+    current_user: Principal = Depends(get_current_user),
     db: Session = Depends(get_db)
 ):
     """
     Cambio directo de contraseña (requiere estar logueado)
     """
+    # El Principal no está ligado a la sesión: cargar el usuario a modificar
+    current_user = db.get(models.Usuario, current_user.id_usuario)
 
     # >>> AGREGADO: bloquear si está en cooldown por demasiados intentos
     locked, wait_sec = _is_change_pw_locked(current_user.id_usuario)
@@ -438,25 +401,26 @@ def change_password_direct(
         # 4. Guardar contraseña actual en historial
         services.save_password_to_history(db, current_user.id_usuario, current_user.contrasena)
         
-        # 5. Actualizar contraseña
+        # 5. Actualizar contraseña (el email de éxito sale en la misma transacción)
         current_user.contrasena = services.hash_password(dto.new_password)
+        _send_change_password_success_email(
+            db,
+            to_email=current_user.email,
+            nombre=current_user.nombre
+        )
         db.commit()
         db.refresh(current_user)
 
-        # >>> AGREGADO: resetear intentos en éxito + enviar email de éxito
+        # >>> AGREGADO: resetear intentos en éxito
         _reset_change_pw_attempts(current_user.id_usuario)
-        try:
-            _send_change_password_success_email(
-                to_email=current_user.email,
-                nombre=current_user.nombre
-            )
-        except Exception:
-            pass
         # <<< AGREGADO
         
+        # El cambio incrementa la época de seguridad y revoca los tokens
+        # anteriores: devolver uno nuevo para seguir con la sesión
         return {
             "success": True,
-            "message": "Contraseña actualizada correctamente"
+            "message": "Contraseña actualizada correctamente",
+            "access_token": create_user_access_token(db, Principal.from_user(current_user)),
         }
         
     except HTTPException as e:
@@ -467,12 +431,14 @@ def change_password_direct(
         locked, wait_sec = _is_change_pw_locked(current_user.id_usuario)
         try:
             _send_change_password_failure_email(
+                db,
                 to_email=current_user.email,
                 nombre=current_user.nombre,
                 reason=e.detail
             )
+            db.commit()
         except Exception:
-            pass
+            db.rollback()
         # <<< AGREGADO
 
         return {
@@ -493,12 +459,14 @@ def change_password_direct(
         locked, wait_sec = _is_change_pw_locked(current_user.id_usuario)
         try:
             _send_change_password_failure_email(
+                db,
                 to_email=current_user.email,
                 nombre=current_user.nombre,
                 reason="Error interno al actualizar la contraseña"
             )
+            db.commit()
         except Exception:
-            pass
+            db.rollback()
         # <<< AGREGADO
 
         raise HTTPException(
@@ -511,8 +479,9 @@ def change_password_direct(
 # ═══════════════════════════════════════════════════════════════════
 
 @router.post("/forgot-password", tags=["auth"])
-def forgot_password(dto: PasswordResetRequest, db: Session = Depends(get_db)):
+def forgot_password(dto: PasswordResetRequest, request: Request, db: Session = Depends(get_db)):
     """Solicitar reset de contraseña via email (para usuarios no logueados)"""
+    rate_limit.enforce(rate_limit.forgot_password_requests.acquire(rate_limit.client_ip(request)))
     user = db.query(models.Usuario).filter(models.Usuario.email == dto.email).first()
     if not user:
         raise HTTPException(status_code=404, detail="Email no registrado")
@@ -561,18 +530,9 @@ Saludos,
 Administración Polo 52
     """
     
-    msg = MIMEText(email_body)
-    msg["Subject"] = "Recuperar Contraseña - Polo 52"
-    msg["From"] = settings.EMAIL_USER
-    msg["To"] = dto.email
-    
-    try:
-        with smtplib.SMTP("smtp.gmail.com", 587) as server:
-            server.starttls()
-            server.login(settings.EMAIL_USER, settings.EMAIL_PASS)
-            server.send_message(msg)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error enviando email: {str(e)}")
+    # Se encola y lo envía el worker de app/email_outbox.py (sin SMTP en la petición)
+    email_outbox.enqueue(db, dto.email, "Recuperar Contraseña - Polo 52", email_body)
+    db.commit()
     
     return {
         "message": "Se ha enviado un email con instrucciones para restablecer tu contraseña",
@@ -719,8 +679,7 @@ def cleanup_reset_tokens_cache(
     current_user: models.Usuario = Depends(require_admin_polo)
 ):
     """Limpiar cache de tokens usados - Solo admin"""
-    count_before = services.get_used_tokens_count()
-    services.cleanup_used_tokens()
+    count_before = services.cleanup_used_tokens()
     return {
         "message": f"Cache limpiado. Tokens eliminados: {count_before}",
         "tokens_removed": count_before
@@ -731,7 +690,5 @@ def get_cache_status(
     current_user: models.Usuario = Depends(require_admin_polo)
 ):
     """Ver estado del cache de tokens - Solo admin"""
-    return {
-        "used_tokens_count": services.get_used_tokens_count(),
-        "memory_usage": "En memoria del servidor"
-    }
\ No newline at end of file
+    stats = services.get_used_tokens_stats()
+    return {"used_tokens_count": stats["size"], **stats}
\ No newline at end of file
@@ -1,9 +1,10 @@
 #app/routes/company_user.py
 from fastapi import APIRouter, HTTPException, Depends, status
 from sqlalchemy.orm import Session
-from app.config import SessionLocal
+from app.config import get_db
 from app.routes.auth import get_current_user, require_empresa_role
-from app import models, schemas, services
+from app import loaders, models, schemas, services
+from app.reference_data import reference_catalog
 
 
 router = APIRouter(
@@ -15,14 +16,7 @@ router = APIRouter(
 # CONFIGURACIÓN Y UTILIDADES
 # ═══════════════════════════════════════════════════════════════════
 
-def get_db():
-    db = SessionLocal() 
-    try: 
-        yield db
-    finally: 
-        db.close()
-
-def validar_datos_vehiculo(dto: schemas.VehiculoCreate, tipo_vehiculo: models.TipoVehiculo):
+def validar_datos_vehiculo(dto: schemas.VehiculoCreate, tipo_vehiculo: schemas.TipoVehiculoOut):
     """Validar datos específicos según el tipo de vehículo"""
     datos = dto.datos
 
@@ -185,7 +179,12 @@ def read_me(
     db: Session = Depends(get_db),
 ):
     """Obtener información completa de mi empresa"""
-    emp = db.query(models.Empresa).filter_by(cuil=current_user.cuil).first()
+    emp = (
+        db.query(models.Empresa)
+        .options(*loaders.EMPRESA_DETAIL)
+        .filter_by(cuil=current_user.cuil)
+        .first()
+    )
     if not emp:
         raise HTTPException(404, "Empresa no encontrada")
     return build_empresa_detail(emp)
@@ -230,9 +229,7 @@ def create_vehiculo(
 ):
     """Crear nuevo vehículo para la empresa"""
     try:
-        tipo_vehiculo = db.query(models.TipoVehiculo).filter(
-            models.TipoVehiculo.id_tipo_vehiculo == dto.id_tipo_vehiculo
-        ).first()
+        tipo_vehiculo = reference_catalog.get_by_id(db, "vehiculo", dto.id_tipo_vehiculo)
         
         if not tipo_vehiculo:
             raise HTTPException(status_code=400, detail=f"Tipo de vehículo {dto.id_tipo_vehiculo} no existe")
@@ -307,9 +304,7 @@ def update_vehiculo(
     db.commit()
     db.refresh(v)
 
-    tipo_vehiculo = db.query(models.TipoVehiculo).filter(
-        models.TipoVehiculo.id_tipo_vehiculo == v.id_tipo_vehiculo
-    ).first()
+    tipo_vehiculo = reference_catalog.get_by_id(db, "vehiculo", v.id_tipo_vehiculo)
     tipo_vehiculo_out = None
     if tipo_vehiculo:
         tipo_vehiculo_out = schemas.TipoVehiculoOut(
@@ -504,20 +499,8 @@ def delete_contacto(
 # ENDPOINTS DE CATÁLOGOS/TIPOS
 # ═══════════════════════════════════════════════════════════════════
 
-@router.get("/tipos/vehiculo", response_model=list[schemas.TipoVehiculoOut], summary="Obtener tipos de vehículo")
-def get_tipos_vehiculo(db: Session = Depends(get_db)):
-    """Listar todos los tipos de vehículo disponibles"""
-    return db.query(models.TipoVehiculo).all()
-
-@router.get("/tipos/servicio", response_model=list[schemas.TipoServicioOut], summary="Obtener tipos de servicio")
-def get_tipos_servicio(db: Session = Depends(get_db)):
-    """Listar todos los tipos de servicio disponibles"""
-    return db.query(models.TipoServicio).all()
-
-@router.get("/tipos/contacto", response_model=list[schemas.TipoContactoOut], summary="Obtener tipos de contacto")
-def get_tipos_contacto(db: Session = Depends(get_db)):
-    """Listar todos los tipos de contacto disponibles"""
-    return db.query(models.TipoContacto).all()
+# /tipos/* vive en app/routes/tipos.py (catálogo en memoria con ETag). Las
+# copias que había acá se registraban antes y tapaban a esas rutas.
 
 # ═══════════════════════════════════════════════════════════════════
 # SOLICITUDES DE AMPLIACIÓN DE LÍMITES
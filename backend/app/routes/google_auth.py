@@ -8,7 +8,9 @@ import os
 import httpx
 from app.config import SessionLocal
 from app import models, services
-from app.routes.auth import get_db, require_admin_polo
+from app.reference_data import reference_catalog
+from app.principals import Principal
+from app.routes.auth import create_user_access_token, get_db, require_admin_polo
 
 router = APIRouter(prefix="/auth/google", tags=["Google Auth"])
 
@@ -79,15 +81,10 @@ async def google_callback(request: Request, db: Session = Depends(get_db)):
             return RedirectResponse(url=frontend_url)
 
         # 4) OK: generar tu JWT y redirigir a éxito
-        roles = (
-            db.query(models.Rol.tipo_rol)
-            .join(models.RolUsuario, models.Rol.id_rol == models.RolUsuario.id_rol)
-            .filter(models.RolUsuario.id_usuario == user.id_usuario)
-            .all()
-        )
-        rol = roles[0][0] if roles else "usuario"
+        principal = Principal.from_user(user)
+        rol = principal.roles[0] if principal.roles else "usuario"
 
-        access_token = services.create_access_token(data={"sub": user.nombre})
+        access_token = create_user_access_token(db, principal)
 
         frontend_url = f"http://localhost:4200/auth/success?token={access_token}&tipo_rol={rol}"
         return RedirectResponse(url=frontend_url)
@@ -119,7 +116,7 @@ async def register_pending_google_user(
         raise HTTPException(status_code=400, detail="La empresa no existe")
     
     # Verificar que el rol existe
-    rol = db.query(models.Rol).filter(models.Rol.id_rol == id_rol).first()
+    rol = reference_catalog.rol(db, id_rol)
     if not rol:
         raise HTTPException(status_code=400, detail="Rol inválido")
     
@@ -1,8 +1,10 @@
 #app/routes/tipos.py
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from sqlalchemy.orm import Session
-from app.config import SessionLocal
-from app import models, schemas
+from app.config import get_read_db
+from app.database import run_read
+from app.reference_data import TIPOS_CACHE_MAX_AGE_SECONDS, etag_matches, reference_catalog
+from app import schemas
 from typing import List
 
 router = APIRouter(
@@ -10,34 +12,40 @@ router = APIRouter(
     tags=["Tipos"],
 )
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+# Catálogos de solo lectura servidos desde app/reference_data.py: solo se
+# consulta la base (con DB_ASYNC_ENABLED, en el engine async) cuando el
+# catálogo venció o se invalidó. Responden con ETag fuerte y 304.
+async def _serve_catalog(name: str, request: Request, response: Response, db: Session):
+    entry = reference_catalog.cached(name) or await run_read(db, reference_catalog.get, name)
+    headers = {
+        "ETag": entry.etag,
+        "Cache-Control": f"public, max-age={TIPOS_CACHE_MAX_AGE_SECONDS}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), entry.etag):
+        return Response(status_code=304, headers=headers)
+    response.headers.update(headers)
+    return list(entry.items)
 
 # Tipos de Vehículo
 @router.get("/vehiculo", response_model=List[schemas.TipoVehiculoOut])
-def get_tipos_vehiculo(db: Session = Depends(get_db)):
+async def get_tipos_vehiculo(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """Obtener todos los tipos de vehículo"""
-    return db.query(models.TipoVehiculo).all()
+    return await _serve_catalog("vehiculo", request, response, db)
 
 # Tipos de Servicio
 @router.get("/servicio", response_model=List[schemas.TipoServicioOut])
-def get_tipos_servicio(db: Session = Depends(get_db)):
+async def get_tipos_servicio(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """Obtener todos los tipos de servicio"""
-    return db.query(models.TipoServicio).all()
+    return await _serve_catalog("servicio", request, response, db)
 
 # Tipos de Contacto
 @router.get("/contacto", response_model=List[schemas.TipoContactoOut])
-def get_tipos_contacto(db: Session = Depends(get_db)):
+async def get_tipos_contacto(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """Obtener todos los tipos de contacto"""
-    return db.query(models.TipoContacto).all()
+    return await _serve_catalog("contacto", request, response, db)
 
 # Tipos de Servicio del Polo
 @router.get("/servicio-polo", response_model=List[schemas.TipoServicioPoloOut])
-def get_tipos_servicio_polo(db: Session = Depends(get_db)):
+async def get_tipos_servicio_polo(request: Request, response: Response, db: Session = Depends(get_read_db)):
     """Obtener todos los tipos de servicio del polo"""
-    return db.query(models.TipoServicioPolo).all()
-
+    return await _serve_catalog("servicio_polo", request, response, db)
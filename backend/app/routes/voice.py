@@ -1,17 +1,29 @@
 # app/routers/voice.py
 
-from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Body, Request
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import APIRouter, UploadFile, File, Form, Depends, HTTPException, Body, Request, Query, BackgroundTasks
+from fastapi.responses import StreamingResponse, JSONResponse, Response
 from fastapi.encoders import jsonable_encoder
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
 from typing import Optional, List, Dict
+import asyncio
 import io
 import base64
 import json
+import secrets
 
 from app.config import get_db
-from app.routes.auth import require_public_role
-from app import services
+from app.routes.auth import require_admin_polo, require_public_role
+from app import services, voice_providers, voice_tickets
+from app.utils.uploads import (
+    CappedUploadRoute,
+    SpooledAudio,
+    decode_base64_audio,
+    json_body_limit,
+    read_json_body_capped,
+    read_request_body_capped,
+    read_upload_capped,
+)
 
 # -------------------------------------------------------------------
 # STREAMING (Opcional)
@@ -41,7 +53,16 @@ router = APIRouter(
     prefix="/api/voice",
     tags=["voice"],
     responses={404: {"description": "Not found"}},
-    dependencies=[Depends(require_public_role)]
+    dependencies=[Depends(require_public_role)],
+    # Multipart con límite de tamaño y tiempo antes de parsear el formulario
+    route_class=CappedUploadRoute,
+)
+
+# Diagnóstico del pipeline: mismo prefijo, pero solo para admin_polo
+diagnostics_router = APIRouter(
+    prefix="/api/voice",
+    tags=["voice"],
+    dependencies=[Depends(require_admin_polo)]
 )
 
 # ═══════════════════════════════════════════════════════════════════
@@ -81,19 +102,26 @@ async def get_voice_status():
 async def transcribe_audio_endpoint(
     audio: UploadFile = File(..., description="Archivo de audio (WebM, WAV, MP3)"),
     language: str = "es-ES",
+    long_audio: bool = False,
 ):
     """
     Transcribe audio a texto sin pasar por el chatbot.
+
+    Con `long_audio=true` el audio se divide en silencios y los segmentos se
+    reconocen en paralelo (también se activa solo para audios de más de ~55 s).
     """
+    spooled: Optional[SpooledAudio] = None
     try:
-        audio_bytes = await audio.read()
+        spooled = await read_upload_capped(audio)
 
-        if len(audio_bytes) == 0:
+        if spooled.size == 0:
             raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
 
-        print(f" Recibido audio: {len(audio_bytes)} bytes, tipo: {audio.content_type}")
+        print(f" Recibido audio: {spooled.size} bytes, tipo: {audio.content_type}")
 
-        transcript = services.transcribe_audio(audio_bytes, language)
+        transcript = await run_in_threadpool(
+            services.transcribe_audio, spooled.view(), language, long_audio=long_audio
+        )
 
         if not transcript:
             return JSONResponse(
@@ -120,6 +148,9 @@ async def transcribe_audio_endpoint(
     except Exception as e:
         print(f" Error en transcripción: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al transcribir audio: {str(e)}")
+    finally:
+        if spooled is not None:
+            spooled.close()
 
 # ═══════════════════════════════════════════════════════════════════
 # ENDPOINT 3: Solo convertir texto a audio
@@ -127,10 +158,15 @@ async def transcribe_audio_endpoint(
 
 @router.post("/synthesize")
 async def synthesize_text_endpoint(
-    text: str = Body(..., embed=True, description="Texto a convertir en audio")
+    request: Request,
+    text: str = Body(..., embed=True, description="Texto a convertir en audio"),
+    audio_format: Optional[str] = Query(None, alias="format", description="mp3, ogg_opus o linear16")
 ):
     """
-    Convierte texto a voz (streaming MP3) usando Google Cloud.
+    Convierte texto a voz usando Google Cloud.
+
+    El formato se negocia con `?format=` o con la cabecera `Accept`
+    (audio/mpeg, audio/ogg, audio/wav); MP3 por defecto.
     """
     try:
         if not text or len(text.strip()) == 0:
@@ -139,16 +175,18 @@ async def synthesize_text_endpoint(
         if len(text) > 5000:
             raise HTTPException(status_code=400, detail="El texto es demasiado largo (máximo 5000 caracteres)")
 
-        print(f" Sintetizando: {text[:100]}...")
+        output_format = _negotiate_audio_format(request, audio_format)
+        print(f" Sintetizando ({output_format.name}): {text[:100]}...")
 
-        audio_bytes = services.text_to_speech(text)
+        audio_bytes = services.text_to_speech(text, audio_format=output_format.name)
 
         return StreamingResponse(
             io.BytesIO(audio_bytes),
-            media_type="audio/mpeg",
+            media_type=output_format.media_type,
             headers={
-                "Content-Disposition": "attachment; filename=response.mp3",
-                "Content-Length": str(len(audio_bytes))
+                "Content-Disposition": f"attachment; filename=response.{output_format.extension}",
+                "Content-Length": str(len(audio_bytes)),
+                "Vary": "Accept"
             }
         )
 
@@ -158,6 +196,106 @@ async def synthesize_text_endpoint(
         print(f" Error en síntesis: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error al generar audio: {str(e)}")
 
+# ═══════════════════════════════════════════════════════════════════
+# NEGOCIACIÓN DEL MODO BINARIO (multipart/mixed + audio crudo)
+# ═══════════════════════════════════════════════════════════════════
+
+MULTIPART_MIXED = "multipart/mixed"
+RAW_AUDIO_CONTENT_TYPES = ("audio/", "application/octet-stream")
+
+# Tipos de `Accept` reconocidos para elegir el formato del audio de respuesta
+ACCEPT_AUDIO_FORMATS = {
+    "audio/mpeg": voice_providers.MP3,
+    "audio/mp3": voice_providers.MP3,
+    "audio/ogg": voice_providers.OGG_OPUS,
+    "audio/opus": voice_providers.OGG_OPUS,
+    "audio/wav": voice_providers.LINEAR16,
+    "audio/x-wav": voice_providers.LINEAR16,
+    "audio/l16": voice_providers.LINEAR16,
+}
+
+def _negotiate_audio_format(request: Request, requested: Optional[str] = None) -> voice_providers.AudioFormat:
+    """
+    Elegir el formato del audio de respuesta: primero `?format=`, después el
+    tipo de audio con mayor q en `Accept`; si no hay ninguno, el por defecto.
+    """
+    if requested:
+        try:
+            return voice_providers.get_audio_format(requested)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    candidates = []
+    for position, media_range in enumerate(request.headers.get("accept", "").lower().split(",")):
+        parts = [part.strip() for part in media_range.split(";")]
+        format_name = ACCEPT_AUDIO_FORMATS.get(parts[0])
+        if not format_name:
+            continue
+        quality = 1.0
+        for param in parts[1:]:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if quality > 0:
+            candidates.append((-quality, position, format_name))
+
+    if candidates:
+        return voice_providers.get_audio_format(min(candidates)[2])
+    return voice_providers.get_audio_format(None)
+
+def _wants_multipart(request: Request) -> bool:
+    """El cliente pide la respuesta binaria vía `Accept: multipart/mixed`."""
+    return MULTIPART_MIXED in request.headers.get("accept", "").lower()
+
+def _is_raw_audio_request(request: Request) -> bool:
+    """El cuerpo de la petición es el audio crudo (sin base64 ni multipart)."""
+    content_type = request.headers.get("content-type", "").lower()
+    return content_type.startswith(RAW_AUDIO_CONTENT_TYPES)
+
+def _multipart_voice_response(
+    payload: dict,
+    audio_bytes: Optional[bytes],
+    audio_format: Optional[voice_providers.AudioFormat] = None
+) -> StreamingResponse:
+    """
+    Arma una respuesta multipart/mixed con una parte JSON y, si hay audio,
+    una parte de audio (MP3 por defecto) con los bytes originales.
+
+    Las partes se emiten una por una desde un generador, de modo que el
+    buffer de audio nunca se concatena ni se codifica.
+    """
+    boundary = secrets.token_hex(16)
+    json_part = json.dumps(jsonable_encoder(payload), ensure_ascii=False).encode("utf-8")
+
+    chunks: List[bytes] = [
+        (
+            f"--{boundary}\r\n"
+            "Content-Type: application/json; charset=utf-8\r\n"
+            f"Content-Length: {len(json_part)}\r\n\r\n"
+        ).encode("ascii"),
+        json_part,
+    ]
+    audio_format = audio_format or voice_providers.get_audio_format(voice_providers.MP3)
+    if audio_bytes:
+        chunks.append(
+            (
+                f"\r\n--{boundary}\r\n"
+                f"Content-Type: {audio_format.media_type}\r\n"
+                f"Content-Disposition: inline; filename=response.{audio_format.extension}\r\n"
+                f"Content-Length: {len(audio_bytes)}\r\n\r\n"
+            ).encode("ascii")
+        )
+        chunks.append(audio_bytes)
+    chunks.append(f"\r\n--{boundary}--\r\n".encode("ascii"))
+
+    return StreamingResponse(
+        iter(chunks),
+        media_type=f"{MULTIPART_MIXED}; boundary={boundary}",
+        headers={"Content-Length": str(sum(len(chunk) for chunk in chunks))},
+    )
+
 # ═══════════════════════════════════════════════════════════════════
 # ENDPOINT 4: Chat completo con voz (PRINCIPAL)
 # ═══════════════════════════════════════════════════════════════════
@@ -165,11 +303,21 @@ async def synthesize_text_endpoint(
 @router.post("/chat")
 async def voice_chat_endpoint(
     request: Request,
+    background_tasks: BackgroundTasks,
     audio: Optional[UploadFile] = File(None, description="Archivo de audio del usuario"),
     text: Optional[str] = Form(None, description="Mensaje de texto (alternativa al audio)"),
     history_form: Optional[str] = Form(
         None, description="Historial de conversación en JSON (solo para multipart/form-data)"
     ),
+    history_query: Optional[str] = Query(
+        None,
+        alias="history",
+        description="Historial en JSON (solo cuando el cuerpo es audio crudo)"
+    ),
+    audio_format: Optional[str] = Query(None, alias="format", description="mp3, ogg_opus o linear16"),
+    deferred_audio: bool = Query(
+        False, description="Responder apenas está el texto y entregar el audio vía ticket"
+    ),
     db: Session = Depends(get_db)
 ):
     """
@@ -177,27 +325,56 @@ async def voice_chat_endpoint(
     - Transcribe (si hay audio).
     - Procesa con el chatbot (Gemini + DB).
     - Devuelve texto + audio (base64) + resultados de DB.
+
+    Modo binario (negociado por cabeceras):
+    - `Content-Type: audio/*` (o `application/octet-stream`): el cuerpo es el
+      audio crudo; el historial opcional va en el query param `history`.
+    - `Accept: multipart/mixed`: la respuesta trae una parte JSON y una parte
+      de audio sin codificar en base64.
+
+    Formato del audio de respuesta: `?format=` (mp3, ogg_opus, linear16) o un
+    tipo de audio en `Accept` (por ejemplo `multipart/mixed, audio/ogg`).
+
+    Respuesta en dos fases (`?deferred_audio=true`): se devuelve el texto y un
+    `audio_ticket` sin esperar al TTS, que corre en segundo plano; el audio se
+    descarga con `GET /api/voice/audio/{ticket}`. Siempre responde JSON.
     """
+    binary_response = _wants_multipart(request)
+    output_format = _negotiate_audio_format(request, audio_format)
+    spooled: Optional[SpooledAudio] = None
+
     try:
         history: Optional[List[Dict]] = None
+        audio_bytes = None
+
+        if _is_raw_audio_request(request):
+            # Audio crudo en el cuerpo de la petición (lectura en streaming con límites)
+            spooled = await read_request_body_capped(request)
+            if spooled.size == 0:
+                raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
+            audio_bytes = spooled.view()
+            print(f"📥 Audio crudo recibido: {spooled.size} bytes")
+            if history_query:
+                try:
+                    history = json.loads(history_query)
+                except json.JSONDecodeError:
+                    raise HTTPException(status_code=400, detail="Historial inválido (JSON esperado)")
 
         # Detectar peticiones JSON puras
-        if audio is None and text is None and history_form is None:
+        elif audio is None and text is None and history_form is None:
             content_type = request.headers.get("content-type", "")
             if content_type.startswith("application/json"):
-                payload = await request.json()
+                # El audio en base64 ocupa ~4/3 del tamaño original
+                payload = await read_json_body_capped(request, json_body_limit())
+                if not isinstance(payload, dict):
+                    raise HTTPException(status_code=400, detail="Cuerpo JSON inválido")
                 text = payload.get("text")
                 history = payload.get("history")
                 audio_payload = payload.get("audio_base64")
                 if audio_payload:
-                    audio_bytes = base64.b64decode(audio_payload)
-                else:
-                    audio_bytes = None
-            else:
-                audio_bytes = None
+                    audio_bytes = decode_base64_audio(audio_payload)
         else:
             # Manejar multipart/form-data
-            audio_bytes = None
             if history_form:
                 try:
                     history = json.loads(history_form)
@@ -209,28 +386,82 @@ async def voice_chat_endpoint(
 
         # Si se recibió archivo de audio vía multipart
         if audio and audio_bytes is None:
-            file_bytes = await audio.read()
-            if len(file_bytes) == 0:
+            spooled = await read_upload_capped(audio)
+            if spooled.size == 0:
                 raise HTTPException(status_code=400, detail="El archivo de audio está vacío")
-            print(f"📥 Audio recibido: {len(file_bytes)} bytes")
-            audio_bytes = file_bytes
+            print(f"📥 Audio recibido: {spooled.size} bytes")
+            audio_bytes = spooled.view()
+
+        if deferred_audio:
+            result = await run_in_threadpool(
+                services.get_chat_text_response,
+                db=db,
+                audio_content=audio_bytes,
+                text_message=text,
+                history=history
+            )
+            ticket = voice_tickets.audio_tickets.create(output_format.name)
+            background_tasks.add_task(
+                services.synthesize_ticket_audio, ticket.ticket_id, result["text"], output_format.name
+            )
+            payload = {
+                "success": True,
+                "data": {
+                    "text": result["text"],
+                    "transcript": result.get("transcript"),
+                    "db_results": result.get("db_results", []),
+                    "corrected_entity": result.get("corrected_entity"),
+                    "audio_ticket": {
+                        "id": ticket.ticket_id,
+                        "url": request.url_for("get_ticket_audio_endpoint", ticket_id=ticket.ticket_id).path,
+                        "format": output_format.name,
+                        "content_type": output_format.media_type,
+                        "expires_in": int(ticket.expires_in)
+                    }
+                },
+                "error": result.get("error", False),
+                "message": "Respuesta generada, audio en proceso"
+            }
+            return JSONResponse(status_code=200, content=jsonable_encoder(payload))
 
-        result = services.get_chat_response_with_audio(
+        result = await run_in_threadpool(
+            services.get_chat_response_with_audio,
             db=db,
             audio_content=audio_bytes,
             text_message=text,
-            history=history
+            history=history,
+            encode_audio=not binary_response,
+            audio_format=output_format.name
         )
 
+        data = {
+            "text": result["text"],
+            "transcript": result.get("transcript"),
+            "db_results": result.get("db_results", []),
+            "corrected_entity": result.get("corrected_entity")
+        }
+
+        if binary_response:
+            response_audio = result.get("audio_bytes") or b""
+            data["audio"] = {
+                "content_type": output_format.media_type,
+                "format": output_format.name,
+                "size_bytes": len(response_audio)
+            }
+            payload = {
+                "success": True,
+                "data": data,
+                "error": result.get("error", False),
+                "message": "Respuesta generada exitosamente"
+            }
+            return _multipart_voice_response(payload, response_audio, output_format)
+
+        data["audio_base64"] = result["audio_base64"]
+        data["audio_format"] = output_format.name
+        data["audio_content_type"] = output_format.media_type
         payload = {
             "success": True,
-            "data": {
-                "text": result["text"],
-                "audio_base64": result["audio_base64"],
-                "transcript": result.get("transcript"),
-                "db_results": result.get("db_results", []),
-                "corrected_entity": result.get("corrected_entity")
-            },
+            "data": data,
             "error": result.get("error", False),
             "message": "Respuesta generada exitosamente"
         }
@@ -244,21 +475,72 @@ async def voice_chat_endpoint(
         raise
     except Exception as e:
         print(f" Error en chat con voz: {str(e)}")
-        return JSONResponse(
-            status_code=200,
-            content={
-                "success": False,
-                "data": {
-                    "text": "No se pudo procesar la consulta en este momento. Intentá nuevamente más tarde.",
-                    "audio_base64": "",
-                    "transcript": None,
-                    "db_results": [],
-                    "corrected_entity": None,
-                },
-                "error": True,
-                "message": "El servidor no pudo responder la consulta"
-            }
-        )
+        payload = {
+            "success": False,
+            "data": {
+                "text": "No se pudo procesar la consulta en este momento. Intentá nuevamente más tarde.",
+                "audio_base64": "",
+                "transcript": None,
+                "db_results": [],
+                "corrected_entity": None,
+            },
+            "error": True,
+            "message": "El servidor no pudo responder la consulta"
+        }
+        if binary_response:
+            payload["data"].pop("audio_base64")
+            return _multipart_voice_response(payload, None)
+        return JSONResponse(status_code=200, content=payload)
+    finally:
+        if spooled is not None:
+            spooled.close()
+
+# ═══════════════════════════════════════════════════════════════════
+# ENDPOINT 4b: Audio diferido de /chat (long-polling por ticket)
+# ═══════════════════════════════════════════════════════════════════
+
+AUDIO_TICKET_MAX_WAIT_SECONDS = 25
+AUDIO_TICKET_POLL_INTERVAL_SECONDS = 0.1
+
+@router.get("/audio/{ticket_id}", name="get_ticket_audio_endpoint")
+async def get_ticket_audio_endpoint(
+    ticket_id: str,
+    wait: float = Query(
+        10, ge=0, le=AUDIO_TICKET_MAX_WAIT_SECONDS,
+        description="Segundos a esperar si el audio todavía no está listo"
+    )
+):
+    """
+    Devuelve el audio de un ticket emitido por `/chat?deferred_audio=true`.
+
+    - 200 con el audio si está listo.
+    - 202 con `Retry-After` si sigue en proceso al agotar `wait`.
+    - 404 si el ticket no existe o venció; 500 si la síntesis falló.
+    """
+    deadline = asyncio.get_running_loop().time() + wait
+    while True:
+        ticket = voice_tickets.audio_tickets.get(ticket_id)
+        if ticket is None:
+            raise HTTPException(status_code=404, detail="El ticket de audio no existe o venció")
+
+        if ticket.status == voice_tickets.READY:
+            audio_format = voice_providers.get_audio_format(ticket.audio_format)
+            return Response(
+                content=ticket.audio,
+                media_type=audio_format.media_type,
+                headers={"Content-Disposition": f"inline; filename=response.{audio_format.extension}"}
+            )
+
+        if ticket.status == voice_tickets.FAILED:
+            raise HTTPException(status_code=500, detail=ticket.error or services.GENERIC_ERROR_MESSAGE)
+
+        if asyncio.get_running_loop().time() >= deadline:
+            return JSONResponse(
+                status_code=202,
+                content={"success": True, "status": voice_tickets.PENDING, "message": "El audio todavía se está generando"},
+                headers={"Retry-After": "1"}
+            )
+        await asyncio.sleep(AUDIO_TICKET_POLL_INTERVAL_SECONDS)
 
 # ═══════════════════════════════════════════════════════════════════
 # ENDPOINT 5: Test del pipeline completo
@@ -288,13 +570,51 @@ async def test_voice_pipeline_endpoint(
         print(f" Error en test: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Error ejecutando tests: {str(e)}")
 
+@diagnostics_router.get("/profile")
+async def profile_voice_pipeline_endpoint(
+    iterations: int = Query(5, ge=1, le=services.PROFILE_MAX_ITERATIONS),
+    fake: bool = Query(False, description="Usar STT/TTS locales (sin Google)"),
+    sample_seconds: float = Query(2.0, gt=0, le=30, description="Segundos de voz del audio de muestra"),
+    include_chat: bool = Query(True, description="Incluir la etapa de chat (Gemini + DB)"),
+    db: Session = Depends(get_db)
+):
+    """
+    Perfila N iteraciones del pipeline STT → chat → TTS con el audio de muestra.
+    Devuelve min/mediana/p95 por etapa, bytes, overhead de base64 y memoria pico.
+    """
+    try:
+        profile = await run_in_threadpool(
+            services.profile_voice_pipeline,
+            db,
+            iterations=iterations,
+            use_fake_providers=fake,
+            sample_seconds=sample_seconds,
+            include_chat=include_chat
+        )
+        return JSONResponse(
+            status_code=200,
+            content={
+                "success": len(profile["errors"]) == 0,
+                "data": profile,
+                "message": "Perfil del pipeline de voz"
+            }
+        )
+
+    except RuntimeError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except Exception as e:
+        print(f" Error en perfilado: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Error perfilando el pipeline: {str(e)}")
+
 # ═══════════════════════════════════════════════════════════════════
 # ENDPOINT 6: Obtener audio de respuesta en base64 (para frontend)
 # ═══════════════════════════════════════════════════════════════════
 
 @router.post("/synthesize-base64")
 async def synthesize_text_base64_endpoint(
-    text: str = Body(..., embed=True)
+    request: Request,
+    text: str = Body(..., embed=True),
+    audio_format: Optional[str] = Query(None, alias="format", description="mp3, ogg_opus o linear16")
 ):
     """
     Igual que /synthesize pero devuelve el audio en base64 (útil para frontend).
@@ -303,7 +623,8 @@ async def synthesize_text_base64_endpoint(
         if not text or len(text.strip()) == 0:
             raise HTTPException(status_code=400, detail="Texto vacío")
 
-        audio_bytes = services.text_to_speech(text)
+        output_format = _negotiate_audio_format(request, audio_format)
+        audio_bytes = services.text_to_speech(text, audio_format=output_format.name)
         audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
 
         return JSONResponse(
@@ -311,12 +632,16 @@ async def synthesize_text_base64_endpoint(
             content={
                 "success": True,
                 "audio_base64": audio_base64,
+                "audio_format": output_format.name,
+                "content_type": output_format.media_type,
                 "text": text,
                 "size_bytes": len(audio_bytes),
                 "message": "Audio generado exitosamente"
             }
         )
 
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
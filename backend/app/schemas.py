@@ -658,6 +658,28 @@ class EmpresaDetailOutPublic(BaseModel):
     class Config:
         from_attributes = True
 
+class ServicioPoloDirectoryOut(BaseModel):
+    nombre: str
+    horario: Optional[str]
+    tipo_servicio_polo: Optional[str]
+    lotes: Optional[List["LoteOut"]] = None
+
+class EmpresaDirectoryItem(BaseModel):
+    """Empresa del directorio paginado: las relaciones solo vienen si se piden con include="""
+    nombre: str
+    rubro: str
+    fecha_ingreso: date
+    horario_trabajo: str
+    contactos: Optional[List[ContactoOutPublic]] = None
+    servicios_polo: Optional[List[ServicioPoloDirectoryOut]] = None
+
+class EmpresaDirectoryPage(BaseModel):
+    """Página del directorio con cursor opaco para pedir la siguiente"""
+    items: List[EmpresaDirectoryItem]
+    total: int
+    limit: int
+    next_cursor: Optional[str] = None
+
 class PoloSelfUpdate(BaseModel):
     """Schema para actualizar datos del polo por sí mismo"""
     cant_empleados: int
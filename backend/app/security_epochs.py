@@ -0,0 +1,227 @@
+#app/security_epochs.py
+"""
+Claims de rol y empresa en el access token, con revocación por época.
+
+El login ya verifica usuario activo, empresa activa y roles; ahora esos
+datos viajan firmados en el token (`uid`, `email`, `cuil`, `roles`) junto
+con la época de seguridad del usuario (`ep`). get_current_user arma el
+Principal desde el token sin consultar al usuario y solo compara la época:
+
+- `epoca_seguridad_usuario` guarda una época por usuario (sin fila = 0).
+  Un listener de sesión la incrementa, en la misma transacción, cuando se
+  inhabilita un usuario, cambia su contraseña, nombre o empresa, se le
+  agrega o quita un rol, o se desactiva su empresa.
+- Un token con una época menor a la actual queda revocado (401), igual que
+  el de un usuario que ya no existe (eliminado: su fila de época se borra
+  en cascada, así que la ausencia del usuario es la revocación).
+- Para verificar, la época se cachea por usuario (LRU de hasta
+  SECURITY_EPOCH_CACHE_MAX_ENTRIES) durante SECURITY_EPOCH_CACHE_TTL_SECONDS:
+  una consulta por usuario e intervalo y no una por petición. Un commit
+  local invalida a los usuarios afectados al instante; el TTL acota la
+  demora entre instancias.
+- Al emitir un token la época se lee siempre de la base: con la cache, un
+  login en un worker justo después de un cambio hecho en otro podía llevar
+  una época vieja y quedar revocado al refrescarse.
+
+Los tokens sin estos claims (emitidos antes, o por /check-remember con
+cookie) siguen validándose contra la base con app/principals.py.
+"""
+
+import itertools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import database, models
+from app.principals import Principal
+
+SECURITY_EPOCH_CACHE_TTL_SECONDS = float(os.getenv("SECURITY_EPOCH_CACHE_TTL_SECONDS", "5"))
+SECURITY_EPOCH_CACHE_MAX_ENTRIES = int(os.getenv("SECURITY_EPOCH_CACHE_MAX_ENTRIES", "4096"))
+
+Epoch = models.EpocaSeguridadUsuario
+
+# Claims que agrega token_claims; si falta alguno se valida contra la base
+CLAIM_KEYS = ("uid", "email", "cuil", "roles", "ep")
+
+# Cambios en Usuario que revocan los tokens ya emitidos
+_REVOKING_FIELDS = ("estado", "contrasena", "nombre", "cuil")
+
+
+def load_epoch(db: Session, id_usuario: UUID) -> Optional[int]:
+    """Época en la base (sin fila = 0), o None si el usuario no existe."""
+    return db.execute(
+        select(func.coalesce(Epoch.epoca, 0))
+        .select_from(models.Usuario)
+        .outerjoin(Epoch, Epoch.id_usuario == models.Usuario.id_usuario)
+        .where(models.Usuario.id_usuario == id_usuario)
+    ).scalar()
+
+
+class EpochCache:
+    """LRU con TTL {id_usuario: época}; None = el usuario no existe."""
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[UUID, tuple]" = OrderedDict()
+        self._generation = 0
+
+    def epoch(self, db: Session, id_usuario: UUID) -> Optional[int]:
+        with self._lock:
+            entry = self._entries.get(id_usuario)
+            if entry is not None and time.monotonic() < entry[1]:
+                self._entries.move_to_end(id_usuario)
+                return entry[0]
+            generation = self._generation
+        epoch = load_epoch(db, id_usuario)
+        if self.ttl_seconds > 0:
+            with self._lock:
+                # Si hubo una invalidación mientras se leía, no guardar lo leído
+                if generation == self._generation:
+                    self._entries[id_usuario] = (epoch, time.monotonic() + self.ttl_seconds)
+                    self._entries.move_to_end(id_usuario)
+                    while len(self._entries) > self.max_entries:
+                        self._entries.popitem(last=False)
+        return epoch
+
+    def invalidate(self, user_ids=None) -> None:
+        """Olvidar los usuarios dados (o todos)."""
+        with self._lock:
+            self._generation += 1
+            if user_ids is None:
+                self._entries.clear()
+            else:
+                for id_usuario in user_ids:
+                    self._entries.pop(id_usuario, None)
+
+
+epoch_cache = EpochCache(SECURITY_EPOCH_CACHE_TTL_SECONDS, SECURITY_EPOCH_CACHE_MAX_ENTRIES)
+
+
+def current_epoch(db: Session, id_usuario: UUID) -> Optional[int]:
+    """Época vigente para verificar tokens (cacheada), o None si el usuario no existe."""
+    return epoch_cache.epoch(db, id_usuario)
+
+# ═══════════════════════════════════════════════════════════════════
+# CLAIMS DEL TOKEN
+# ═══════════════════════════════════════════════════════════════════
+
+def token_claims(db: Session, principal: Principal) -> dict:
+    """Claims para services.create_access_token (además de `sub`)."""
+    return {
+        "uid": str(principal.id_usuario),
+        "email": principal.email,
+        "cuil": principal.cuil,
+        "roles": list(principal.roles),
+        # Sin cache: la época puede haber cambiado en otro worker
+        "ep": load_epoch(db, principal.id_usuario) or 0,
+    }
+
+
+def principal_from_claims(payload: dict) -> Optional[Principal]:
+    """Principal armado desde un token con claims, o None si no los tiene."""
+    if not all(key in payload for key in CLAIM_KEYS):
+        return None
+    try:
+        id_usuario = UUID(payload["uid"])
+    except (TypeError, ValueError):
+        return None
+    # Usuario y empresa estaban activos al emitirlo; cualquier baja
+    # posterior incrementa la época y revoca el token
+    return Principal(
+        id_usuario=id_usuario,
+        nombre=payload["sub"],
+        email=payload["email"],
+        cuil=payload["cuil"],
+        estado=True,
+        empresa_estado=True,
+        roles=tuple(payload["roles"]),
+    )
+
+
+def is_current(db: Session, id_usuario: UUID, token_epoch: int) -> bool:
+    epoch = current_epoch(db, id_usuario)
+    return epoch is not None and token_epoch >= epoch
+
+# ═══════════════════════════════════════════════════════════════════
+# INCREMENTO DE ÉPOCA EN CADA FLUSH
+# ═══════════════════════════════════════════════════════════════════
+
+def bump(conn, user_ids) -> None:
+    """Incrementar la época de los usuarios dados (misma transacción)."""
+    user_ids = sorted(set(user_ids), key=str)
+    if not user_ids:
+        return
+    database.insert_ignore(conn, Epoch.__table__, [{"id_usuario": uid, "epoca": 0} for uid in user_ids])
+    conn.execute(
+        update(Epoch).where(Epoch.id_usuario.in_(user_ids)).values(epoca=Epoch.epoca + 1)
+    )
+
+
+def _revoked_users(session: Session) -> set:
+    user_ids, cuils = set(), set()
+    # Rehash de la misma contraseña al loguear (hashing_policy.apply_rehash)
+    rehashed = session.info.get("password_rehash", set())
+    for obj in session.dirty:
+        if isinstance(obj, models.Usuario):
+            attrs = inspect(obj).attrs
+            fields = _REVOKING_FIELDS
+            if obj.id_usuario in rehashed:
+                fields = tuple(name for name in fields if name != "contrasena")
+            if any(getattr(attrs, name).history.has_changes() for name in fields):
+                user_ids.add(obj.id_usuario)
+        elif isinstance(obj, models.Empresa) and inspect(obj).attrs.estado.history.has_changes():
+            cuils.add(obj.cuil)
+    for obj in itertools.chain(session.new, session.deleted, session.dirty):
+        if isinstance(obj, models.RolUsuario):
+            user_ids.add(obj.id_usuario)
+    if cuils:
+        user_ids.update(session.connection().execute(
+            select(models.Usuario.id_usuario).where(models.Usuario.cuil.in_(cuils))
+        ).scalars())
+    # Usuarios eliminados: su fila se borra en cascada y la ausencia del
+    # usuario ya revoca sus tokens (ver _deleted_users)
+    deleted = _deleted_users(session)
+    return {uid for uid in user_ids if uid is not None} - deleted
+
+
+def _deleted_users(session: Session) -> set:
+    return {obj.id_usuario for obj in session.deleted if isinstance(obj, models.Usuario)}
+
+
+@event.listens_for(Session, "after_flush")
+def _bump_epochs_after_flush(session, flush_context):
+    tracked = (models.Usuario, models.RolUsuario, models.Empresa)
+    if not any(isinstance(obj, tracked) for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        return
+    user_ids = _revoked_users(session)
+    if user_ids:
+        bump(session.connection(), user_ids)
+    affected = user_ids | _deleted_users(session)
+    if affected:
+        # Se invalidan en la cache al confirmar (el eliminado pasa a None)
+        session.info.setdefault("security_epochs_bumped", set()).update(affected)
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_epoch_cache(session):
+    session.info.pop("password_rehash", None)
+    user_ids = session.info.pop("security_epochs_bumped", None)
+    if user_ids:
+        epoch_cache.invalidate(user_ids)
+
+@event.listens_for(Session, "after_rollback")
+def _discard_epoch_changes(session):
+    session.info.pop("password_rehash", None)
+    session.info.pop("security_epochs_bumped", None)
+
+
+def ensure_schema(engine) -> None:
+    """Crear la tabla de épocas si no existe (no hay migraciones)."""
+    Epoch.__table__.create(bind=engine, checkfirst=True)
@@ -8,46 +8,163 @@ import hashlib
 import uuid
 import secrets
 import string
-import smtplib
 import io
 import base64
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from typing import List, Dict, Optional, Set, Tuple
+import contextvars
+import statistics
+import time
+import threading
+import tracemalloc
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import List, Dict, Optional, Tuple
 from pathlib import Path
 from datetime import datetime, timedelta, date
 from dotenv import load_dotenv
-from passlib.context import CryptContext
 from sqlalchemy.orm import Session
-from sqlalchemy import inspect
+from sqlalchemy import delete, inspect, select, true
 from sqlalchemy.sql import text
 from jose import jwt, JWTError, ExpiredSignatureError
 from fastapi import HTTPException
 import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from app.config import SECRET_KEY, ALGORITHM
-from app import models
+from app import models, audio_processing, database, email_outbox, reset_tokens, voice_providers, voice_tickets
+from app.hashing import password_hasher, pwd_context
 from app.models import Empresa, PasswordHistory
 
 # ═══════════════════════════════════════════════════════════════════
 # CONFIGURACIÓN Y CONSTANTES
 # ═══════════════════════════════════════════════════════════════════
 
-# Cache en memoria para tokens usados (en producción usar Redis)
-USED_RESET_TOKENS: Set[str] = set()
+# Tokens de recuperación ya usados, hasta su expiración (ver app/reset_tokens.py)
+USED_RESET_TOKENS = reset_tokens.consumed_tokens
 
 # Cargar variables de entorno
 env_path = Path(__file__).resolve().parent.parent / ".env"
 load_dotenv(dotenv_path=env_path)
 
-# Configuración de contraseñas
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# Configuración de contraseñas: bcrypt corre en el pool de app/hashing.py
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
 
 # Configurar API Key de Google Gemini
 api_key = os.getenv("GOOGLE_API_KEY")
 genai.configure(api_key=api_key)
 
+# ═══════════════════════════════════════════════════════════════════
+# PERFILES DE GENERACIÓN POR CANAL (texto / voz)
+# ═══════════════════════════════════════════════════════════════════
+
+TEXT_CHANNEL = "text"
+VOICE_CHANNEL = "voice"
+
+@dataclass(frozen=True)
+class ChannelProfile:
+    """Configuración de Gemini y estilo de respuesta para un canal."""
+    name: str
+    generation_config: GenerationConfig
+    max_rows: int
+    style_instructions: str
+
+CHANNEL_PROFILES: Dict[str, ChannelProfile] = {
+    TEXT_CHANNEL: ChannelProfile(
+        name=TEXT_CHANNEL,
+        generation_config=GenerationConfig(
+            temperature=0.3,
+            top_p=0.9,
+            max_output_tokens=1024,
+            stop_sequences=None,
+            candidate_count=1,
+        ),
+        max_rows=6,
+        style_instructions=(
+            "- Cuando haya resultados, menciónalos en texto corrido o en una lista corta usando guiones. "
+            "En las listas, prioriza que cada guion comience directamente con el nombre "
+            "(ejemplo: \"- Logistica Express S.A.: dato relevante\"). Evita prefijos.\n"
+            "- Si hay más de seis coincidencias, indica cuántas hay y describe las seis más representativas. \n"
+            "- Evita cualquier caracter de viñeta distinto a los guiones y no utilices asteriscos ni texto en negrita. "
+        ),
+    ),
+    # Respuestas más cortas: se generan y se sintetizan más rápido en el tótem
+    VOICE_CHANNEL: ChannelProfile(
+        name=VOICE_CHANNEL,
+        generation_config=GenerationConfig(
+            temperature=0.3,
+            top_p=0.9,
+            max_output_tokens=int(os.getenv("VOICE_MAX_OUTPUT_TOKENS", "256")),
+            stop_sequences=None,
+            candidate_count=1,
+        ),
+        max_rows=int(os.getenv("VOICE_MAX_ROWS", "3")),
+        style_instructions=(
+            "- La respuesta se va a leer en voz alta: usa como máximo tres oraciones cortas y fáciles de escuchar.\n"
+            "- No uses listas, guiones, viñetas, asteriscos, emojis, URLs ni abreviaturas.\n"
+            "- Si hay varias coincidencias, di cuántas hay en total y nombra solo las más representativas "
+            "de la información disponible. "
+        ),
+    ),
+}
+
+def get_channel_profile(channel: Optional[str]) -> ChannelProfile:
+    """Perfil del canal pedido (texto por defecto)."""
+    return CHANNEL_PROFILES.get(channel or TEXT_CHANNEL, CHANNEL_PROFILES[TEXT_CHANNEL])
+
+
+class ChannelMetrics:
+    """Latencia del chatbot y caracteres enviados a TTS por canal (ventana acotada)."""
+
+    WINDOW = 500
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._data: Dict[str, dict] = {}
+
+    def _channel(self, channel: str) -> dict:
+        return self._data.setdefault(channel, {
+            "requests": 0,
+            "latencies_ms": deque(maxlen=self.WINDOW),
+            "tts_requests": 0,
+            "tts_characters": 0,
+        })
+
+    def record_latency(self, channel: str, elapsed_ms: float) -> None:
+        with self._lock:
+            data = self._channel(channel)
+            data["requests"] += 1
+            data["latencies_ms"].append(elapsed_ms)
+
+    def record_tts(self, channel: str, text: str) -> None:
+        with self._lock:
+            data = self._channel(channel)
+            data["tts_requests"] += 1
+            data["tts_characters"] += len(text)
+
+    def reset(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = {}
+            for channel, data in self._data.items():
+                latencies = sorted(data["latencies_ms"])
+                result[channel] = {
+                    "requests": data["requests"],
+                    "latency_ms_median": round(statistics.median(latencies), 1) if latencies else None,
+                    "latency_ms_p95": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+                    "tts_requests": data["tts_requests"],
+                    "tts_characters": data["tts_characters"],
+                    "tts_characters_avg": (
+                        round(data["tts_characters"] / data["tts_requests"], 1) if data["tts_requests"] else None
+                    ),
+                }
+            return result
+
+
+channel_metrics = ChannelMetrics()
+
 def _init_gemini_model() -> genai.GenerativeModel:
     """
     Intenta inicializar el modelo de Gemini probando varios identificadores.
@@ -83,13 +200,7 @@ def _init_gemini_model() -> genai.GenerativeModel:
             print(f" Inicializando modelo Gemini: {candidate}")
             return genai.GenerativeModel(
                 model_name=candidate,
-                generation_config=GenerationConfig(
-                    temperature=0.3,
-                    top_p=0.9,
-                    max_output_tokens=1024,
-                    stop_sequences=None,
-                    candidate_count=1,
-                ),
+                generation_config=CHANNEL_PROFILES[TEXT_CHANNEL].generation_config,
             )
         except Exception as exc:
             print(f"  No se pudo inicializar {candidate}: {exc}")
@@ -129,17 +240,73 @@ except ImportError:
     VOICE_PROVIDER = None
     print(" google-cloud-speech/texttospeech no instalados")
 
+# Proveedores locales para tests, benchmarks y pruebas de carga sin credenciales
+if voice_providers.configured_provider_name() == voice_providers.FAKE:
+    VOICE_PROVIDER = voice_providers.FAKE
+    print(" Servicios de voz simulados (VOICE_PROVIDER=fake)")
+
+# Permite forzar un proveedor solo para la petición en curso (p. ej. perfilado con fakes)
+_voice_provider_override: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar(
+    "voice_provider_override", default=None
+)
+
+
+# STT fake propio de un bloque (el perfilado guiona uno local sin tocar el compartido)
+_fake_speech_to_text_override: contextvars.ContextVar[Optional[voice_providers.FakeSpeechToText]] = contextvars.ContextVar(
+    "fake_speech_to_text_override", default=None
+)
+
+
+def _fake_speech_to_text() -> voice_providers.FakeSpeechToText:
+    return _fake_speech_to_text_override.get() or voice_providers.fake_speech_to_text
+
+
+def active_voice_provider() -> Optional[str]:
+    """Proveedor de voz efectivo para el contexto actual."""
+    return _voice_provider_override.get() or VOICE_PROVIDER
+
+
+@contextmanager
+def use_voice_provider(name: Optional[str]):
+    """Usar otro proveedor de voz dentro del bloque sin tocar la configuración global."""
+    token = _voice_provider_override.set(name)
+    try:
+        yield
+    finally:
+        _voice_provider_override.reset(token)
+
+# recognize sincrónico rechaza audios de más de ~60 s: por encima de este
+# límite se segmenta y se reconoce en paralelo
+SYNC_RECOGNIZE_MAX_SECONDS = float(os.getenv("VOICE_SYNC_MAX_SECONDS", "55"))
+STT_MAX_WORKERS = int(os.getenv("VOICE_STT_MAX_WORKERS", "4"))
+_stt_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_stt_executor() -> ThreadPoolExecutor:
+    """Pool compartido y acotado para reconocer segmentos de audios largos."""
+    global _stt_executor
+    if _stt_executor is None:
+        _stt_executor = ThreadPoolExecutor(max_workers=STT_MAX_WORKERS, thread_name_prefix="stt")
+    return _stt_executor
+
 # ═══════════════════════════════════════════════════════════════════
 # UTILIDADES DE AUTENTICACIÓN Y CONTRASEÑAS
 # ═══════════════════════════════════════════════════════════════════
 
 def hash_password(password: str) -> str:
-    """Hashear contraseña usando bcrypt"""
-    return pwd_context.hash(password)
+    """Hashear contraseña usando bcrypt (en el pool de app/hashing.py)"""
+    return password_hasher.hash(password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    """Verificar contraseña contra su hash"""
-    return pwd_context.verify(plain_password, hashed_password)
+    """Verificar contraseña contra su hash (en el pool de app/hashing.py)"""
+    return password_hasher.verify(plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verificar y, si el hash no cumple la política de app/hashing_policy.py
+    (esquema o costo), devolver también uno nuevo para guardar.
+    """
+    return password_hasher.verify_and_update(plain_password, hashed_password)
 
 def create_access_token(data: dict, expires_delta: timedelta | None = None) -> str:
     """Crear token JWT de acceso"""
@@ -200,13 +367,9 @@ def is_token_already_used(token_id: str) -> bool:
     """Verificar si el token ya fue usado"""
     return token_id in USED_RESET_TOKENS
 
-def mark_token_as_used(token_id: str) -> None:
-    """Marcar un token como usado"""
-    USED_RESET_TOKENS.add(token_id)
-    
-    # Limpiar tokens viejos para no llenar la memoria
-    if len(USED_RESET_TOKENS) > 1000:  # Límite arbitrario
-        USED_RESET_TOKENS.clear()
+def mark_token_as_used(token_id: str, expires_at: Optional[float] = None) -> bool:
+    """Marcar un token como usado hasta su `exp`; False si ya lo estaba"""
+    return USED_RESET_TOKENS.consume(token_id, expires_at)
 
 def verify_password_reset_token(token: str) -> str:
     """Verificar token de recuperación y devolver el email (sin consumir)"""
@@ -272,17 +435,14 @@ def consume_password_reset_token(token: str) -> str:
         if not email or not token_id:
             raise HTTPException(status_code=401, detail="Token inválido")
         
-        # Verificar si ya fue usado
-        if is_token_already_used(token_id):
+        # Verificar y marcar como usado en un solo paso (atómico entre workers)
+        if not mark_token_as_used(token_id, payload.get("exp")):
             raise HTTPException(
                 status_code=400,
                 detail="Este enlace de recuperación ya fue utilizado. Solicita uno nuevo.",
                 headers={"X-Error-Type": "used"}
             )
         
-        # Marcar como usado inmediatamente
-        mark_token_as_used(token_id)
-        
         return email
         
     except ExpiredSignatureError:
@@ -331,20 +491,22 @@ def check_token_validity(token: str) -> dict:
             "message": "Token inválido"
         }
 
-def cleanup_used_tokens():
-    """Limpiar cache de tokens usados"""
-    global USED_RESET_TOKENS
-    USED_RESET_TOKENS.clear()
-    print("Cache de tokens usados limpiado")
-
-def get_used_tokens_count() -> int:
-    """Obtener cantidad de tokens usados en memoria"""
-    return len(USED_RESET_TOKENS)
-
 # ═══════════════════════════════════════════════════════════════════
 # HISTORIAL DE CONTRASEÑAS
 # ═══════════════════════════════════════════════════════════════════
 
+PASSWORD_HISTORY_SIZE = 5
+
+
+def _recent_history_ids(user_id):
+    """Subconsulta con los ids de las últimas PASSWORD_HISTORY_SIZE contraseñas."""
+    return (
+        select(PasswordHistory.id)
+        .where(PasswordHistory.id_usuario == user_id)
+        .order_by(PasswordHistory.created_at.desc(), PasswordHistory.id.desc())
+        .limit(PASSWORD_HISTORY_SIZE)
+    )
+
 def save_password_to_history(db: Session, user_id: str, password_hash: str) -> None:
     """Guarda una contraseña en el historial del usuario"""
     password_entry = PasswordHistory(
@@ -353,41 +515,44 @@ def save_password_to_history(db: Session, user_id: str, password_hash: str) -> N
         created_at=date.today()
     )
     db.add(password_entry)
-    
-    # Mantener solo las últimas 5 contraseñas para no llenar la BD
-    old_passwords = (
-        db.query(PasswordHistory)
-        .filter(PasswordHistory.id_usuario == user_id)
-        .order_by(PasswordHistory.created_at.desc())
-        .offset(5)
-        .all()
+    db.flush()
+
+    # Mantener solo las últimas 5 contraseñas: un único DELETE por índice
+    # (id_usuario, created_at desc) en vez de cargar y borrar fila por fila
+    db.execute(
+        delete(PasswordHistory)
+        .where(
+            PasswordHistory.id_usuario == user_id,
+            PasswordHistory.id.not_in(_recent_history_ids(user_id).scalar_subquery()),
+        )
+        .execution_options(synchronize_session=False)
     )
-    
-    for old_pwd in old_passwords:
-        db.delete(old_pwd)
 
 def is_password_reused(db: Session, user_id: str, new_password: str) -> bool:
     """Verifica si la nueva contraseña ya fue utilizada anteriormente"""
-    # Obtener historial de contraseñas del usuario (últimas 5)
-    password_history = (
-        db.query(PasswordHistory)
-        .filter(PasswordHistory.id_usuario == user_id)
-        .order_by(PasswordHistory.created_at.desc())
-        .limit(5)
-        .all()
+    # Contraseña actual y últimas 5 del historial en una sola consulta
+    recent = (
+        select(PasswordHistory.password_hash)
+        .where(PasswordHistory.id.in_(_recent_history_ids(user_id).scalar_subquery()))
+        .subquery()
     )
-    
-    # Verificar si alguna coincide con la nueva contraseña
-    for pwd_entry in password_history:
-        if verify_password(new_password, pwd_entry.password_hash):
-            return True
-    
-    # También verificar contra la contraseña actual del usuario
-    current_user = db.query(models.Usuario).filter(models.Usuario.id_usuario == user_id).first()
-    if current_user and verify_password(new_password, current_user.contrasena):
-        return True
-    
-    return False
+    rows = db.execute(
+        select(models.Usuario.contrasena, recent.c.password_hash)
+        .select_from(models.Usuario)
+        .outerjoin(recent, true())
+        .where(models.Usuario.id_usuario == user_id)
+    ).all()
+    hashes = [row.password_hash for row in rows if row.password_hash]
+    if rows:
+        hashes.append(rows[0].contrasena)
+
+    # Las verificaciones corren en paralelo y cortan en la primera coincidencia
+    return password_hasher.verify_any(new_password, hashes)
+
+def ensure_password_history_index(engine) -> None:
+    """Crear el índice del historial si no existe (no hay migraciones)."""
+    for index in PasswordHistory.__table__.indexes:
+        index.create(bind=engine, checkfirst=True)
 
 def forgot_password_reset_confirm(
     db: Session,
@@ -420,15 +585,9 @@ def forgot_password_reset_confirm(
                 detail="No puedes usar una contraseña que ya hayas utilizado anteriormente. Elige una contraseña diferente."
             )
         
-        # 5. AHORA SÍ marcar el token como usado MANUALMENTE
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            token_id = payload.get("jti")
-            if token_id:
-                mark_token_as_used(token_id)
-        except:
-            # Si hay error decodificando, es raro pero continuamos
-            pass
+        # 5. AHORA SÍ consumir el token: verificar y marcar en un solo paso
+        #    (si otra confirmación con el mismo enlace ganó, responde "ya fue utilizado")
+        consume_password_reset_token(token)
         
         # 6. Guardar contraseña actual en historial
         save_password_to_history(db, user.id_usuario, user.contrasena)
@@ -491,15 +650,9 @@ def secure_password_reset_confirm(
                 detail="No puedes usar una contraseña que ya hayas utilizado anteriormente. Elige una contraseña diferente."
             )
         
-        # 6. AHORA SÍ marcar el token como usado MANUALMENTE
-        try:
-            payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-            token_id = payload.get("jti")
-            if token_id:
-                mark_token_as_used(token_id)
-        except:
-            # Si hay error decodificando, es raro pero continuamos
-            pass
+        # 6. AHORA SÍ consumir el token: verificar y marcar en un solo paso
+        #    (si otra confirmación con el mismo enlace ganó, responde "ya fue utilizado")
+        consume_password_reset_token(token)
         
         # 7. Guardar contraseña actual en historial
         save_password_to_history(db, user.id_usuario, user.contrasena)
@@ -524,29 +677,13 @@ def secure_password_reset_confirm(
             detail=f"Error interno al actualizar contraseña: {str(e)}"
         )
 
-def send_password_change_notification(email: str, nombre: str) -> bool:
-    """Envía notificación por email cuando se cambia la contraseña desde la web"""
-    try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_user = os.getenv("EMAIL_USER")
-        smtp_password = os.getenv("EMAIL_PASS")
-        
-        if not smtp_user or not smtp_password:
-            print("Configuración SMTP no encontrada")
-            return False
-            
-        # Crear el mensaje
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = email
-        msg['Subject'] = "Contraseña Cambiada - Polo 52"
-        
-        # Obtener fecha y hora actual
-        fecha_cambio = datetime.now().strftime("%d/%m/%Y a las %H:%M")
-        
-        # Cuerpo del email
-        body = f"""
+def send_password_change_notification(db: Session, email: str, nombre: str) -> bool:
+    """Encola la notificación de cambio de contraseña desde la web (app/email_outbox.py)"""
+    # Obtener fecha y hora actual
+    fecha_cambio = datetime.now().strftime("%d/%m/%Y a las %H:%M")
+    
+    # Cuerpo del email
+    body = f"""
 Hola {nombre},
 
 Te informamos que tu contraseña ha sido cambiada exitosamente el {fecha_cambio}.
@@ -566,48 +703,22 @@ RECORDATORIOS DE SEGURIDAD:
 Saludos,
 Administración Polo 52
         """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Enviar el email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_user, email, text)
-        server.quit()
-        
-        print(f"Notificación de cambio de contraseña enviada a {email}")
-        return True
-        
-    except Exception as e:
-        print(f"Error enviando notificación: {str(e)}")
-        return False
+    
+    email_outbox.enqueue(db, email, "Contraseña Cambiada - Polo 52", body)
+    print(f"Notificación de cambio de contraseña encolada para {email}")
+    return True
 
 # ═══════════════════════════════════════════════════════════════════
 # ENVÍO DE EMAILS
 # ═══════════════════════════════════════════════════════════════════
 
-def send_welcome_email(email: str, nombre: str, username: str, password: str) -> bool:
-    """Envía email de bienvenida con credenciales"""
-    try:
-        smtp_server = os.getenv("SMTP_SERVER", "smtp.gmail.com")
-        smtp_port = int(os.getenv("SMTP_PORT", "587"))
-        smtp_user = os.getenv("EMAIL_USER")
-        smtp_password = os.getenv("EMAIL_PASS")
-        
-        if not smtp_user or not smtp_password:
-            print("Configuración SMTP no encontrada")
-            return False
-            
-        # Crear el mensaje
-        msg = MIMEMultipart()
-        msg['From'] = smtp_user
-        msg['To'] = email
-        msg['Subject'] = "Bienvenido al Parque Industrial Polo 52"
-        
-        # Cuerpo del email
-        body = f"""
+def send_welcome_email(db: Session, email: str, nombre: str, username: str, password: str) -> bool:
+    """
+    Encola el email de bienvenida con credenciales en la misma transacción
+    que el alta: lo envía el worker de app/email_outbox.py
+    """
+    # Cuerpo del email
+    body = f"""
 Hola {nombre},
 
 Se le ha creado una nueva cuenta en "Parque Industrial Polo 52".
@@ -627,84 +738,171 @@ Si necesita ayuda, puede contactar con el administrador del sitio.
 Saludos,
 Administración Polo 52
         """
-        
-        msg.attach(MIMEText(body, 'plain'))
-        
-        # Enviar el email
-        server = smtplib.SMTP(smtp_server, smtp_port)
-        server.starttls()
-        server.login(smtp_user, smtp_password)
-        text = msg.as_string()
-        server.sendmail(smtp_user, email, text)
-        server.quit()
-        
-        print(f"Email enviado exitosamente a {email}")
-        return True
-        
-    except Exception as e:
-        print(f"Error enviando email: {str(e)}")
-        return False
+    
+    email_outbox.enqueue(db, email, "Bienvenido al Parque Industrial Polo 52", body)
+    print(f"Email de bienvenida encolado para {email}")
+    return True
 
 
 # ═══════════════════════════════════════════════════════════════════
 # PROCESAMIENTO DE VOZ - SPEECH TO TEXT
 # ═══════════════════════════════════════════════════════════════════
 
-def transcribe_audio_google(audio_content: bytes, language_code: str = "es-ES") -> str:
+def get_speech_to_text_provider() -> Optional[voice_providers.SpeechToTextProvider]:
+    """Proveedor de Speech-to-Text activo (None si no hay ninguno configurado)."""
+    provider = active_voice_provider()
+    if provider == voice_providers.FAKE:
+        return _fake_speech_to_text()
+    if provider == voice_providers.GOOGLE and speech_client:
+        return voice_providers.GoogleSpeechToText(speech_client)
+    return None
+
+def _recognize_with(
+    provider: voice_providers.SpeechToTextProvider,
+    audio_content,
+    language_code: str,
+    encoding: str,
+    sample_rate_hertz: int
+) -> str:
+    """Ejecutar el reconocimiento con el manejo de errores común a todos los proveedores."""
+    try:
+        transcript = provider.recognize(audio_content, language_code, encoding, sample_rate_hertz)
+        print(f" Transcripción {provider.name}: {transcript}")
+        return transcript
+    except Exception as e:
+        print(f" Error en transcripción {provider.name}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=GENERIC_ERROR_MESSAGE
+        )
+
+def transcribe_audio_google(
+    audio_content: bytes,
+    language_code: str = "es-ES",
+    encoding: str = "WEBM_OPUS",
+    sample_rate_hertz: int = 48000
+) -> str:
     """
     Convertir audio a texto usando Google Speech-to-Text
     
     Args:
-        audio_content: Bytes del archivo de audio
+        audio_content: Audio (bytes, memoryview o mmap del upload)
         language_code: Código de idioma (español por defecto)
+        encoding: Codificación del audio (WEBM_OPUS del tótem o LINEAR16 preprocesado)
+        sample_rate_hertz: Frecuencia de muestreo del audio enviado
     
     Returns:
         Texto transcrito
     """
-    try:
-        if not speech_client:
-            raise HTTPException(
-                status_code=503,
-                detail="Servicio de transcripción no disponible"
-            )
-        
-        audio = speech.RecognitionAudio(content=audio_content)
-        
-        config = speech.RecognitionConfig(
-            encoding=speech.RecognitionConfig.AudioEncoding.WEBM_OPUS,
-            sample_rate_hertz=48000,
-            language_code=language_code,
-            enable_automatic_punctuation=True,
-            model="default",
-            use_enhanced=True
-        )
-        
-        response = speech_client.recognize(config=config, audio=audio)
-        
-        if not response.results:
-            return ""
-        
-        transcript = ""
-        for result in response.results:
-            transcript += result.alternatives[0].transcript + " "
-        
-        final_transcript = transcript.strip()
-        print(f" Transcripción Google: {final_transcript}")
-        return final_transcript
-        
-    except Exception as e:
-        print(f" Error en transcripción Google: {str(e)}")
+    if not speech_client:
+        print(" Error en transcripción Google: cliente no configurado")
         raise HTTPException(
             status_code=500,
             detail=GENERIC_ERROR_MESSAGE
         )
+    return _recognize_with(
+        voice_providers.GoogleSpeechToText(speech_client),
+        audio_content,
+        language_code,
+        encoding,
+        sample_rate_hertz
+    )
+
+def recognize_speech(
+    audio_content,
+    language_code: str = "es-ES",
+    encoding: str = "WEBM_OPUS",
+    sample_rate_hertz: int = 48000
+) -> str:
+    """Reconocer un audio con el proveedor activo (Google o el fake local)."""
+    if active_voice_provider() == voice_providers.FAKE:
+        return _recognize_with(
+            _fake_speech_to_text(),
+            audio_content,
+            language_code,
+            encoding,
+            sample_rate_hertz
+        )
+    return transcribe_audio_google(
+        audio_content,
+        language_code,
+        encoding=encoding,
+        sample_rate_hertz=sample_rate_hertz
+    )
+
+def transcribe_segments(segments: List["audio_processing.PreparedAudio"], language_code: str = "es-ES") -> str:
+    """
+    Reconocer segmentos en paralelo (pool acotado) y unir las transcripciones en orden.
+
+    Si algún segmento falla se propaga el mismo error que en la transcripción simple.
+    """
+    if not segments:
+        return ""
+    if len(segments) == 1:
+        segment = segments[0]
+        return recognize_speech(
+            segment.content,
+            language_code,
+            encoding=segment.encoding,
+            sample_rate_hertz=segment.sample_rate_hertz
+        )
+
+    print(f" Audio largo: reconociendo {len(segments)} segmentos en paralelo")
+    # Cada segmento corre con una copia del contexto para respetar el proveedor forzado
+    context = contextvars.copy_context()
+    transcripts = _get_stt_executor().map(
+        lambda segment: context.copy().run(
+            recognize_speech,
+            segment.content,
+            language_code,
+            encoding=segment.encoding,
+            sample_rate_hertz=segment.sample_rate_hertz
+        ),
+        segments,
+    )
+    return " ".join(part for part in transcripts if part).strip()
+
 
-def transcribe_audio(audio_content: bytes, language_code: str = "es-ES") -> str:
+def transcribe_audio(audio_content: bytes, language_code: str = "es-ES", long_audio: bool = False) -> str:
     """
-    Transcribir audio usando Google Cloud
+    Transcribir audio con el proveedor activo (Google Cloud o el fake local)
+
+    Antes de enviarlo se preprocesa (recorte de silencio, mono, 16 kHz
+    LINEAR16). Si el audio no se puede decodificar se envía el original.
+    Con `long_audio` (o si el audio supera SYNC_RECOGNIZE_MAX_SECONDS) se
+    divide en silencios y los segmentos se reconocen en paralelo.
     """
-    if VOICE_PROVIDER == "google" and speech_client:
-        return transcribe_audio_google(audio_content, language_code)
+    if get_speech_to_text_provider() is not None:
+        prepared = audio_processing.preprocess_for_stt(audio_content)
+        if prepared is None:
+            if long_audio:
+                print(" Modo audio largo no disponible (audio no decodificable), se envía completo")
+            return recognize_speech(audio_content, language_code)
+
+        if not prepared.content:
+            print(" Audio vacío, se omite la transcripción")
+            return ""
+        if not prepared.has_speech:
+            # El VAD por energía puede fallar (p. ej. sin frames silenciosos): que decida STT
+            print(" No se detectó voz en el audio, se envía sin recortar")
+
+        print(
+            f" Audio preprocesado: {prepared.original_bytes} → {len(prepared.content)} bytes "
+            f"({prepared.trimmed_seconds:.2f}s de silencio recortado)"
+        )
+        if long_audio or prepared.duration_seconds > SYNC_RECOGNIZE_MAX_SECONDS:
+            segments = audio_processing.split_prepared_audio(
+                prepared,
+                max_segment_seconds=min(audio_processing.LONG_AUDIO_SEGMENT_SECONDS, SYNC_RECOGNIZE_MAX_SECONDS)
+            )
+            return transcribe_segments(segments, language_code)
+
+        return recognize_speech(
+            prepared.content,
+            language_code,
+            encoding=prepared.encoding,
+            sample_rate_hertz=prepared.sample_rate_hertz
+        )
 
     raise HTTPException(
         status_code=503,
@@ -770,7 +968,92 @@ def transcribe_audio(audio_content: bytes, language_code: str = "es-ES") -> str:
 # PROCESAMIENTO DE VOZ - TEXT TO SPEECH
 # ═══════════════════════════════════════════════════════════════════
 
-def text_to_speech_google(text: str, language_code: str = "es-ES", voice_name: str = "es-ES-Neural2-A") -> bytes:
+class TTSCache:
+    """
+    Cache LRU en memoria de audios sintetizados, acotada por bytes.
+
+    La clave incluye proveedor, voz, idioma y formato de salida, de modo que
+    el mismo texto en MP3 y en OGG_OPUS se guarda por separado.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple) -> Optional[bytes]:
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return audio
+
+    def put(self, key: tuple, audio: bytes) -> None:
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.size_bytes -= len(previous)
+            self._entries[key] = audio
+            self.size_bytes += len(audio)
+            while self.size_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+TTS_CACHE_MAX_BYTES = int(os.getenv("VOICE_TTS_CACHE_MAX_BYTES", str(16 * 1024 * 1024)))
+tts_cache = TTSCache(TTS_CACHE_MAX_BYTES)
+
+def _synthesize_with(
+    provider: voice_providers.TextToSpeechProvider,
+    text: str,
+    language_code: str = "es-ES",
+    voice_name: str = "es-ES-Neural2-A",
+    audio_format: Optional[voice_providers.AudioFormat] = None
+) -> bytes:
+    """Ejecutar la síntesis con el manejo de errores común a todos los proveedores."""
+    audio_format = audio_format or voice_providers.get_audio_format(None)
+    try:
+        audio_content = provider.synthesize(text, language_code, voice_name, audio_format)
+        print(f" Audio {provider.name} generado: {len(audio_content)} bytes ({audio_format.name})")
+        return audio_content
+    except Exception as e:
+        print(f" Error en síntesis {provider.name}: {str(e)}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Error al generar audio: {str(e)}"
+        )
+
+def text_to_speech_google(
+    text: str,
+    language_code: str = "es-ES",
+    voice_name: str = "es-ES-Neural2-A",
+    audio_format: Optional[voice_providers.AudioFormat] = None
+) -> bytes:
     """
     Convertir texto a voz usando Google Text-to-Speech
     
@@ -778,73 +1061,71 @@ def text_to_speech_google(text: str, language_code: str = "es-ES", voice_name: s
         text: Texto a convertir
         language_code: Código de idioma
         voice_name: Nombre de la voz
+        audio_format: Formato de salida (MP3 por defecto, OGG_OPUS o LINEAR16)
     
     Returns:
-        Bytes del audio en formato MP3
+        Bytes del audio en el formato pedido
     """
-    try:
-        if not tts_client:
-            raise HTTPException(
-                status_code=503,
-                detail="Servicio de síntesis de voz no disponible"
-            )
-        
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-        
-        voice = texttospeech.VoiceSelectionParams(
-            language_code=language_code,
-            name=voice_name,
-            ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
-        )
-        
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3,
-            speaking_rate=1.0,
-            pitch=0.0,
-            volume_gain_db=0.0,
-            effects_profile_id=["headphone-class-device"]
-        )
-        
-        response = tts_client.synthesize_speech(
-            input=synthesis_input,
-            voice=voice,
-            audio_config=audio_config
-        )
-        
-        print(f" Audio Google generado: {len(response.audio_content)} bytes")
-        return response.audio_content
-        
-    except Exception as e:
-        print(f" Error en síntesis Google: {str(e)}")
+    if not tts_client:
+        print(" Error en síntesis Google: cliente no configurado")
         raise HTTPException(
             status_code=500,
-            detail=f"Error al generar audio: {str(e)}"
+            detail="Error al generar audio: Servicio de síntesis de voz no disponible"
         )
+    return _synthesize_with(
+        voice_providers.GoogleTextToSpeech(tts_client), text, language_code, voice_name, audio_format
+    )
 
-def text_to_speech(text: str, voice_provider: str = None) -> bytes:
+def text_to_speech(
+    text: str,
+    voice_provider: str = None,
+    audio_format: Optional[str] = None,
+    use_cache: bool = True
+) -> bytes:
     """
-    Sintetizar voz usando Google Cloud
+    Sintetizar voz con el proveedor activo (Google Cloud o el fake local)
     
     Args:
         text: Texto a sintetizar
-        voice_provider: Proveedor específico (solo se admite 'google')
+        voice_provider: Proveedor específico ('google' o 'fake')
+        audio_format: 'mp3' (por defecto), 'ogg_opus' o 'linear16'
+        use_cache: Reutilizar audios ya sintetizados (cache LRU por formato)
     
     Returns:
-        Bytes del audio MP3
+        Bytes del audio en el formato pedido
     """
-    if voice_provider and voice_provider != "google":
+    if voice_provider and voice_provider not in voice_providers.SUPPORTED_PROVIDERS:
         raise HTTPException(
             status_code=400,
-            detail="Proveedor de voz no soportado. Usa 'google'."
+            detail="Proveedor de voz no soportado. Usa 'google' o 'fake'."
+        )
+
+    try:
+        output_format = voice_providers.get_audio_format(audio_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    provider = voice_provider or active_voice_provider()
+    if provider == voice_providers.FAKE:
+        synthesize = lambda: _synthesize_with(voice_providers.fake_text_to_speech, text, audio_format=output_format)
+    elif provider == voice_providers.GOOGLE and tts_client:
+        synthesize = lambda: text_to_speech_google(text, audio_format=output_format)
+    else:
+        raise HTTPException(
+            status_code=503,
+            detail="No hay servicio de síntesis de voz configurado. Configura GOOGLE_APPLICATION_CREDENTIALS."
         )
 
-    if VOICE_PROVIDER == "google" and tts_client:
-        return text_to_speech_google(text)
+    if not use_cache:
+        return synthesize()
 
-    raise HTTPException(
-        status_code=503,
-        detail="No hay servicio de síntesis de voz configurado. Configura GOOGLE_APPLICATION_CREDENTIALS."
-    )
+    cache_key = (provider, "es-ES", "es-ES-Neural2-A", output_format, text)
+    cached = tts_cache.get(cache_key)
+    if cached is not None:
+        return cached
+    audio_content = synthesize()
+    tts_cache.put(cache_key, audio_content)
+    return audio_content
 
 # -------------------------------------------------------------------
 # STREAMING TTS (Opcional)
@@ -922,6 +1203,8 @@ def execute_sql_query(db: Session, query: str) -> List[Dict]:
         if not query.strip().lower().startswith("select"):
             print(f"Consulta no permitida: {query}")
             return [{"error": GENERIC_ERROR_MESSAGE}]
+        # El SQL generado por el modelo corre con los timeouts estrictos del rol chatbot
+        database.apply_role_timeouts(db, database.ROLE_CHATBOT)
         result = db.execute(text(query), execution_options={"no_cache": True})
         columns = result.keys()
         raw_results = [dict(zip(columns, row)) for row in result.fetchall()]
@@ -1013,10 +1296,16 @@ def extract_text_from_gemini(response) -> Optional[str]:
                 return combined
     return None
 
-def compose_fallback_response(db_results: List[Dict]) -> Optional[str]:
+def compose_fallback_response(
+    db_results: List[Dict],
+    max_rows: int = 6,
+    speakable: bool = False
+) -> Optional[str]:
     """
     Generar una respuesta simple basada directamente en los datos obtenidos.
     Útil cuando el modelo no devuelve texto pero ya contamos con resultados.
+
+    Con `speakable=True` (canal de voz) se arma texto corrido sin guiones.
     """
     if not db_results:
         return None
@@ -1024,7 +1313,7 @@ def compose_fallback_response(db_results: List[Dict]) -> Optional[str]:
     if isinstance(db_results[0], dict) and db_results[0].get("error"):
         return None
 
-    visible_rows = db_results[:6]
+    visible_rows = db_results[:max_rows]
     total = len(db_results)
 
     formatted_rows: List[str] = []
@@ -1085,6 +1374,8 @@ def compose_fallback_response(db_results: List[Dict]) -> Optional[str]:
         if total > len(visible_rows)
         else f"Encontré {total} registros:"
     )
+    if speakable:
+        return f"{header} " + ". ".join(row[2:].rstrip(".") for row in formatted_rows) + "."
     formatted_rows.insert(0, header)
     return "\n".join(formatted_rows)
 
@@ -1111,8 +1402,34 @@ def parse_intent_json(response) -> Tuple[Optional[dict], Optional[str]]:
             return None, raw_text
 
 
-def get_chat_response(db: Session, message: str, history: List[Dict[str, str]] = None):
-    """Generar respuesta del chatbot usando Gemini AI"""
+def get_chat_response(
+    db: Session,
+    message: str,
+    history: List[Dict[str, str]] = None,
+    channel: str = TEXT_CHANNEL
+):
+    """
+    Generar respuesta del chatbot usando Gemini AI
+
+    `channel` elige el perfil de generación: "text" (chat) o "voice"
+    (respuestas cortas y fáciles de leer en voz alta). La latencia se
+    registra por canal en `channel_metrics`.
+    """
+    profile = get_channel_profile(channel)
+    start = time.perf_counter()
+    try:
+        return _generate_chat_response(db, message, history, profile)
+    finally:
+        channel_metrics.record_latency(profile.name, (time.perf_counter() - start) * 1000)
+
+
+def _generate_chat_response(
+    db: Session,
+    message: str,
+    history: Optional[List[Dict[str, str]]],
+    profile: ChannelProfile
+):
+    """Intención → SQL → respuesta natural, con el perfil de generación del canal."""
     try:
         user_input = normalize_text(message)
         chat_history = ""
@@ -1203,8 +1520,14 @@ JSON:"""
                 intent_data.get("corrected_entity")
             )
         
-        results_text = json.dumps(db_results, ensure_ascii=False, default=custom_json_serializer)
-        input_text = f"Resultados de la consulta:\n{results_text}\nPregunta:\n{message}"
+        # Solo las filas más representativas llegan al prompt (menos tokens en voz)
+        prompt_rows = db_results[:profile.max_rows]
+        results_text = json.dumps(prompt_rows, ensure_ascii=False, default=custom_json_serializer)
+        total_note = (
+            f"Total de coincidencias: {len(db_results)} (se muestran {len(prompt_rows)})\n"
+            if len(db_results) > len(prompt_rows) else ""
+        )
+        input_text = f"Resultados de la consulta:\n{total_note}{results_text}\nPregunta:\n{message}"
 
         # Prompt para respuesta natural
         final_prompt = f"""
@@ -1219,23 +1542,26 @@ Historial:
 - INSTRUCCIONES IMPORTANTES: 
 - Solo responde consultas sobre el Parque Industrial Polo 52 cargada en mi base de datos. Si la consulta es ajena, responde textualmente: "Solo puedo ayudarte con información del Parque Industrial Polo 52." 
 - Responde de forma natural, directa y segura, usando un tono informativo. No cierres la respuesta con preguntas ni pidas más detalles. 
-- Cuando haya resultados, menciónalos en texto corrido o en una lista corta usando guiones. En las listas, prioriza que cada guion comience directamente con el nombre (ejemplo: "- Logistica Express S.A.: dato relevante"). Evita prefijos.
-- Si hay más de seis coincidencias, indica cuántas hay y describe las seis más representativas. 
+{profile.style_instructions}
 - Si no encuentras información, indícalo claramente y ofrece una alternativa relacionada con el parque (por ejemplo, sugerir otro rubro o empresa) sin agregar preguntas. 
 - Nunca muestres CUIL, IDs internos ni datos sensibles. 
 - Podés compartir datos de contacto comerciales disponibles (teléfono, dirección, email) siempre que pertenezcan al parque.
-- Evita cualquier caracter de viñeta distinto a los guiones y no utilices asteriscos ni texto en negrita. 
 - Asegúrate de que la respuesta sea apropiada para todo público. 
 - Mantén un tono natural y demuestra comprensión del lenguaje cotidiano sin perder de vista el contexto del Parque Industrial Polo 52.
 - Si la consulta está relacionada con usuarios, vehículos o servicios internos, responde exactamente: "No tengo permitido compartir esta información".
 Responde naturalmente:"""
 
-        final_response = model.generate_content(final_prompt)
+        final_response = model.generate_content(
+            final_prompt,
+            generation_config=profile.generation_config
+        )
         final_text = extract_text_from_gemini(final_response)
         final_text = sanitize_response_text(final_text)
         if not final_text:
             print("Advertencia: Gemini no devolvió texto utilizable en la respuesta final.")
-            fallback_text = compose_fallback_response(db_results)
+            fallback_text = compose_fallback_response(
+                db_results, max_rows=profile.max_rows, speakable=profile.name == VOICE_CHANNEL
+            )
             if fallback_text:
                 fallback_text = sanitize_response_text(fallback_text)
                 if fallback_text:
@@ -1253,7 +1579,9 @@ Responde naturalmente:"""
         lowered_final = final_text.lower()
         if db_results and any(marker in lowered_final for marker in contradiction_markers):
             print("Advertencia: el modelo indicó falta de información pese a tener resultados. Usando fallback.")
-            fallback_text = compose_fallback_response(db_results)
+            fallback_text = compose_fallback_response(
+                db_results, max_rows=profile.max_rows, speakable=profile.name == VOICE_CHANNEL
+            )
             if fallback_text:
                 fallback_text = sanitize_response_text(fallback_text)
                 if fallback_text:
@@ -1270,45 +1598,45 @@ Responde naturalmente:"""
 # CHATBOT CON VOZ - FUNCIÓN INTEGRADA
 # ═══════════════════════════════════════════════════════════════════
 
-def get_chat_response_with_audio(
-    db: Session, 
+def _pack_audio(audio_bytes: bytes, encode_audio: bool) -> dict:
+    """
+    Empaquetar el audio de respuesta según el formato pedido por el endpoint.
+
+    Con encode_audio=True se mantiene el contrato histórico (base64 en JSON);
+    en modo binario se devuelven los bytes tal cual, sin copias intermedias.
+    """
+    if encode_audio:
+        return {"audio_base64": base64.b64encode(audio_bytes).decode('utf-8')}
+    return {"audio_bytes": audio_bytes}
+
+def get_chat_text_response(
+    db: Session,
     audio_content: bytes = None,
     text_message: str = None,
     history: List[Dict[str, str]] = None
 ) -> dict:
     """
-    Procesar mensaje de voz o texto y devolver respuesta con audio
-    
+    Primera fase del chat por voz: transcripción (si hay audio) + chatbot, sin TTS.
+
     Args:
         db: Sesión de base de datos
         audio_content: Audio en bytes (opcional)
         text_message: Mensaje de texto (opcional)
         history: Historial de conversación
-    
+
     Returns:
-        dict con:
-        - text: Respuesta en texto
-        - audio_base64: Audio de respuesta en base64
-        - db_results: Resultados de la base de datos
-        - transcript: Transcripción del audio del usuario (si aplica)
-        - corrected_entity: Entidad corregida (si aplica)
+        dict con text, db_results, transcript, corrected_entity y error
     """
+    transcript = None
     try:
-        transcript = None
-        
         # 1. Si viene audio, transcribir a texto
         if audio_content:
             print(f" Procesando audio: {len(audio_content)} bytes")
             transcript = transcribe_audio(audio_content)
             
             if not transcript or len(transcript.strip()) == 0:
-                error_message = GENERIC_ERROR_MESSAGE
-                error_audio = text_to_speech(error_message)
-                error_audio_base64 = base64.b64encode(error_audio).decode('utf-8')
-                
                 return {
-                    "text": error_message,
-                    "audio_base64": error_audio_base64,
+                    "text": GENERIC_ERROR_MESSAGE,
                     "db_results": [],
                     "transcript": None,
                     "corrected_entity": None,
@@ -1330,21 +1658,13 @@ def get_chat_response_with_audio(
         # 2. Obtener respuesta del chatbot
         print(f" Procesando con Gemini...")
         response_text, db_results, corrected_entity = get_chat_response(
-            db, message, history
+            db, message, history, channel=VOICE_CHANNEL
         )
         
         print(f" Respuesta generada: {response_text[:100]}...")
         
-        # 3. Convertir respuesta a audio
-        print(f"🔊 Generando audio de respuesta...")
-        audio_bytes = text_to_speech(response_text)
-        audio_base64 = base64.b64encode(audio_bytes).decode('utf-8')
-        
-        print(f" Audio generado: {len(audio_base64)} caracteres en base64")
-        
         return {
             "text": response_text,
-            "audio_base64": audio_base64,
             "db_results": db_results,
             "transcript": transcript,
             "corrected_entity": corrected_entity,
@@ -1355,30 +1675,78 @@ def get_chat_response_with_audio(
         # Re-lanzar excepciones HTTP
         raise he
     except Exception as e:
-        error_msg = f"Error procesando consulta: {str(e)}"
-        print(f" {error_msg}")
-        
-        # Intentar generar respuesta de error con audio
+        print(f" Error procesando consulta: {str(e)}")
+        return {
+            "text": GENERIC_ERROR_MESSAGE,
+            "db_results": [],
+            "transcript": transcript,
+            "corrected_entity": None,
+            "error": True
+        }
+
+def get_chat_response_with_audio(
+    db: Session, 
+    audio_content: bytes = None,
+    text_message: str = None,
+    history: List[Dict[str, str]] = None,
+    encode_audio: bool = True,
+    audio_format: Optional[str] = None
+) -> dict:
+    """
+    Procesar mensaje de voz o texto y devolver respuesta con audio
+    
+    Args:
+        db: Sesión de base de datos
+        audio_content: Audio en bytes (opcional)
+        text_message: Mensaje de texto (opcional)
+        history: Historial de conversación
+        encode_audio: Si es False, el audio se devuelve crudo en `audio_bytes`
+            en lugar de `audio_base64` (modo binario de /api/voice/chat)
+        audio_format: Formato del audio de respuesta ('mp3', 'ogg_opus', 'linear16')
+    
+    Returns:
+        dict con:
+        - text: Respuesta en texto
+        - audio_base64 / audio_bytes: Audio de respuesta
+        - db_results: Resultados de la base de datos
+        - transcript: Transcripción del audio del usuario (si aplica)
+        - corrected_entity: Entidad corregida (si aplica)
+    """
+    result = get_chat_text_response(db, audio_content, text_message, history)
+
+    # 3. Convertir respuesta a audio
+    print(f"🔊 Generando audio de respuesta...")
+    channel_metrics.record_tts(VOICE_CHANNEL, result["text"])
+    if not result["error"]:
+        audio_bytes = text_to_speech(result["text"], audio_format=audio_format)
+    else:
+        # Respuesta de error con audio; si tampoco se puede sintetizar, solo error
         try:
-            error_response = GENERIC_ERROR_MESSAGE
-            error_audio = text_to_speech(error_response)
-            error_audio_base64 = base64.b64encode(error_audio).decode('utf-8')
-            
-            return {
-                "text": error_response,
-                "audio_base64": error_audio_base64,
-                "db_results": [],
-                "transcript": transcript,
-                "corrected_entity": None,
-                "error": True
-            }
-        except:
-            # Si falla todo, devolver solo texto
+            audio_bytes = text_to_speech(result["text"], audio_format=audio_format)
+        except Exception:
             raise HTTPException(
                 status_code=500,
                 detail=GENERIC_ERROR_MESSAGE
             )
 
+    print(f" Audio generado: {len(audio_bytes)} bytes")
+    return {**result, **_pack_audio(audio_bytes, encode_audio)}
+
+def synthesize_ticket_audio(ticket_id: str, text: str, audio_format: Optional[str] = None) -> None:
+    """
+    Segunda fase del chat por voz: sintetizar el audio de un ticket en segundo plano.
+    Los errores quedan registrados en el ticket para que GET /api/voice/audio los informe.
+    """
+    channel_metrics.record_tts(VOICE_CHANNEL, text)
+    try:
+        audio_bytes = text_to_speech(text, audio_format=audio_format)
+        if voice_tickets.audio_tickets.complete(ticket_id, audio_bytes):
+            print(f" Audio del ticket {ticket_id[:8]} listo: {len(audio_bytes)} bytes")
+    except Exception as e:
+        detail = e.detail if isinstance(e, HTTPException) else str(e)
+        print(f" Error generando audio del ticket {ticket_id[:8]}: {detail}")
+        voice_tickets.audio_tickets.fail(ticket_id, GENERIC_ERROR_MESSAGE)
+
 # ═══════════════════════════════════════════════════════════════════
 # UTILIDADES DE DIAGNÓSTICO Y CONFIGURACIÓN
 # ═══════════════════════════════════════════════════════════════════
@@ -1392,9 +1760,27 @@ def get_voice_services_status() -> dict:
     """
     status = {
         "provider": VOICE_PROVIDER,
-        "services": {}
+        "services": {},
+        "tts_formats": list(voice_providers.AUDIO_FORMATS),
+        "tts_default_format": voice_providers.DEFAULT_AUDIO_FORMAT,
+        "tts_cache": tts_cache.stats(),
+        "audio_tickets": voice_tickets.audio_tickets.stats(),
+        "channels": channel_metrics.snapshot(),
+        "preprocessing": {
+            "enabled": audio_processing.preprocessing_enabled(),
+            "target_encoding": audio_processing.TARGET_ENCODING,
+            "target_sample_rate_hertz": audio_processing.TARGET_SAMPLE_RATE
+        }
     }
     
+    if VOICE_PROVIDER == voice_providers.FAKE:
+        status["services"]["fake"] = {
+            "speech_to_text": " Disponible (simulado)",
+            "text_to_speech": " Disponible (simulado)",
+            "stt_latency_ms": voice_providers.fake_speech_to_text.latency_ms,
+            "tts_latency_ms": voice_providers.fake_text_to_speech.latency_ms
+        }
+
     # Verificar Google Cloud
     if speech_client and tts_client:
         status["services"]["google_cloud"] = {
@@ -1448,7 +1834,8 @@ def test_voice_pipeline(db: Session, test_text: str = "Hola, soy POLO Bot del Pa
         response_text, db_results, _ = get_chat_response(
             db, 
             "¿Qué servicios ofrece el parque?",
-            None
+            None,
+            channel=VOICE_CHANNEL
         )
         results["chat_response"] = {
             "status": " OK",
@@ -1467,16 +1854,178 @@ def test_voice_pipeline(db: Session, test_text: str = "Hola, soy POLO Bot del Pa
     
     return results
 
+PROFILE_STAGES = ("preprocess", "stt", "chat", "tts", "base64", "total")
+PROFILE_MAX_ITERATIONS = 50
+# tracemalloc es global al proceso: un solo perfilado a la vez por worker
+_profile_lock = threading.Lock()
+
+def _latency_summary(samples_ms: List[float]) -> dict:
+    """min/mediana/p95 (rango más cercano) de una lista de latencias en ms."""
+    if not samples_ms:
+        return {"count": 0}
+    ordered = sorted(samples_ms)
+    p95_index = max(0, -(-95 * len(ordered) // 100) - 1)
+    return {
+        "count": len(ordered),
+        "min_ms": round(ordered[0], 3),
+        "median_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[p95_index], 3),
+        "max_ms": round(ordered[-1], 3),
+    }
+
+def profile_voice_pipeline(
+    db: Session,
+    iterations: int = 5,
+    use_fake_providers: bool = False,
+    sample_seconds: float = 2.0,
+    include_chat: bool = True,
+    question: str = "¿Qué empresas hay en el parque?"
+) -> dict:
+    """
+    Perfilar el pipeline de voz (preprocesamiento → STT → chat → TTS → base64)
+    sobre el audio de muestra, midiendo cada etapa por separado.
+
+    Args:
+        db: Sesión de base de datos (para la etapa de chat)
+        iterations: Repeticiones del pipeline (1 a PROFILE_MAX_ITERATIONS)
+        use_fake_providers: Usar STT/TTS locales en lugar de Google (solo esta petición)
+        sample_seconds: Segundos de voz del audio de muestra
+        include_chat: Si es False la etapa de chat se omite y se sintetiza `question`
+        question: Transcripción guionada del audio de muestra (modo fake)
+
+    Returns:
+        dict serializable con latencias por etapa, bytes y memoria pico
+
+    Raises:
+        RuntimeError: si ya hay un perfilado en curso en este worker
+
+    tracemalloc traza todo el proceso: mientras dura el perfilado el resto
+    de las peticiones del worker paga su costo y la memoria pico incluye
+    también lo que ellas asignen. Por eso solo corre un perfilado a la vez
+    (otro arrancado en paralelo le detendría la traza al primero).
+    """
+    if not _profile_lock.acquire(blocking=False):
+        raise RuntimeError("Ya hay un perfilado del pipeline de voz en curso, reintentá en unos segundos")
+    try:
+        return _profile_voice_pipeline(db, iterations, use_fake_providers, sample_seconds, include_chat, question)
+    finally:
+        _profile_lock.release()
+
+
+def _profile_voice_pipeline(
+    db: Session,
+    iterations: int,
+    use_fake_providers: bool,
+    sample_seconds: float,
+    include_chat: bool,
+    question: str
+) -> dict:
+    iterations = max(1, min(iterations, PROFILE_MAX_ITERATIONS))
+    sample_audio = audio_processing.generate_sample_wav(speech_seconds=sample_seconds)
+    timings: Dict[str, List[float]] = {stage: [] for stage in PROFILE_STAGES}
+    sizes = {"stt_payload": 0, "tts_audio": 0, "base64": 0}
+    errors: List[str] = []
+
+    provider = voice_providers.FAKE if use_fake_providers else active_voice_provider()
+    fake_stt_token = None
+    if use_fake_providers:
+        # Guion en una instancia local: no crece el mapa del STT fake compartido
+        shared = voice_providers.fake_speech_to_text
+        fake_stt = voice_providers.FakeSpeechToText(
+            latency_ms=shared.latency_ms, default_transcript=shared.default_transcript, script_path=None
+        )
+        fake_stt.script(sample_audio, question)
+        fake_stt_token = _fake_speech_to_text_override.set(fake_stt)
+
+    tracing_before = tracemalloc.is_tracing()
+    if not tracing_before:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    try:
+        with use_voice_provider(provider):
+            for iteration in range(iterations):
+                pipeline_start = time.perf_counter()
+                try:
+                    start = time.perf_counter()
+                    prepared = audio_processing.preprocess_for_stt(sample_audio)
+                    timings["preprocess"].append((time.perf_counter() - start) * 1000)
+
+                    start = time.perf_counter()
+                    if prepared is not None and prepared.has_speech:
+                        sizes["stt_payload"] = len(prepared.content)
+                        transcript = recognize_speech(
+                            prepared.content,
+                            encoding=prepared.encoding,
+                            sample_rate_hertz=prepared.sample_rate_hertz
+                        )
+                    else:
+                        sizes["stt_payload"] = len(sample_audio)
+                        transcript = transcribe_audio(sample_audio)
+                    timings["stt"].append((time.perf_counter() - start) * 1000)
+
+                    response_text = transcript or question
+                    if include_chat:
+                        start = time.perf_counter()
+                        response_text, _, _ = get_chat_response(db, response_text, None, channel=VOICE_CHANNEL)
+                        timings["chat"].append((time.perf_counter() - start) * 1000)
+
+                    start = time.perf_counter()
+                    # Sin cache: cada iteración mide una síntesis real
+                    audio_bytes = text_to_speech(response_text, use_cache=False)
+                    timings["tts"].append((time.perf_counter() - start) * 1000)
+                    sizes["tts_audio"] = len(audio_bytes)
+
+                    start = time.perf_counter()
+                    audio_base64 = base64.b64encode(audio_bytes).decode("utf-8")
+                    timings["base64"].append((time.perf_counter() - start) * 1000)
+                    sizes["base64"] = len(audio_base64)
+
+                    timings["total"].append((time.perf_counter() - pipeline_start) * 1000)
+                except Exception as e:
+                    detail = e.detail if isinstance(e, HTTPException) else str(e)
+                    errors.append(f"Iteración {iteration + 1}: {detail}")
+    finally:
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        if not tracing_before:
+            tracemalloc.stop()
+        if fake_stt_token is not None:
+            _fake_speech_to_text_override.reset(fake_stt_token)
+
+    tts_bytes = sizes["tts_audio"]
+    return {
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+        "provider": provider,
+        "iterations": iterations,
+        "successful_iterations": len(timings["total"]),
+        "include_chat": include_chat,
+        "stages": {stage: _latency_summary(values) for stage, values in timings.items()},
+        "bytes": {
+            "audio_in": len(sample_audio),
+            "stt_payload": sizes["stt_payload"],
+            "tts_audio_out": tts_bytes,
+            "base64_out": sizes["base64"],
+            "base64_overhead_bytes": sizes["base64"] - tts_bytes,
+            "base64_overhead_ratio": round(sizes["base64"] / tts_bytes - 1, 4) if tts_bytes else None
+        },
+        "memory": {"peak_traced_bytes": peak_bytes},
+        "errors": errors
+    }
+
 # ═══════════════════════════════════════════════════════════════════
 # LIMPIEZA Y MANTENIMIENTO
 # ═══════════════════════════════════════════════════════════════════
 
-def cleanup_used_tokens():
-    """Limpiar cache de tokens usados"""
-    global USED_RESET_TOKENS
-    USED_RESET_TOKENS.clear()
+def cleanup_used_tokens() -> int:
+    """Limpiar registro de tokens usados; devuelve cuántos se eliminaron"""
+    removed = USED_RESET_TOKENS.clear()
     print(" Cache de tokens usados limpiado")
+    return removed
 
 def get_used_tokens_count() -> int:
-    """Obtener cantidad de tokens usados en memoria"""
+    """Obtener cantidad de tokens usados vigentes"""
     return len(USED_RESET_TOKENS)
+
+def get_used_tokens_stats() -> dict:
+    """Tamaño real, backend y estadísticas de desalojo del registro"""
+    return USED_RESET_TOKENS.stats()
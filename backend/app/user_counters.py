@@ -0,0 +1,291 @@
+#app/user_counters.py
+"""
+Contadores de usuarios activos por empresa y rol.
+
+Los límites de usuarios (MAX_ADMIN_POLO_TOTAL, MAX_ADMIN_EMPRESA_PER_COMPANY)
+se validaban con un COUNT sobre usuario ⨝ rol_usuario ⨝ rol en cada alta o
+activación, y dos peticiones concurrentes podían pasar la validación a la
+vez. La tabla `contador_usuarios_activos` guarda ese número por (cuil,
+tipo_rol):
+
+- Validación: `locked_active_count` lee una fila con SELECT ... FOR UPDATE.
+  La transacción que crea o activa el usuario mantiene el bloqueo hasta el
+  commit, así la segunda petición espera y lee el valor ya actualizado.
+- Mantenimiento: un listener `after_flush` toma las altas, bajas, cambios
+  de estado o de empresa de usuarios y enlaces de rol del flush y suma ±1
+  a las filas (cuil, tipo_rol) afectadas dentro de la misma transacción,
+  sin COUNT: solo lee los enlaces y el estado de los usuarios tocados.
+  Cubre todos los caminos de escritura (alta, registro, Google,
+  inhabilitar empresa) sin que cada ruta tenga que acordarse de
+  actualizarlos. Una fila que todavía no existe nace con su COUNT.
+- Reconciliación: `reconcile` recalcula la tabla completa; corre al iniciar
+  la API y como job (`python -m app.user_counters`) para corregir cambios
+  hechos fuera del ORM (SQL manual, updates masivos).
+"""
+
+import argparse
+import itertools
+
+from sqlalchemy import bindparam, event, func, inspect, select, update
+from sqlalchemy.orm import Session
+
+from app import database, models
+
+# Roles con límites o informados en /usuarios/limits-status
+TRACKED_ROLES = ("admin_polo", "admin_empresa", "publico")
+
+Counter = models.ContadorUsuariosActivos
+
+# ═══════════════════════════════════════════════════════════════════
+# CONSULTAS
+# ═══════════════════════════════════════════════════════════════════
+
+def _active_counts(conn, cuils=None) -> dict:
+    """{(cuil, tipo_rol): activos} con un solo COUNT agrupado."""
+    query = (
+        select(models.Usuario.cuil, models.Rol.tipo_rol, func.count(models.Usuario.id_usuario))
+        .join(models.RolUsuario, models.RolUsuario.id_usuario == models.Usuario.id_usuario)
+        .join(models.Rol, models.Rol.id_rol == models.RolUsuario.id_rol)
+        .where(models.Usuario.estado.is_(True), models.Rol.tipo_rol.in_(TRACKED_ROLES))
+        .group_by(models.Usuario.cuil, models.Rol.tipo_rol)
+    )
+    if cuils is not None:
+        query = query.where(models.Usuario.cuil.in_(cuils))
+    return {(cuil, tipo_rol): total for cuil, tipo_rol, total in conn.execute(query)}
+
+
+def _seed(conn, cuil: int, tipo_rol: str) -> bool:
+    """
+    Crear la fila (cuil, tipo_rol) con su COUNT si no existía (empresa o rol
+    que `reconcile` todavía no vio). Devuelve False si otra transacción la
+    creó primero: su COUNT no incluye los cambios sin commit de esta.
+    """
+    activos = _active_counts(conn, [cuil]).get((cuil, tipo_rol), 0)
+    return database.insert_ignore(conn, Counter.__table__, [{"cuil": cuil, "tipo_rol": tipo_rol, "activos": activos}]) > 0
+
+
+def _apply_deltas(conn, deltas: dict) -> None:
+    """Sumar los ±N de cada (cuil, tipo_rol); el UPDATE bloquea solo esas filas."""
+    # Orden fijo: dos transacciones no se bloquean cruzadas
+    for (cuil, tipo_rol), delta in sorted(deltas.items()):
+        if not delta:
+            continue
+        increment = (
+            update(Counter)
+            .where(Counter.cuil == cuil, Counter.tipo_rol == tipo_rol)
+            .values(activos=Counter.activos + delta)
+        )
+        if conn.execute(increment).rowcount:
+            continue
+        # Sin fila: el COUNT con el que nace ya incluye este flush
+        if not _seed(conn, cuil, tipo_rol):
+            conn.execute(increment)
+
+
+def locked_active_count(db: Session, cuil: int, tipo_rol: str, all_companies: bool = False) -> int:
+    """
+    Bloquear el contador (cuil, tipo_rol) hasta el fin de la transacción y
+    devolver los usuarios activos. Con all_companies devuelve el total del
+    rol en todas las empresas (límite global de admin_polo), usando la fila
+    de `cuil` como cerrojo.
+    """
+    locked = select(Counter.activos).where(Counter.cuil == cuil, Counter.tipo_rol == tipo_rol).with_for_update()
+    activos = db.execute(locked).scalar()
+    if activos is None:
+        _seed(db.connection(), cuil, tipo_rol)
+        activos = db.execute(locked).scalar()
+    if not all_companies:
+        return activos
+    return db.execute(
+        select(func.coalesce(func.sum(Counter.activos), 0)).where(Counter.tipo_rol == tipo_rol)
+    ).scalar()
+
+# ═══════════════════════════════════════════════════════════════════
+# MANTENIMIENTO EN CADA FLUSH
+# ═══════════════════════════════════════════════════════════════════
+
+# active_history: al asignar se carga el valor previo aunque el objeto esté
+# expirado (tras un commit), así el delta sabe de qué fila restar
+@event.listens_for(models.Usuario.estado, "set", active_history=True)
+@event.listens_for(models.Usuario.cuil, "set", active_history=True)
+@event.listens_for(models.RolUsuario.id_rol, "set", active_history=True)
+@event.listens_for(models.RolUsuario.id_usuario, "set", active_history=True)
+def _load_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+def _before(attr):
+    """Valor de una columna antes del flush (el actual si no cambió)."""
+    history = attr.history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else attr.value
+
+
+def _flushed_changes(session: Session):
+    """
+    Usuarios y enlaces de rol tocados en el flush:
+    ({id_usuario: (antes, después)} con (cuil, estado) o None, enlaces agregados, enlaces quitados).
+    """
+    states, added, removed = {}, set(), set()
+    for obj in session.new:
+        if isinstance(obj, models.Usuario):
+            states[obj.id_usuario] = (None, (obj.cuil, bool(obj.estado)))
+        elif isinstance(obj, models.RolUsuario):
+            added.add((obj.id_usuario, obj.id_rol))
+    for obj in session.deleted:
+        if isinstance(obj, models.Usuario):
+            attrs = inspect(obj).attrs
+            states[obj.id_usuario] = ((_before(attrs.cuil), bool(_before(attrs.estado))), None)
+        elif isinstance(obj, models.RolUsuario):
+            attrs = inspect(obj).attrs
+            removed.add((_before(attrs.id_usuario), _before(attrs.id_rol)))
+    for obj in session.dirty:
+        if isinstance(obj, models.Usuario):
+            attrs = inspect(obj).attrs
+            if attrs.estado.history.has_changes() or attrs.cuil.history.has_changes():
+                states[obj.id_usuario] = (
+                    (_before(attrs.cuil), bool(_before(attrs.estado))),
+                    (obj.cuil, bool(obj.estado)),
+                )
+        elif isinstance(obj, models.RolUsuario):
+            attrs = inspect(obj).attrs
+            if attrs.id_rol.history.has_changes() or attrs.id_usuario.history.has_changes():
+                removed.add((_before(attrs.id_usuario), _before(attrs.id_rol)))
+                added.add((obj.id_usuario, obj.id_rol))
+    # Un enlace quitado y vuelto a agregar en el mismo flush no cambia nada
+    return states, added - removed, removed - added
+
+
+def _deltas(session: Session) -> dict:
+    """
+    {(cuil, tipo_rol): ±N} de lo que cambió en el flush, sin COUNT: solo se
+    leen los enlaces y el estado de los usuarios tocados.
+    """
+    states, added, removed = _flushed_changes(session)
+    user_ids = set(states) | {uid for uid, _ in added | removed}
+    user_ids.discard(None)
+    if not user_ids:
+        return {}
+    conn = session.connection()
+
+    # Roles seguidos de los usuarios tocados, ya con el flush aplicado
+    links_after = {}
+    for uid, id_rol, tipo_rol in conn.execute(
+        select(models.RolUsuario.id_usuario, models.RolUsuario.id_rol, models.Rol.tipo_rol)
+        .join(models.Rol, models.Rol.id_rol == models.RolUsuario.id_rol)
+        .where(models.RolUsuario.id_usuario.in_(user_ids), models.Rol.tipo_rol.in_(TRACKED_ROLES))
+    ):
+        links_after.setdefault(uid, {})[id_rol] = tipo_rol
+    removed_roles = {id_rol for _, id_rol in removed}
+    role_types = dict(conn.execute(
+        select(models.Rol.id_rol, models.Rol.tipo_rol)
+        .where(models.Rol.id_rol.in_(removed_roles), models.Rol.tipo_rol.in_(TRACKED_ROLES))
+    ).all()) if removed_roles else {}
+
+    # Usuarios tocados solo por sus enlaces: mismo cuil y estado antes y después
+    unchanged = user_ids - set(states)
+    if unchanged:
+        for uid, cuil, estado in conn.execute(
+            select(models.Usuario.id_usuario, models.Usuario.cuil, models.Usuario.estado)
+            .where(models.Usuario.id_usuario.in_(unchanged))
+        ):
+            states[uid] = ((cuil, bool(estado)), (cuil, bool(estado)))
+
+    deltas = {}
+    for uid, (before, after) in states.items():
+        roles_after = links_after.get(uid, {}) if after is not None else {}
+        roles_before = {
+            id_rol: tipo_rol for id_rol, tipo_rol in links_after.get(uid, {}).items()
+            if (uid, id_rol) not in added
+        }
+        roles_before.update(
+            (id_rol, role_types[id_rol]) for link_uid, id_rol in removed
+            if link_uid == uid and id_rol in role_types
+        )
+        if before is not None and before[1]:
+            for tipo_rol in roles_before.values():
+                deltas[(before[0], tipo_rol)] = deltas.get((before[0], tipo_rol), 0) - 1
+        if after is not None and after[1]:
+            for tipo_rol in roles_after.values():
+                deltas[(after[0], tipo_rol)] = deltas.get((after[0], tipo_rol), 0) + 1
+    return deltas
+
+
+@event.listens_for(Session, "after_flush")
+def _apply_counter_deltas_after_flush(session, flush_context):
+    tracked = (models.Usuario, models.RolUsuario)
+    if not any(isinstance(obj, tracked) for obj in itertools.chain(session.new, session.dirty, session.deleted)):
+        return
+    deltas = _deltas(session)
+    if deltas:
+        _apply_deltas(session.connection(), deltas)
+
+# ═══════════════════════════════════════════════════════════════════
+# ESQUEMA Y RECONCILIACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+def ensure_schema(engine) -> None:
+    """Crear la tabla de contadores si no existe (no hay migraciones)."""
+    Counter.__table__.create(bind=engine, checkfirst=True)
+
+
+def reconcile(db: Session) -> list:
+    """
+    Recalcular todos los contadores desde usuario/rol_usuario.
+    Devuelve las filas corregidas como (cuil, tipo_rol, antes, ahora);
+    el commit queda a cargo de quien llama.
+    """
+    conn = db.connection()
+    stored = {
+        (cuil, tipo_rol): activos
+        for cuil, tipo_rol, activos in conn.execute(
+            select(Counter.cuil, Counter.tipo_rol, Counter.activos)
+            .order_by(Counter.cuil, Counter.tipo_rol)
+            .with_for_update()
+        )
+    }
+    actual = _active_counts(conn)
+    corrections = [
+        (cuil, tipo_rol, stored.get((cuil, tipo_rol)), actual.get((cuil, tipo_rol), 0))
+        for cuil, tipo_rol in sorted(set(stored) | set(actual))
+        if stored.get((cuil, tipo_rol)) != actual.get((cuil, tipo_rol), 0)
+    ]
+    if corrections:
+        database.insert_ignore(conn, Counter.__table__, [
+            {"cuil": cuil, "tipo_rol": tipo_rol, "activos": 0}
+            for cuil, tipo_rol, before, _ in corrections if before is None
+        ])
+        conn.execute(
+            update(Counter)
+            .where(Counter.cuil == bindparam("b_cuil"), Counter.tipo_rol == bindparam("b_tipo_rol"))
+            .values(activos=bindparam("b_activos")),
+            [{"b_cuil": c, "b_tipo_rol": t, "b_activos": now} for c, t, _, now in corrections],
+        )
+    return corrections
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Reconciliar contadores de usuarios activos")
+    parser.add_argument("--dry-run", action="store_true", help="Mostrar diferencias sin guardarlas")
+    args = parser.parse_args()
+
+    from app.config import SessionLocal, engine
+
+    ensure_schema(engine)
+    db = SessionLocal()
+    try:
+        corrections = reconcile(db)
+        for cuil, tipo_rol, before, now in corrections:
+            print(f"[COUNTERS] {cuil}/{tipo_rol}: {before} → {now}")
+        if args.dry_run:
+            db.rollback()
+        else:
+            db.commit()
+        print(f"[COUNTERS] {len(corrections)} contadores corregidos" + (" (dry-run)" if args.dry_run else ""))
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,295 @@
+#app/utils/uploads.py
+"""
+Ingesta de audio con límites de tamaño y tiempo para los endpoints de voz.
+
+El audio se lee por bloques y se acumula en un buffer propio: hasta
+VOICE_UPLOAD_SPOOL_BYTES queda en memoria y por encima pasa a un archivo
+temporal. Así cada petición ocupa como máximo ese umbral de RAM aunque
+lleguen muchas en paralelo. Después el contenido se entrega a STT como una
+vista sin copias (memoryview o mmap) o como un iterador de bloques.
+
+Los formularios multipart los parsea Starlette antes de que corra el
+endpoint, así que los límites se aplican antes: las rutas de voz usan
+`CappedUploadRoute`, que rechaza por Content-Length y corta el cuerpo
+mientras se recibe (tamaño y tiempo) antes de parsear el formulario.
+"""
+
+import asyncio
+import base64
+import binascii
+import io
+import json
+import mmap
+import os
+import tempfile
+import time
+from typing import Any, Iterator, Optional, Union
+
+from fastapi import HTTPException, Request, UploadFile
+from fastapi.routing import APIRoute
+
+# ═══════════════════════════════════════════════════════════════════
+# CONFIGURACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+UPLOAD_MAX_BYTES = int(os.getenv("VOICE_UPLOAD_MAX_BYTES", str(10 * 1024 * 1024)))
+UPLOAD_SPOOL_BYTES = int(os.getenv("VOICE_UPLOAD_SPOOL_BYTES", str(1024 * 1024)))
+UPLOAD_TIMEOUT_SECONDS = float(os.getenv("VOICE_UPLOAD_TIMEOUT_SECONDS", "30"))
+UPLOAD_CHUNK_BYTES = 64 * 1024
+# Margen del multipart sobre el audio: boundaries, cabeceras y campos de texto (historial)
+UPLOAD_FORM_OVERHEAD_BYTES = int(os.getenv("VOICE_UPLOAD_FORM_OVERHEAD_BYTES", str(256 * 1024)))
+
+AudioView = Union[memoryview, mmap.mmap, bytes]
+
+# ═══════════════════════════════════════════════════════════════════
+# BUFFER DE AUDIO
+# ═══════════════════════════════════════════════════════════════════
+
+class SpooledAudio:
+    """Audio recibido, en memoria o en disco según su tamaño."""
+
+    def __init__(self, spool_bytes: Optional[int] = None):
+        self.spool_bytes = spool_bytes if spool_bytes is not None else UPLOAD_SPOOL_BYTES
+        # BytesIO propio hasta el umbral; después, archivo temporal
+        self._buffer: Optional[io.BytesIO] = io.BytesIO()
+        self._file = None
+        self._view: Optional[AudioView] = None
+        self.size = 0
+
+    def _rollover(self) -> None:
+        self._file = tempfile.TemporaryFile()
+        self._file.write(self._buffer.getbuffer())
+        self._buffer.close()
+        self._buffer = None
+
+    def write(self, chunk: bytes, max_bytes: int) -> None:
+        if self.size + len(chunk) > max_bytes:
+            raise HTTPException(
+                status_code=413,
+                detail=f"El archivo de audio supera el máximo permitido ({max_bytes} bytes)"
+            )
+        if self._file is None and self.size + len(chunk) > self.spool_bytes:
+            self._rollover()
+        (self._file or self._buffer).write(chunk)
+        self.size += len(chunk)
+
+    @property
+    def on_disk(self) -> bool:
+        return self._file is not None
+
+    def view(self) -> AudioView:
+        """
+        Vista de solo lectura del audio sin copiarlo: memoryview del buffer en
+        memoria o mmap del archivo temporal.
+        """
+        if self._view is None:
+            if self.size == 0:
+                self._view = b""
+            elif self.on_disk:
+                self._file.flush()
+                self._view = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                self._view = self._buffer.getbuffer()
+        return self._view
+
+    def iter_chunks(self, chunk_size: int = UPLOAD_CHUNK_BYTES) -> Iterator[memoryview]:
+        """Recorrer el audio por bloques (memoryview, sin copias)."""
+        view = memoryview(self.view())
+        try:
+            for offset in range(0, self.size, chunk_size):
+                yield view[offset:offset + chunk_size]
+        finally:
+            view.release()
+
+    def close(self) -> None:
+        if isinstance(self._view, memoryview):
+            self._view.release()
+        elif isinstance(self._view, mmap.mmap):
+            self._view.close()
+        self._view = None
+        if self._file is not None:
+            self._file.close()
+        if self._buffer is not None:
+            self._buffer.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> "SpooledAudio":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+# ═══════════════════════════════════════════════════════════════════
+# LECTURA CON LÍMITES
+# ═══════════════════════════════════════════════════════════════════
+
+def check_content_length(request: Request, max_bytes: Optional[int] = None) -> None:
+    """Rechazar antes de leer si el cliente ya declara un cuerpo demasiado grande."""
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    declared = request.headers.get("content-length")
+    if declared and declared.isdigit() and int(declared) > max_bytes:
+        raise HTTPException(
+            status_code=413,
+            detail=f"El archivo de audio supera el máximo permitido ({max_bytes} bytes)"
+        )
+
+
+def json_body_limit(max_bytes: Optional[int] = None) -> int:
+    """Tamaño máximo de un cuerpo JSON con el audio en base64 (~4/3 del binario)."""
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    return max_bytes * 4 // 3 + UPLOAD_CHUNK_BYTES
+
+
+def multipart_body_limit(max_bytes: Optional[int] = None) -> int:
+    """Tamaño máximo de un cuerpo multipart: el audio más el margen del formulario."""
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    return max_bytes + UPLOAD_FORM_OVERHEAD_BYTES
+
+
+def _remaining(deadline: float) -> float:
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise HTTPException(status_code=408, detail="Tiempo de subida de audio agotado")
+    return remaining
+
+
+async def _read_chunk(read, deadline: float):
+    try:
+        return await asyncio.wait_for(read(), timeout=_remaining(deadline))
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=408, detail="Tiempo de subida de audio agotado")
+
+
+async def read_upload_capped(
+    upload: UploadFile,
+    max_bytes: Optional[int] = None,
+    timeout_seconds: Optional[float] = None,
+) -> SpooledAudio:
+    """
+    Copiar un UploadFile por bloques aplicando los límites de tamaño y tiempo.
+
+    Starlette ya recibió el formulario completo: lo que acota la subida es
+    `CappedUploadRoute`; acá se controla solo el tamaño del archivo de audio.
+    """
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    deadline = time.monotonic() + (timeout_seconds if timeout_seconds is not None else UPLOAD_TIMEOUT_SECONDS)
+
+    spooled = SpooledAudio()
+    try:
+        while True:
+            chunk = await _read_chunk(lambda: upload.read(UPLOAD_CHUNK_BYTES), deadline)
+            if not chunk:
+                return spooled
+            spooled.write(chunk, max_bytes)
+    except BaseException:
+        spooled.close()
+        raise
+
+
+async def read_request_body_capped(
+    request: Request,
+    max_bytes: Optional[int] = None,
+    timeout_seconds: Optional[float] = None,
+) -> SpooledAudio:
+    """Leer el cuerpo crudo de la petición en streaming aplicando los límites."""
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    deadline = time.monotonic() + (timeout_seconds if timeout_seconds is not None else UPLOAD_TIMEOUT_SECONDS)
+    check_content_length(request, max_bytes)
+
+    spooled = SpooledAudio()
+    stream = request.stream().__aiter__()
+    try:
+        while True:
+            try:
+                chunk = await _read_chunk(stream.__anext__, deadline)
+            except StopAsyncIteration:
+                return spooled
+            if chunk:
+                spooled.write(chunk, max_bytes)
+    except BaseException:
+        spooled.close()
+        raise
+
+
+def _capped_receive(receive, max_bytes: int, timeout_seconds: float):
+    """Envolver el `receive` ASGI para cortar el cuerpo por tamaño y por tiempo."""
+    deadline = time.monotonic() + timeout_seconds
+    received = 0
+
+    async def capped():
+        nonlocal received
+        message = await _read_chunk(receive, deadline)
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > max_bytes:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"El archivo de audio supera el máximo permitido ({max_bytes} bytes)"
+                )
+        return message
+
+    return capped
+
+
+class CappedUploadRoute(APIRoute):
+    """
+    Ruta que limita los cuerpos multipart/form-data antes de que FastAPI
+    parsee el formulario: rechaza por Content-Length y, si no lo hay
+    (chunked) o miente, corta la recepción al pasar el límite o el tiempo.
+    Los demás tipos de contenido pasan sin cambios (cada endpoint los lee
+    con `read_request_body_capped` / `read_json_body_capped`).
+    """
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+
+        async def capped_handler(request: Request):
+            content_type = request.headers.get("content-type", "").lower()
+            if content_type.startswith("multipart/form-data"):
+                max_bytes = multipart_body_limit()
+                check_content_length(request, max_bytes)
+                request = Request(
+                    request.scope,
+                    _capped_receive(request.receive, max_bytes, UPLOAD_TIMEOUT_SECONDS),
+                )
+            return await handler(request)
+
+        return capped_handler
+
+
+async def read_json_body_capped(
+    request: Request,
+    max_bytes: Optional[int] = None,
+    timeout_seconds: Optional[float] = None,
+) -> Any:
+    """
+    Leer y parsear un cuerpo JSON con el mismo límite en streaming: sin
+    Content-Length (chunked) el tamaño también se controla mientras se lee.
+    """
+    max_bytes = max_bytes if max_bytes is not None else json_body_limit()
+    with await read_request_body_capped(request, max_bytes, timeout_seconds) as body:
+        try:
+            return json.loads(bytes(body.view()) or b"null")
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Cuerpo JSON inválido")
+
+
+def decode_base64_audio(payload: str, max_bytes: Optional[int] = None) -> bytes:
+    """Decodificar audio en base64 aplicando el mismo máximo que a los binarios."""
+    max_bytes = max_bytes if max_bytes is not None else UPLOAD_MAX_BYTES
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"El archivo de audio supera el máximo permitido ({max_bytes} bytes)"
+    )
+    # Cota previa sin decodificar: cada 4 caracteres son como mucho 3 bytes
+    if len(payload) // 4 * 3 > max_bytes + 2:
+        raise too_large
+    try:
+        audio = base64.b64decode(payload)
+    except (binascii.Error, ValueError):
+        raise HTTPException(status_code=400, detail="Audio en base64 inválido")
+    if len(audio) > max_bytes:
+        raise too_large
+    return audio
@@ -0,0 +1,295 @@
+#app/voice_providers.py
+"""
+Proveedores de Speech-to-Text y Text-to-Speech.
+
+- google: Google Cloud Speech / Text-to-Speech (producción).
+- fake: implementaciones locales y determinísticas para tests, benchmarks
+  y pruebas de carga sin credenciales ni red.
+
+El proveedor activo se elige con la variable de entorno VOICE_PROVIDER
+(`google` o `fake`). Si no se define se usa Google cuando hay credenciales.
+"""
+
+import hashlib
+import io
+import json
+import math
+import os
+import time
+import wave
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+try:
+    from google.cloud import speech_v1 as speech
+    from google.cloud import texttospeech
+except ImportError:  # pragma: no cover - librerías opcionales
+    speech = None
+    texttospeech = None
+
+# ═══════════════════════════════════════════════════════════════════
+# CONFIGURACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+GOOGLE = "google"
+FAKE = "fake"
+SUPPORTED_PROVIDERS = (GOOGLE, FAKE)
+
+FAKE_STT_LATENCY_MS = float(os.getenv("VOICE_FAKE_STT_LATENCY_MS", "0"))
+FAKE_TTS_LATENCY_MS = float(os.getenv("VOICE_FAKE_TTS_LATENCY_MS", "0"))
+FAKE_STT_SCRIPT_PATH = os.getenv("VOICE_FAKE_STT_SCRIPT")
+FAKE_STT_DEFAULT_TRANSCRIPT = os.getenv(
+    "VOICE_FAKE_STT_DEFAULT_TRANSCRIPT", "¿Qué empresas hay en el parque industrial?"
+)
+# Velocidad de habla simulada para el largo del audio sintetizado
+FAKE_TTS_SECONDS_PER_CHAR = 0.06
+# Bitrate aproximado del OGG_OPUS simulado (voz a 16 kHz)
+FAKE_OPUS_KBPS = 16
+
+# ═══════════════════════════════════════════════════════════════════
+# FORMATOS DE SALIDA DE TTS
+# ═══════════════════════════════════════════════════════════════════
+
+@dataclass(frozen=True)
+class AudioFormat:
+    """Formato de audio de respuesta que puede pedir un cliente."""
+    name: str
+    encoding: str
+    media_type: str
+    extension: str
+    sample_rate_hertz: Optional[int] = None
+
+
+MP3 = "mp3"
+OGG_OPUS = "ogg_opus"
+LINEAR16 = "linear16"
+
+AUDIO_FORMATS: Dict[str, AudioFormat] = {
+    # Perfil histórico: MP3 a la frecuencia por defecto de la voz
+    MP3: AudioFormat(MP3, "MP3", "audio/mpeg", "mp3"),
+    # Opus a baja frecuencia de muestreo: el formato más liviano para el Wi-Fi del parque
+    OGG_OPUS: AudioFormat(
+        OGG_OPUS, "OGG_OPUS", "audio/ogg", "ogg",
+        int(os.getenv("VOICE_TTS_OPUS_SAMPLE_RATE", "16000"))
+    ),
+    # PCM sin compresión (WAV) para reproducción local sin decodificador
+    LINEAR16: AudioFormat(
+        LINEAR16, "LINEAR16", "audio/wav", "wav",
+        int(os.getenv("VOICE_TTS_LINEAR16_SAMPLE_RATE", "24000"))
+    ),
+}
+DEFAULT_AUDIO_FORMAT = os.getenv("VOICE_TTS_DEFAULT_FORMAT", MP3)
+
+
+def get_audio_format(name: Optional[str]) -> AudioFormat:
+    """Resolver un nombre de formato (None → formato por defecto). ValueError si no existe."""
+    key = (name or DEFAULT_AUDIO_FORMAT).strip().lower()
+    if key not in AUDIO_FORMATS:
+        raise ValueError(f"Formato de audio no soportado: {name}. Usa {', '.join(AUDIO_FORMATS)}.")
+    return AUDIO_FORMATS[key]
+
+
+def configured_provider_name() -> Optional[str]:
+    """Proveedor pedido explícitamente por VOICE_PROVIDER (None si no se definió)."""
+    name = os.getenv("VOICE_PROVIDER", "").strip().lower()
+    return name or None
+
+# ═══════════════════════════════════════════════════════════════════
+# INTERFAZ
+# ═══════════════════════════════════════════════════════════════════
+
+class SpeechToTextProvider(ABC):
+    """Convierte audio a texto."""
+    name = "base"
+
+    @abstractmethod
+    def recognize(
+        self,
+        audio_content,
+        language_code: str,
+        encoding: str,
+        sample_rate_hertz: int
+    ) -> str:
+        """Transcripción del audio ("" si no se reconoce nada)."""
+
+
+class TextToSpeechProvider(ABC):
+    """Convierte texto a audio en el formato pedido (MP3 por defecto)."""
+    name = "base"
+
+    @abstractmethod
+    def synthesize(
+        self,
+        text: str,
+        language_code: str,
+        voice_name: str,
+        audio_format: AudioFormat = AUDIO_FORMATS[MP3]
+    ) -> bytes:
+        """Audio sintetizado en `audio_format`."""
+
+# ═══════════════════════════════════════════════════════════════════
+# GOOGLE CLOUD
+# ═══════════════════════════════════════════════════════════════════
+
+class GoogleSpeechToText(SpeechToTextProvider):
+    name = GOOGLE
+
+    def __init__(self, client):
+        self.client = client
+
+    def recognize(self, audio_content, language_code, encoding, sample_rate_hertz) -> str:
+        audio = speech.RecognitionAudio(content=bytes(audio_content))
+        config = speech.RecognitionConfig(
+            encoding=speech.RecognitionConfig.AudioEncoding[encoding],
+            sample_rate_hertz=sample_rate_hertz,
+            language_code=language_code,
+            enable_automatic_punctuation=True,
+            model="default",
+            use_enhanced=True
+        )
+        response = self.client.recognize(config=config, audio=audio)
+        return " ".join(result.alternatives[0].transcript for result in response.results).strip()
+
+
+class GoogleTextToSpeech(TextToSpeechProvider):
+    name = GOOGLE
+
+    def __init__(self, client):
+        self.client = client
+
+    def synthesize(self, text, language_code, voice_name, audio_format=AUDIO_FORMATS[MP3]) -> bytes:
+        config = dict(
+            audio_encoding=texttospeech.AudioEncoding[audio_format.encoding],
+            speaking_rate=1.0,
+            pitch=0.0,
+            volume_gain_db=0.0,
+            effects_profile_id=["headphone-class-device"]
+        )
+        if audio_format.sample_rate_hertz:
+            config["sample_rate_hertz"] = audio_format.sample_rate_hertz
+
+        response = self.client.synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text),
+            voice=texttospeech.VoiceSelectionParams(
+                language_code=language_code,
+                name=voice_name,
+                ssml_gender=texttospeech.SsmlVoiceGender.FEMALE
+            ),
+            audio_config=texttospeech.AudioConfig(**config)
+        )
+        return response.audio_content
+
+# ═══════════════════════════════════════════════════════════════════
+# FAKES LOCALES
+# ═══════════════════════════════════════════════════════════════════
+
+def audio_fingerprint(audio_content) -> str:
+    """Huella del audio (sha256) usada para elegir la transcripción guionada."""
+    return hashlib.sha256(bytes(audio_content)).hexdigest()
+
+
+class FakeSpeechToText(SpeechToTextProvider):
+    """
+    STT local: devuelve la transcripción registrada para la huella del audio
+    o una transcripción por defecto.
+
+    El guion se puede cargar desde un JSON {huella: transcripción} indicado en
+    VOICE_FAKE_STT_SCRIPT o registrar en código con `script()`.
+    """
+    name = FAKE
+
+    def __init__(
+        self,
+        latency_ms: float = FAKE_STT_LATENCY_MS,
+        default_transcript: str = FAKE_STT_DEFAULT_TRANSCRIPT,
+        script_path: Optional[str] = FAKE_STT_SCRIPT_PATH,
+    ):
+        self.latency_ms = latency_ms
+        self.default_transcript = default_transcript
+        self.transcripts: Dict[str, str] = {}
+        self.calls = 0
+        if script_path and os.path.exists(script_path):
+            with open(script_path, encoding="utf-8") as script_file:
+                self.transcripts.update(json.load(script_file))
+
+    def script(self, audio_content, transcript: str) -> str:
+        """
+        Registrar la transcripción de un audio.
+
+        Como STT recibe el audio ya preprocesado, también se registra la huella
+        de esa versión cuando se puede decodificar.
+        """
+        from app import audio_processing
+
+        fingerprint = audio_fingerprint(audio_content)
+        self.transcripts[fingerprint] = transcript
+        prepared = audio_processing.preprocess_for_stt(audio_content)
+        if prepared is not None and prepared.has_speech:
+            self.transcripts[audio_fingerprint(prepared.content)] = transcript
+        return fingerprint
+
+    def recognize(self, audio_content, language_code, encoding, sample_rate_hertz) -> str:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        return self.transcripts.get(audio_fingerprint(audio_content), self.default_transcript)
+
+
+# Frame MPEG-1 Layer III de 32 kbps / 48 kHz mono sin datos: 96 bytes = 24 ms de silencio
+SILENT_MP3_FRAME = b"\xff\xfb\x14\xc0" + b"\x00" * 92
+SILENT_MP3_FRAME_SECONDS = 1152 / 48000
+
+
+def silent_mp3(duration_seconds: float) -> bytes:
+    """MP3 silencioso válido de la duración indicada (al menos un frame)."""
+    frames = max(1, math.ceil(duration_seconds / SILENT_MP3_FRAME_SECONDS))
+    return SILENT_MP3_FRAME * frames
+
+
+def silent_wav(duration_seconds: float, sample_rate: int) -> bytes:
+    """WAV LINEAR16 mono silencioso (como el LINEAR16 de Google, con cabecera)."""
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(b"\x00\x00" * int(duration_seconds * sample_rate))
+    return buffer.getvalue()
+
+
+def opus_sized_payload(duration_seconds: float) -> bytes:
+    """
+    Bloque con cabecera OggS del tamaño que tendría un OGG_OPUS de voz a
+    FAKE_OPUS_KBPS. Sirve para medir bytes; no es un stream reproducible.
+    """
+    size = max(64, int(duration_seconds * FAKE_OPUS_KBPS * 1000 / 8))
+    return (b"OggS" + b"\x00" * (size - 4))[:size]
+
+
+class FakeTextToSpeech(TextToSpeechProvider):
+    """
+    TTS local: audio silencioso y determinístico de duración proporcional al
+    texto, en el formato pedido (MP3, WAV LINEAR16 o tamaño equivalente a OGG_OPUS).
+    """
+    name = FAKE
+
+    def __init__(self, latency_ms: float = FAKE_TTS_LATENCY_MS):
+        self.latency_ms = latency_ms
+        self.calls = 0
+
+    def synthesize(self, text, language_code, voice_name, audio_format=AUDIO_FORMATS[MP3]) -> bytes:
+        self.calls += 1
+        if self.latency_ms:
+            time.sleep(self.latency_ms / 1000)
+        duration = len(text) * FAKE_TTS_SECONDS_PER_CHAR
+        if audio_format.name == LINEAR16:
+            return silent_wav(duration, audio_format.sample_rate_hertz)
+        if audio_format.name == OGG_OPUS:
+            return opus_sized_payload(duration)
+        return silent_mp3(duration)
+
+
+# Instancias compartidas: el guion registrado vale para todo el proceso
+fake_speech_to_text = FakeSpeechToText()
+fake_text_to_speech = FakeTextToSpeech()
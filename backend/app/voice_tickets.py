@@ -0,0 +1,163 @@
+#app/voice_tickets.py
+"""
+Tickets de audio para la respuesta de voz en dos fases.
+
+/api/voice/chat puede devolver el texto apenas está la respuesta del chatbot
+junto con un ticket; el TTS corre en segundo plano y deja el audio acá hasta
+que el tótem lo descarga con GET /api/voice/audio/{ticket}.
+
+Los tickets vencen a los VOICE_AUDIO_TICKET_TTL_SECONDS y el audio guardado
+está acotado a VOICE_AUDIO_TICKET_MAX_BYTES (se descartan primero los
+tickets listos más antiguos).
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+
+# ═══════════════════════════════════════════════════════════════════
+# CONFIGURACIÓN
+# ═══════════════════════════════════════════════════════════════════
+
+TICKET_TTL_SECONDS = float(os.getenv("VOICE_AUDIO_TICKET_TTL_SECONDS", "120"))
+TICKET_MAX_BYTES = int(os.getenv("VOICE_AUDIO_TICKET_MAX_BYTES", str(32 * 1024 * 1024)))
+TICKET_MAX_COUNT = int(os.getenv("VOICE_AUDIO_TICKET_MAX_COUNT", "1000"))
+
+PENDING = "pending"
+READY = "ready"
+FAILED = "failed"
+
+
+@dataclass
+class AudioTicket:
+    """Estado del audio de una respuesta de voz."""
+    ticket_id: str
+    audio_format: str
+    expires_at: float
+    status: str = PENDING
+    audio: Optional[bytes] = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def expires_in(self) -> float:
+        return max(0.0, self.expires_at - time.monotonic())
+
+# ═══════════════════════════════════════════════════════════════════
+# ALMACÉN EN MEMORIA
+# ═══════════════════════════════════════════════════════════════════
+
+class AudioTicketStore:
+    """Tickets en memoria con vencimiento y límite de bytes (thread-safe)."""
+
+    def __init__(
+        self,
+        ttl_seconds: float = TICKET_TTL_SECONDS,
+        max_bytes: int = TICKET_MAX_BYTES,
+        max_count: int = TICKET_MAX_COUNT,
+    ):
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_count = max_count
+        self._tickets: "OrderedDict[str, AudioTicket]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.size_bytes = 0
+        self.evicted = 0
+
+    def create(self, audio_format: str) -> AudioTicket:
+        with self._lock:
+            self._purge_expired()
+            while len(self._tickets) >= self.max_count:
+                self._evict_oldest()
+            ticket = AudioTicket(
+                ticket_id=secrets.token_urlsafe(16),
+                audio_format=audio_format,
+                expires_at=time.monotonic() + self.ttl_seconds,
+            )
+            self._tickets[ticket.ticket_id] = ticket
+            return ticket
+
+    def get(self, ticket_id: str) -> Optional[AudioTicket]:
+        with self._lock:
+            self._purge_expired()
+            return self._tickets.get(ticket_id)
+
+    def complete(self, ticket_id: str, audio: bytes) -> bool:
+        """Guardar el audio de un ticket. False si venció o no entra en el límite."""
+        with self._lock:
+            self._purge_expired()
+            ticket = self._tickets.get(ticket_id)
+            if ticket is None:
+                return False
+            if len(audio) > self.max_bytes:
+                ticket.status = FAILED
+                ticket.error = "El audio supera el tamaño máximo permitido"
+                return False
+
+            while self.size_bytes + len(audio) > self.max_bytes:
+                if not self._evict_oldest(only_ready=True, keep=ticket_id):
+                    break
+            ticket.audio = audio
+            ticket.status = READY
+            self.size_bytes += len(audio)
+            return True
+
+    def fail(self, ticket_id: str, error: str) -> None:
+        with self._lock:
+            ticket = self._tickets.get(ticket_id)
+            if ticket is not None:
+                ticket.status = FAILED
+                ticket.error = error
+
+    def clear(self) -> None:
+        with self._lock:
+            self._tickets.clear()
+            self.size_bytes = 0
+            self.evicted = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            self._purge_expired()
+            pending = sum(1 for ticket in self._tickets.values() if ticket.status == PENDING)
+            return {
+                "tickets": len(self._tickets),
+                "pending": pending,
+                "size_bytes": self.size_bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "evicted": self.evicted,
+            }
+
+    # -------------------------------------------------------------------
+    # Internos (llamar con el lock tomado)
+    # -------------------------------------------------------------------
+
+    def _remove(self, ticket_id: str) -> None:
+        ticket = self._tickets.pop(ticket_id)
+        if ticket.audio is not None:
+            self.size_bytes -= len(ticket.audio)
+
+    def _purge_expired(self) -> None:
+        now = time.monotonic()
+        # Los tickets se insertan en orden de vencimiento: se corta en el primero vigente
+        while self._tickets:
+            ticket_id, ticket = next(iter(self._tickets.items()))
+            if ticket.expires_at > now:
+                break
+            self._remove(ticket_id)
+
+    def _evict_oldest(self, only_ready: bool = False, keep: Optional[str] = None) -> bool:
+        for ticket_id, ticket in self._tickets.items():
+            if ticket_id == keep or (only_ready and ticket.status != READY):
+                continue
+            self._remove(ticket_id)
+            self.evicted += 1
+            return True
+        return False
+
+
+audio_tickets = AudioTicketStore()
@@ -0,0 +1,112 @@
+#benchmarks/bench_audio_preprocess.py
+"""
+Benchmark del preprocesamiento de audio previo a Speech-to-Text.
+
+Genera un corpus determinístico de grabaciones tipo tótem (silencio largo
+antes y después de la consulta) y mide, por archivo:
+- bytes originales vs. bytes LINEAR16 enviados a STT
+- segundos de audio recortados (STT factura y tarda por segundo de audio)
+- costo del preprocesamiento (ms, mediana de varias corridas)
+- tiempo de subida estimado ahorrado según el ancho de banda indicado
+
+Uso (desde backend/):
+    python -m benchmarks.bench_audio_preprocess [--uplink-mbps 2] [--repeat 5] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+
+from app import audio_processing
+
+# (nombre, segundos de voz, silencio inicial, silencio final, sample rate, canales)
+FIXTURE_CORPUS = [
+    ("saludo_corto", 1.2, 2.0, 2.5, 48000, 2),
+    ("consulta_empresa", 3.5, 1.5, 3.0, 48000, 2),
+    ("consulta_larga", 9.0, 1.0, 2.0, 48000, 1),
+    ("pulsador_tardio", 2.0, 4.0, 1.0, 44100, 2),
+    ("sin_silencio", 4.0, 0.1, 0.1, 48000, 1),
+]
+
+# Bitrate típico del WEBM_OPUS que graba el navegador del tótem
+OPUS_REFERENCE_KBPS = 32
+
+
+def run_benchmark(uplink_mbps: float, repeat: int) -> list:
+    results = []
+    for index, (name, speech, lead, tail, rate, channels) in enumerate(FIXTURE_CORPUS):
+        wav = audio_processing.generate_sample_wav(
+            speech_seconds=speech,
+            leading_silence_seconds=lead,
+            trailing_silence_seconds=tail,
+            sample_rate=rate,
+            channels=channels,
+            seed=index,
+        )
+
+        timings = []
+        prepared = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            prepared = audio_processing.preprocess_for_stt(wav)
+            timings.append((time.perf_counter() - start) * 1000)
+
+        original_seconds = speech + lead + tail
+        opus_bytes = int(original_seconds * OPUS_REFERENCE_KBPS * 1000 / 8)
+        bytes_per_ms = uplink_mbps * 1_000_000 / 8 / 1000
+
+        results.append({
+            "file": name,
+            "original_bytes": len(wav),
+            "opus_reference_bytes": opus_bytes,
+            "stt_bytes": len(prepared.content),
+            "bytes_saved_vs_original": len(wav) - len(prepared.content),
+            "original_seconds": round(original_seconds, 2),
+            "stt_seconds": round(prepared.duration_seconds, 2),
+            "seconds_trimmed": round(prepared.trimmed_seconds, 2),
+            "preprocess_ms_median": round(statistics.median(timings), 2),
+            "upload_ms_saved": round((len(wav) - len(prepared.content)) / bytes_per_ms, 1),
+        })
+    return results
+
+
+def _print_table(results: list, uplink_mbps: float) -> None:
+    headers = [
+        ("file", 18), ("original_bytes", 14), ("stt_bytes", 10), ("original_seconds", 9),
+        ("stt_seconds", 9), ("preprocess_ms_median", 12), ("upload_ms_saved", 12),
+    ]
+    print(f"Uplink simulado: {uplink_mbps} Mbps")
+    print(" ".join(label.ljust(width) for label, width in headers))
+    for row in results:
+        print(" ".join(str(row[label]).ljust(width) for label, width in headers))
+
+    total_original = sum(r["original_bytes"] for r in results)
+    total_stt = sum(r["stt_bytes"] for r in results)
+    total_trimmed = sum(r["seconds_trimmed"] for r in results)
+    total_audio = sum(r["original_seconds"] for r in results)
+    print()
+    print(f"Bytes: {total_original} → {total_stt} ({100 * (1 - total_stt / total_original):.1f}% menos)")
+    print(f"Audio enviado a STT: {total_audio - total_trimmed:.1f}s de {total_audio:.1f}s ({total_trimmed:.1f}s recortados)")
+    print(
+        "Nota: frente a WEBM_OPUS (~32 kbps) LINEAR16 ocupa más por segundo; "
+        "el ahorro real en ese caso viene de los segundos recortados."
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--uplink-mbps", type=float, default=2.0)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.uplink_mbps, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results, args.uplink_mbps)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,160 @@
+#benchmarks/bench_db_read_modes.py
+"""
+Benchmark de lecturas con el engine sync (threadpool) vs. el engine async.
+
+Simula N peticiones concurrentes a un endpoint público de lectura usando
+el mismo camino que las rutas (`database.run_read`):
+- sync: sesión psycopg2; cada consulta ocupa un hilo del threadpool de
+  AnyIO, limitado a --threadpool hilos (40 por defecto, como en FastAPI).
+- async: sesión asyncpg; la consulta corre en el event loop con `run_sync`
+  y la concurrencia queda limitada por el pool de conexiones.
+
+Mide throughput, latencia p50/p95 y espera del pool por modo. Con Postgres,
+--query-ms agrega `pg_sleep` para simular una consulta de directorio lenta;
+en SQLite se ejecuta `SELECT 1` y el modo async requiere aiosqlite.
+
+Uso (desde backend/, con DATABASE_URL definida):
+    python -m benchmarks.bench_db_read_modes [--requests 400] [--concurrency 100]
+        [--threadpool 40] [--query-ms 20] [--modes sync,async] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import time
+
+import anyio.to_thread
+from sqlalchemy import text
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+
+
+def _read_query(db, query_ms: float, postgres: bool):
+    if postgres and query_ms:
+        return db.execute(text("SELECT pg_sleep(:seconds)"), {"seconds": query_ms / 1000}).all()
+    return db.execute(text("SELECT 1")).all()
+
+
+async def _run_load(open_session, total: int, concurrency: int, query_ms: float, postgres: bool) -> list:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            async with open_session() as db:
+                await database.run_read(db, _read_query, query_ms, postgres)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    return latencies
+
+
+class _SyncSessionContext:
+    """`async with` sobre una sesión sync, para usar el mismo driver de carga."""
+
+    def __init__(self, factory):
+        self.session = factory()
+
+    async def __aenter__(self):
+        return self.session
+
+    async def __aexit__(self, *exc_info):
+        self.session.close()
+
+
+async def _bench_mode(mode: str, url: str, args) -> dict:
+    postgres = make_url(url).get_backend_name() == "postgresql"
+    database.db_metrics.reset()
+
+    if mode == "sync":
+        anyio.to_thread.current_default_thread_limiter().total_tokens = args.threadpool
+        engine = database.create_db_engine(url)
+        factory = sessionmaker(bind=engine)
+        open_session = lambda: _SyncSessionContext(factory)
+        dispose = engine.dispose
+    else:
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+
+        engine = database.create_async_db_engine(url)
+        open_session = async_sessionmaker(engine, expire_on_commit=False)
+        dispose = engine.dispose
+
+    try:
+        # Calentar el pool antes de medir
+        await _run_load(open_session, min(args.concurrency, 10), 10, 0, postgres)
+        database.db_metrics.reset()
+
+        start = time.perf_counter()
+        latencies = sorted(await _run_load(open_session, args.requests, args.concurrency, args.query_ms, postgres))
+        elapsed = time.perf_counter() - start
+    finally:
+        result = dispose()
+        if asyncio.iscoroutine(result):
+            await result
+
+    waits = database.db_metrics.snapshot().get("checkout_wait_ms", {})
+    return {
+        "mode": mode,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "throughput_rps": round(args.requests / elapsed, 1),
+        "latency_ms_p50": round(statistics.median(latencies), 2),
+        "latency_ms_p95": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        "pool_wait_ms_p95": waits.get("p95"),
+    }
+
+
+async def run_benchmark(url: str, args) -> list:
+    results = []
+    for mode in args.modes.split(","):
+        try:
+            results.append(await _bench_mode(mode.strip(), url, args))
+        except ImportError as e:
+            results.append({"mode": mode.strip(), "skipped": str(e)})
+    return results
+
+
+def _print_table(results: list, args) -> None:
+    headers = [
+        ("mode", 6), ("throughput_rps", 15), ("latency_ms_p50", 15),
+        ("latency_ms_p95", 15), ("pool_wait_ms_p95", 17),
+    ]
+    print(
+        f"{args.requests} peticiones, concurrencia {args.concurrency}, "
+        f"threadpool {args.threadpool}, consulta {args.query_ms} ms"
+    )
+    print(" ".join(label.ljust(width) for label, width in headers))
+    for row in results:
+        if "skipped" in row:
+            print(f"{row['mode']}: omitido ({row['skipped']})")
+            continue
+        print(" ".join(str(row[label]).ljust(width) for label, width in headers))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=100)
+    parser.add_argument("--threadpool", type=int, default=40)
+    parser.add_argument("--query-ms", type=float, default=20)
+    parser.add_argument("--modes", default="sync,async")
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados en JSON")
+    args = parser.parse_args()
+    if not args.url:
+        parser.error("Definir DATABASE_URL o --url")
+
+    results = asyncio.run(run_benchmark(args.url, args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results, args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+#benchmarks/bench_password_hashing.py
+"""
+Benchmark de bcrypt inline vs. pool de hilos vs. pool de procesos.
+
+Mide dos cargas con el mismo `PasswordHasher` que usan las rutas:
+- logins: --logins verificaciones lanzadas desde --concurrency hilos (como
+  el threadpool de FastAPI durante una ráfaga de logins).
+- historial: un `verify_any` contra 6 hashes (5 del historial + la actual)
+  sin coincidencia, el peor caso de un cambio de contraseña.
+
+Para cada modo informa throughput, latencia p50/p95 y el pico de cola.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_password_hashing [--logins 48] [--concurrency 16]
+        [--workers 4] [--modes inline,thread,process] [--json]
+"""
+
+import argparse
+import json
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from app import hashing
+
+
+def _percentile(values: list, fraction: float) -> float:
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _bench_mode(mode: str, args) -> dict:
+    hasher = hashing.PasswordHasher(mode, args.workers, max_pending=args.logins, queue_timeout=60)
+    stored = hashing.pwd_context.hash("Clave123!")
+    history = [hashing.pwd_context.hash(f"Vieja{index}") for index in range(6)]
+    try:
+        # Calentar el pool (arranque de procesos) antes de medir
+        hasher.verify_any("x", history[: args.workers])
+        hasher.reset_metrics()
+
+        def one_login(_):
+            start = time.perf_counter()
+            hasher.verify("Clave123!", stored)
+            return (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            latencies = list(pool.map(one_login, range(args.logins)))
+        elapsed = time.perf_counter() - start
+        max_queue = hasher.snapshot()["max_pending_seen"]
+
+        start = time.perf_counter()
+        hasher.verify_any("Nueva123!", history)
+        history_ms = (time.perf_counter() - start) * 1000
+    finally:
+        hasher.shutdown()
+
+    return {
+        "mode": hasher.mode,
+        "logins_per_s": round(args.logins / elapsed, 1),
+        "login_ms_p50": round(statistics.median(latencies), 1),
+        "login_ms_p95": round(_percentile(latencies, 0.95), 1),
+        "max_queue": max_queue,
+        "history_check_ms": round(history_ms, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=48)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=hashing.HASHING_MAX_WORKERS)
+    parser.add_argument("--modes", default="inline,thread,process")
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    results = [_bench_mode(mode.strip(), args) for mode in args.modes.split(",")]
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+
+    headers = [("mode", 8), ("logins_per_s", 13), ("login_ms_p50", 13), ("login_ms_p95", 13),
+               ("max_queue", 10), ("history_check_ms", 17)]
+    print(f"{args.logins} logins, concurrencia {args.concurrency}, workers {args.workers}")
+    print(" ".join(label.ljust(width) for label, width in headers))
+    for row in results:
+        print(" ".join(str(row[label]).ljust(width) for label, width in headers))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+#benchmarks/bench_tts_formats.py
+"""
+Benchmark de los formatos de salida de Text-to-Speech.
+
+Sintetiza un conjunto de respuestas típicas del chatbot en cada formato
+(mp3, ogg_opus, linear16) y mide bytes del payload, bytes en base64 y
+tiempo de síntesis (mediana). La cache de TTS se saltea para medir
+síntesis reales.
+
+Con `--provider fake` (por defecto) no se usa la red: los tamaños son
+estimaciones del fake y el tiempo es la latencia configurada. Para medir
+Google real usar `--provider google` con GOOGLE_APPLICATION_CREDENTIALS.
+
+Uso (desde backend/):
+    python -m benchmarks.bench_tts_formats [--provider fake|google] [--repeat 3] [--json]
+"""
+
+import argparse
+import base64
+import json
+import statistics
+import time
+
+from app import services, voice_providers
+
+SAMPLE_ANSWERS = [
+    "Hola, soy POLO Bot del Parque Industrial Polo 52. ¿En qué puedo ayudarte?",
+    "La empresa Logística Sur se encuentra en el lote 12, sobre la calle principal.",
+    "En el parque hay 48 empresas activas. Las más consultadas son de logística, "
+    "metalmecánica y alimentos. Podés preguntarme por cualquiera de ellas.",
+    "El horario de atención de la administración del parque es de lunes a viernes de 8 a 17 horas.",
+]
+
+
+def run_benchmark(provider: str, repeat: int) -> list:
+    results = []
+    with services.use_voice_provider(provider):
+        for format_name, audio_format in voice_providers.AUDIO_FORMATS.items():
+            timings = []
+            payload_bytes = 0
+            base64_bytes = 0
+            for _ in range(repeat):
+                payload_bytes = 0
+                base64_bytes = 0
+                start = time.perf_counter()
+                for answer in SAMPLE_ANSWERS:
+                    audio = services.text_to_speech(answer, audio_format=format_name, use_cache=False)
+                    payload_bytes += len(audio)
+                    base64_bytes += len(base64.b64encode(audio))
+                timings.append((time.perf_counter() - start) * 1000 / len(SAMPLE_ANSWERS))
+
+            results.append({
+                "format": format_name,
+                "media_type": audio_format.media_type,
+                "sample_rate_hertz": audio_format.sample_rate_hertz,
+                "payload_bytes_total": payload_bytes,
+                "payload_bytes_avg": payload_bytes // len(SAMPLE_ANSWERS),
+                "base64_bytes_total": base64_bytes,
+                "synthesis_ms_median": round(statistics.median(timings), 2),
+            })
+    return results
+
+
+def _print_table(results: list, provider: str) -> None:
+    headers = [
+        ("format", 10), ("payload_bytes_avg", 18), ("payload_bytes_total", 20),
+        ("base64_bytes_total", 19), ("synthesis_ms_median", 20),
+    ]
+    print(f"Proveedor: {provider} · {len(SAMPLE_ANSWERS)} respuestas por formato")
+    print(" ".join(label.ljust(width) for label, width in headers))
+    for row in results:
+        print(" ".join(str(row[label]).ljust(width) for label, width in headers))
+
+    baseline = next(r for r in results if r["format"] == voice_providers.MP3)["payload_bytes_total"]
+    print()
+    for row in results:
+        print(f"{row['format']}: {100 * row['payload_bytes_total'] / baseline:.0f}% del tamaño MP3")
+    if provider == voice_providers.FAKE:
+        print("Nota: con el proveedor fake los tamaños son estimados y el tiempo es la latencia simulada.")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--provider", choices=voice_providers.SUPPORTED_PROVIDERS, default=voice_providers.FAKE)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", action="store_true", help="Imprimir resultados en JSON")
+    args = parser.parse_args()
+
+    results = run_benchmark(args.provider, args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        _print_table(results, args.provider)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,21 @@
 import io
+from datetime import date
 from typing import Dict, Iterator
 
 import pytest
 from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
 
 from app.main import app
 from app.routes.auth import require_public_role
 from app.config import get_db
+from app.principals import principal_cache
+from app.security_epochs import epoch_cache
+from app.reference_data import reference_catalog
+from app import models, rate_limit
+from app.config import Base
 
 
 class DummyUser:
@@ -27,6 +36,11 @@ def override_dependencies():
     """
     Sobrescribe dependencias globales del proyecto para aislar las pruebas.
     """
+    # Cada prueba usa su propia base: no arrastrar catálogos de otra
+    reference_catalog.invalidate()
+    principal_cache.clear()
+    epoch_cache.invalidate()
+    rate_limit.backend.clear()
     app.dependency_overrides[require_public_role] = lambda: DummyUser()
     app.dependency_overrides[get_db] = _dummy_db
     client = TestClient(app)
@@ -44,3 +58,60 @@ def client(override_dependencies) -> TestClient:
 def sample_audio_bytes() -> bytes:
     """Audio ficticio en formato bytes para las pruebas."""
     return io.BytesIO(b"fake audio bytes").getvalue()
+
+
+@pytest.fixture
+def memory_engine():
+    """SQLite en memoria con todas las tablas, compartida entre hilos (StaticPool)."""
+    engine = create_engine(
+        "sqlite:///:memory:",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool,
+    )
+    Base.metadata.create_all(bind=engine)
+    yield engine
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
+
+
+@pytest.fixture
+def recorded_statements(memory_engine) -> list:
+    """SQL ejecutado sobre `memory_engine` (vaciar con .clear() antes de medir)."""
+    statements = []
+    event.listen(memory_engine, "before_cursor_execute", lambda *args: statements.append(args[2]))
+    return statements
+
+
+@pytest.fixture
+def seeded_db(memory_engine):
+    """
+    Sembrar una empresa activa (cuil 1234) y un usuario suyo.
+
+    Devuelve una función `seed(nombre, contrasena, roles)` → (session, user):
+    cada rol de `roles` se crea con id_rol correlativo desde 1 y se le asigna.
+    """
+    sessions = []
+
+    def seed(nombre: str = "empresa", contrasena: str = "x", roles=()):
+        session = sessionmaker(bind=memory_engine)()
+        sessions.append(session)
+        session.add(models.Empresa(
+            cuil=1234, nombre="Empresa", rubro="Logística", cant_empleados=10, observaciones="",
+            fecha_ingreso=date(2020, 1, 1), horario_trabajo="08-16", estado=True,
+        ))
+        session.add_all([models.Rol(id_rol=id_rol, tipo_rol=tipo) for id_rol, tipo in enumerate(roles, start=1)])
+        user = models.Usuario(
+            nombre=nombre, email=f"{nombre}@test.com", contrasena=contrasena, estado=True,
+            fecha_registro=date.today(), cuil=1234,
+        )
+        session.add(user)
+        session.flush()
+        session.add_all([
+            models.RolUsuario(id_usuario=user.id_usuario, id_rol=id_rol) for id_rol in range(1, len(roles) + 1)
+        ])
+        session.commit()
+        return session, user
+
+    yield seed
+    for session in sessions:
+        session.close()
@@ -270,39 +270,70 @@ def test_users_limits_status(admin_client):
     assert data["limites_configurados"]["polo_cuil"] == POLO_TEST_CUIL
 
 
-def test_change_password_request(admin_client, monkeypatch):
-    client, SessionLocal, ctx = admin_client
-
-    monkeypatch.setattr(services, "create_password_reset_token", lambda email: "token123")
+def test_users_limits_status_uses_one_aggregate_and_cache(admin_client):
+    from sqlalchemy import event
 
-    called = {}
+    client, SessionLocal, ctx = admin_client
+    engine = SessionLocal.kw["bind"]
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    # El guard de admin del fixture consulta la base: se reemplaza para contar solo el endpoint
+    app.dependency_overrides[admin_routes.require_admin_polo] = lambda: object()
+    admin_routes.limits_status_cache.invalidate()
+    event.listen(engine, "before_cursor_execute", count)
+    try:
+        first = client.get("/usuarios/limits-status")
+        queries_first = len(statements)
+        cached = client.get("/usuarios/limits-status")
+        queries_cached = len(statements) - queries_first
+    finally:
+        event.remove(engine, "before_cursor_execute", count)
+
+    assert first.status_code == 200
+    assert cached.json() == first.json()
+    # Una consulta agrupada + el listado de empresas, sin importar cuántas haya
+    assert queries_first == 2
+    assert queries_cached == 0
+    data = first.json()
+    assert data["polo_info"]["admin_polo_actuales"] == 1
+    empresa = next(e for e in data["empresas_info"] if e["cuil"] == ctx["empresa_cuil"])
+    assert empresa["admin_empresa_actuales"] == 0
+
+    # Confirmar un usuario nuevo invalida la cache
+    session = SessionLocal()
+    user = models.Usuario(
+        nombre="adminempresa", email="ae@empresa.com", contrasena="x", estado=True,
+        fecha_registro=date.today(), cuil=ctx["empresa_cuil"],
+    )
+    session.add(user)
+    session.flush()
+    session.add(models.RolUsuario(id_usuario=user.id_usuario, id_rol=ctx["role_admin_empresa"]))
+    session.commit()
+    session.close()
 
-    def fake_send(*args, **kwargs):
-        called["sent"] = True
-        return True
+    updated = client.get("/usuarios/limits-status").json()
+    empresa = next(e for e in updated["empresas_info"] if e["cuil"] == ctx["empresa_cuil"])
+    assert empresa["admin_empresa_actuales"] == 1
 
-    monkeypatch.setattr(services, "send_password_change_notification", fake_send)
 
-    class DummySMTP:
-        def __init__(self, *args, **kwargs):
-            pass
-        def starttls(self):
-            pass
-        def login(self, *args, **kwargs):
-            pass
-        def send_message(self, *args, **kwargs):
-            called["smtp"] = True
-        def __enter__(self):
-            return self
-        def __exit__(self, exc_type, exc, tb):
-            pass
+def test_change_password_request(admin_client, monkeypatch):
+    client, SessionLocal, ctx = admin_client
 
-    import types, sys
-    monkeypatch.setitem(sys.modules, "smtplib", types.SimpleNamespace(SMTP=DummySMTP))
+    monkeypatch.setattr(services, "create_password_reset_token", lambda email: "token123")
 
     response = client.post("/polo/change-password-request")
     assert response.status_code == 200
-    assert called.get("smtp") is True
+
+    # El email queda en la bandeja de salida; no se abre SMTP en la petición
+    session = SessionLocal()
+    queued = session.query(models.EmailPendiente).one()
+    session.close()
+    assert queued.destinatario.startswith("admin@")
+    assert "token123" in queued.cuerpo
+    assert queued.estado == "pendiente"
 
 
 def test_list_roles_and_get_user(admin_client):
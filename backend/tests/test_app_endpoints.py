@@ -1,7 +1,11 @@
+import asyncio
 from unittest.mock import patch
 
+import pytest
 from fastapi.testclient import TestClient
 
+from app import email_outbox, main, rate_limit, reset_tokens
+
 
 def test_read_root(client: TestClient):
     response = client.get("/")
@@ -25,3 +29,17 @@ def test_voice_status_endpoint(client: TestClient):
         response = client.get("/api/voice/status")
     assert response.status_code == 200
     assert response.json()["data"] == fake_status
+
+
+def test_startup_runs_every_schema_step_and_fails_loudly(capsys):
+    with patch.object(rate_limit, "ensure_schema", side_effect=RuntimeError("sin permisos")), \
+            patch.object(reset_tokens, "ensure_schema") as tokens_schema, \
+            patch.object(email_outbox, "ensure_schema") as outbox_schema, \
+            patch.object(email_outbox, "start_worker") as start_worker:
+        with pytest.raises(RuntimeError, match="Límites de tasa"):
+            asyncio.run(main.startup_event())
+    # La falla de uno no saltea a los siguientes
+    tokens_schema.assert_called_once()
+    outbox_schema.assert_called_once()
+    start_worker.assert_not_called()
+    assert "Límites de tasa: Error - sin permisos" in capsys.readouterr().out
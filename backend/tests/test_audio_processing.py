@@ -0,0 +1,146 @@
+import io
+import time
+import wave
+from unittest.mock import patch
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from app import audio_processing, services
+
+
+def test_preprocess_trims_silence_downmixes_and_resamples():
+    wav = audio_processing.generate_sample_wav(
+        speech_seconds=1.0,
+        leading_silence_seconds=1.5,
+        trailing_silence_seconds=1.5,
+        sample_rate=48000,
+        channels=2,
+    )
+
+    prepared = audio_processing.preprocess_for_stt(wav)
+
+    assert prepared is not None
+    assert prepared.encoding == "LINEAR16"
+    assert prepared.sample_rate_hertz == 16000
+    assert prepared.has_speech
+    # 1 s de voz + relleno del VAD, muy por debajo de los 4 s originales
+    assert 0.9 <= prepared.duration_seconds <= 1.6
+    assert prepared.trimmed_seconds >= 2.4
+    assert len(prepared.content) < len(wav) / 8
+
+
+def test_preprocess_keeps_untrimmed_audio_when_vad_finds_no_speech():
+    wav = audio_processing.generate_sample_wav(
+        speech_seconds=0.0,
+        leading_silence_seconds=1.0,
+        trailing_silence_seconds=1.0,
+    )
+    prepared = audio_processing.preprocess_for_stt(wav)
+    assert prepared is not None
+    assert prepared.has_speech is False
+    # Sin recorte: 2 s a 16 kHz LINEAR16
+    assert len(prepared.content) == 2 * 16000 * 2
+    assert prepared.trimmed_seconds == 0.0
+
+
+def test_preprocess_returns_none_for_undecodable_audio(monkeypatch):
+    monkeypatch.setattr(audio_processing, "FFMPEG_BIN", "ffmpeg-no-instalado")
+    assert audio_processing.preprocess_for_stt(b"\x1aE\xdf\xa3webm-opus") is None
+
+
+def test_resample_integer_factor_keeps_duration():
+    samples = np.ones(48000, dtype=np.float32)
+    resampled = audio_processing.resample(samples, 48000, 16000)
+    assert resampled.size == 16000
+
+
+def test_transcribe_audio_sends_linear16_after_preprocessing(monkeypatch):
+    wav = audio_processing.generate_sample_wav(speech_seconds=0.5)
+    monkeypatch.setattr(services, "VOICE_PROVIDER", "google")
+    monkeypatch.setattr(services, "speech_client", object())
+
+    with patch.object(services, "transcribe_audio_google", return_value="hola") as google_mock:
+        assert services.transcribe_audio(wav) == "hola"
+
+    args, kwargs = google_mock.call_args
+    assert kwargs["encoding"] == "LINEAR16"
+    assert kwargs["sample_rate_hertz"] == 16000
+    assert len(args[0]) < len(wav)
+
+
+def _constant_tone_wav(seconds=1.0, sample_rate=16000):
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    pcm = (0.3 * np.sin(2 * np.pi * 220 * t) * 32767).astype("<i2")
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as wav_file:
+        wav_file.setnchannels(1)
+        wav_file.setsampwidth(2)
+        wav_file.setframerate(sample_rate)
+        wav_file.writeframes(pcm.tobytes())
+    return buffer.getvalue()
+
+
+def test_transcribe_audio_sends_untrimmed_audio_when_vad_finds_no_speech(monkeypatch):
+    # Nivel constante: el piso de ruido sale del propio audio y ningún frame lo supera
+    wav = _constant_tone_wav()
+    assert audio_processing.preprocess_for_stt(wav).has_speech is False
+    monkeypatch.setattr(services, "VOICE_PROVIDER", "google")
+    monkeypatch.setattr(services, "speech_client", object())
+
+    with patch.object(services, "transcribe_audio_google", return_value="hola") as google_mock:
+        assert services.transcribe_audio(wav) == "hola"
+    args, kwargs = google_mock.call_args
+    assert len(args[0]) == 16000 * 2
+    assert kwargs["encoding"] == "LINEAR16"
+
+
+def test_split_prepared_audio_cuts_at_pauses_and_keeps_order():
+    wav = audio_processing.generate_sample_wav(
+        speech_seconds=6.0,
+        leading_silence_seconds=0.5,
+        trailing_silence_seconds=0.5,
+        utterances=4,
+        pause_seconds=0.6,
+    )
+    prepared = audio_processing.preprocess_for_stt(wav)
+
+    segments = audio_processing.split_prepared_audio(prepared, max_segment_seconds=3.0)
+
+    assert len(segments) >= 3
+    assert all(segment.duration_seconds <= 3.0 for segment in segments)
+    assert all(segment.has_speech for segment in segments)
+    # Los cortes caen en pausas: la voz total se conserva (±relleno del VAD)
+    total_speech = sum(segment.duration_seconds for segment in segments)
+    assert 5.5 <= total_speech <= prepared.duration_seconds
+
+
+def test_transcribe_audio_long_mode_stitches_segments_in_order(monkeypatch):
+    wav = audio_processing.generate_sample_wav(
+        speech_seconds=6.0,
+        utterances=4,
+        pause_seconds=0.6,
+        sample_rate=16000,
+        channels=1,
+    )
+    monkeypatch.setattr(services, "VOICE_PROVIDER", "google")
+    monkeypatch.setattr(services, "speech_client", object())
+    monkeypatch.setattr(audio_processing, "LONG_AUDIO_SEGMENT_SECONDS", 3.0)
+
+    calls = []
+
+    def fake_google(content, language_code, encoding, sample_rate_hertz):
+        calls.append(language_code)
+        # Los segmentos más largos tardan más: el orden final no debe depender de eso
+        time.sleep(len(content) / 1_000_000)
+        return f"parte{len(content)}"
+
+    with patch.object(services, "transcribe_audio_google", side_effect=fake_google):
+        transcript = services.transcribe_audio(wav, "es-AR", long_audio=True)
+
+    segments = audio_processing.split_prepared_audio(
+        audio_processing.preprocess_for_stt(wav), max_segment_seconds=3.0
+    )
+    assert transcript == " ".join(f"parte{len(segment.content)}" for segment in segments)
+    assert calls == ["es-AR"] * len(segments)
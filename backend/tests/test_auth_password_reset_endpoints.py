@@ -7,7 +7,7 @@ from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 
-from app import models, services
+from app import models, reset_tokens, services
 from app.config import Base
 from app.main import app
 from app.routes import auth as auth_routes
@@ -83,7 +83,7 @@ def seeded_reset_client(reset_client):
     return client, SessionLocal, user_data
 
 
-def test_forgot_password_sends_email_when_user_active(seeded_reset_client):
+def test_forgot_password_queues_email_when_user_active(seeded_reset_client):
     client, SessionLocal, user = seeded_reset_client
 
     with patch("smtplib.SMTP") as smtp_mock:
@@ -91,7 +91,13 @@ def test_forgot_password_sends_email_when_user_active(seeded_reset_client):
 
     assert response.status_code == 200
     assert "expires_in_minutes" in response.json()
-    smtp_mock.assert_called()
+    # El envío lo hace el worker de la bandeja, fuera de la petición
+    smtp_mock.assert_not_called()
+    session = SessionLocal()
+    queued = session.query(models.EmailPendiente).one()
+    session.close()
+    assert queued.destinatario == user["email"]
+    assert "/reset-password?token=" in queued.cuerpo
 
 
 def test_forgot_password_rejects_unknown_email(reset_client):
@@ -145,3 +151,31 @@ def test_forgot_password_confirm_handles_used_token(seeded_reset_client):
     body = response.json()
     assert body["success"] is False
     assert body["used"] is True
+
+
+def test_forgot_password_confirm_cannot_replay_token_across_workers(seeded_reset_client, memory_engine, monkeypatch):
+    client, SessionLocal, user = seeded_reset_client
+    # Dos workers con su propia instancia del registro compartido
+    worker_a = reset_tokens.DatabaseTokenStore(memory_engine)
+    worker_b = reset_tokens.DatabaseTokenStore(memory_engine)
+    token = services.create_password_reset_token(user["email"], expires_minutes=5)
+
+    monkeypatch.setattr(services, "USED_RESET_TOKENS", worker_a)
+    first = client.post("/forgot-password/confirm", json={
+        "token": token, "new_password": "NuevaClave1", "confirm_password": "NuevaClave1",
+    })
+    assert first.json()["success"] is True
+
+    # Confirmación concurrente: pasó la verificación previa antes de que A consumiera
+    monkeypatch.setattr(services, "USED_RESET_TOKENS", worker_b)
+    monkeypatch.setattr(services, "is_token_already_used", lambda token_id: False)
+    second = client.post("/forgot-password/confirm", json={
+        "token": token, "new_password": "OtraClave2", "confirm_password": "OtraClave2",
+    })
+    assert second.json()["success"] is False
+    assert second.json()["used"] is True
+
+    session = SessionLocal()
+    stored = session.query(models.Usuario).filter_by(email=user["email"]).one()
+    assert services.verify_password("NuevaClave1", stored.contrasena)
+    session.close()
@@ -0,0 +1,80 @@
+import json
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app import services
+
+
+class _RecordingModel:
+    """Modelo Gemini falso: intención con SQL y luego una respuesta natural."""
+
+    def __init__(self, final_text="Hay diez empresas de logística, entre ellas Empresa 0."):
+        self.calls = []
+        self.final_text = final_text
+
+    def generate_content(self, prompt, generation_config=None):
+        self.calls.append((prompt, generation_config))
+        if len(self.calls) == 1:
+            intent = {"needs_more_info": False, "sql_query": "SELECT nombre FROM empresa", "direct_answer": ""}
+            return SimpleNamespace(text=json.dumps(intent))
+        return SimpleNamespace(text=self.final_text)
+
+
+ROWS = [{"nombre": f"Empresa {index}", "rubro": "Logística"} for index in range(10)]
+
+
+def _run_chat(channel, model):
+    with patch.object(services, "model", model), \
+         patch.object(services, "get_database_schema", return_value="empresa(nombre, rubro)"), \
+         patch.object(services, "execute_sql_query", return_value=ROWS):
+        return services.get_chat_response(None, "empresas de logística", None, channel=channel)
+
+
+def test_voice_channel_uses_tighter_profile_and_top_rows():
+    services.channel_metrics.reset()
+    model = _RecordingModel()
+
+    text, db_results, _ = _run_chat(services.VOICE_CHANNEL, model)
+
+    assert text.startswith("Hay diez empresas")
+    assert db_results == ROWS
+    final_prompt, config = model.calls[-1]
+    voice_profile = services.CHANNEL_PROFILES[services.VOICE_CHANNEL]
+    assert config is voice_profile.generation_config
+    assert config.max_output_tokens < services.CHANNEL_PROFILES[services.TEXT_CHANNEL].generation_config.max_output_tokens
+    assert "se va a leer en voz alta" in final_prompt
+    assert "Total de coincidencias: 10" in final_prompt
+    assert f"Empresa {voice_profile.max_rows - 1}" in final_prompt
+    assert f"Empresa {voice_profile.max_rows}\"" not in final_prompt
+
+    metrics = services.channel_metrics.snapshot()
+    assert metrics["voice"]["requests"] == 1
+    assert "text" not in metrics
+
+
+def test_text_channel_keeps_list_style_prompt():
+    model = _RecordingModel()
+    _run_chat(services.TEXT_CHANNEL, model)
+    final_prompt, config = model.calls[-1]
+    assert config is services.CHANNEL_PROFILES[services.TEXT_CHANNEL].generation_config
+    assert "lista corta usando guiones" in final_prompt
+
+
+def test_voice_fallback_is_speakable_without_dashes():
+    text = services.compose_fallback_response(ROWS, max_rows=3, speakable=True)
+    assert text.startswith("Encontré 10 registros.")
+    assert "- " not in text
+    assert "Empresa 2" in text and "Empresa 3" not in text
+
+
+def test_voice_chat_with_audio_records_tts_characters(monkeypatch):
+    services.channel_metrics.reset()
+    monkeypatch.setattr(services, "VOICE_PROVIDER", "fake")
+    with patch.object(services, "get_chat_response", return_value=("Respuesta corta.", [], None)) as chat_mock:
+        result = services.get_chat_response_with_audio(None, text_message="Hola")
+
+    assert chat_mock.call_args.kwargs["channel"] == services.VOICE_CHANNEL
+    assert result["audio_base64"]
+    metrics = services.channel_metrics.snapshot()["voice"]
+    assert metrics["tts_requests"] == 1
+    assert metrics["tts_characters"] == len("Respuesta corta.")
@@ -0,0 +1,179 @@
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import sessionmaker
+
+from app import database
+
+
+@pytest.fixture(autouse=True)
+def reset_db_metrics():
+    database.db_metrics.reset()
+    yield
+    database.db_metrics.reset()
+
+
+def test_file_engine_uses_instrumented_pool_and_records_waits(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'pool.db'}", pool_size=3, max_overflow=1)
+    try:
+        with engine.connect() as connection:
+            connection.execute(text("SELECT 1"))
+
+        metrics = database.pool_metrics(engine)
+        assert metrics["pool"] == "InstrumentedQueuePool"
+        assert metrics["size"] == 3
+        assert metrics["max_overflow"] == 1
+        assert metrics["checkouts"] == 1
+        assert metrics["queries"] >= 1
+        assert metrics["checkout_wait_ms"]["samples"] == 1
+        assert engine.echo is False
+    finally:
+        engine.dispose()
+
+
+def test_pool_timeout_is_counted(tmp_path):
+    engine = database.create_db_engine(
+        f"sqlite:///{tmp_path / 'timeout.db'}", pool_size=1, max_overflow=0, pool_timeout=0.05
+    )
+    try:
+        held = engine.connect()
+        with pytest.raises(PoolTimeoutError):
+            engine.connect()
+        held.close()
+        assert database.pool_metrics(engine)["checkout_timeouts"] == 1
+    finally:
+        engine.dispose()
+
+
+def test_slow_queries_are_logged_when_sampled(monkeypatch, capsys):
+    monkeypatch.setattr(database.db_settings, "SLOW_QUERY_MS", 0.0)
+    monkeypatch.setattr(database.db_settings, "SLOW_QUERY_LOG_SAMPLE_RATE", 1.0)
+    engine = database.create_db_engine("sqlite:///:memory:")
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 42"))
+    assert "Consulta lenta" in capsys.readouterr().out
+    assert database.db_metrics.snapshot()["slow_queries"] == 1
+
+    monkeypatch.setattr(database.db_settings, "SLOW_QUERY_LOG_SAMPLE_RATE", 0.0)
+    with engine.connect() as connection:
+        connection.execute(text("SELECT 43"))
+    assert "SELECT 43" not in capsys.readouterr().out
+    assert database.db_metrics.snapshot()["slow_queries"] == 2
+
+
+def test_failed_statements_do_not_leak_query_start(tmp_path):
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'errors.db'}", pool_size=1, max_overflow=0)
+    try:
+        for _ in range(3):
+            with engine.connect() as connection:
+                with pytest.raises(Exception):
+                    connection.execute(text("SELECT * FROM tabla_inexistente"))
+                connection.execute(text("SELECT 1"))
+                # Misma conexión del pool en cada vuelta: la pila queda vacía
+                assert connection.info.get("query_start") == []
+    finally:
+        engine.dispose()
+
+
+def test_role_timeouts_are_stricter_for_chatbot():
+    api = database._postgres_options(database.ROLE_API)
+    chatbot = database._postgres_options(database.ROLE_CHATBOT)
+    assert f"-c statement_timeout={database.db_settings.STATEMENT_TIMEOUT_MS}" in api
+    assert f"-c statement_timeout={database.db_settings.CHATBOT_STATEMENT_TIMEOUT_MS}" in chatbot
+    assert "idle_in_transaction_session_timeout" in chatbot
+    assert database.db_settings.CHATBOT_STATEMENT_TIMEOUT_MS < database.db_settings.STATEMENT_TIMEOUT_MS
+
+    # En SQLite no hay SET LOCAL: la sesión sigue funcionando igual
+    engine = database.create_db_engine("sqlite:///:memory:")
+    db = sessionmaker(bind=engine)()
+    try:
+        database.apply_role_timeouts(db, database.ROLE_CHATBOT)
+        assert db.execute(text("SELECT 1")).scalar() == 1
+    finally:
+        db.close()
+
+
+def test_all_routers_share_the_canonical_session_dependency():
+    from app import config
+    from app.routes import admin_users, auth, company_user, google_auth, tipos
+
+    for module in (auth, admin_users, company_user, google_auth):
+        assert module.get_db is config.get_db
+    # Sin DB_ASYNC_ENABLED las lecturas públicas usan la misma sesión sync
+    assert tipos.get_read_db is config.get_db
+
+
+def test_async_read_session_is_rejected_next_to_sync_dependencies():
+    from fastapi import APIRouter, Depends
+
+    from app import config
+    from app.main import app
+
+    def guard(db=Depends(config.get_db)):
+        return db
+
+    router = APIRouter()
+
+    @router.get("/solo-lectura")
+    async def read_only(db=Depends(config.get_async_read_db)):
+        return None
+
+    @router.get("/con-guard", dependencies=[Depends(guard)])
+    async def guarded(db=Depends(config.get_async_read_db)):
+        return None
+
+    # Guard + sesión async serían dos conexiones (una por pool) en la petición
+    assert config.read_db_conflicts(router.routes) == ["GET /con-guard"]
+    assert config.read_db_conflicts(app.routes) == []
+
+
+def test_request_uses_one_connection_and_reports_headers(client, tmp_path):
+    from app import config
+    from app.main import app
+
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'request.db'}")
+    config.Base.metadata.create_all(engine)
+    with engine.begin() as connection:
+        connection.execute(text("INSERT INTO tipo_vehiculo (tipo) VALUES ('Camion')"))
+    SessionTest = sessionmaker(bind=engine)
+
+    def override_get_db():
+        db = SessionTest()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[config.get_db] = override_get_db
+    try:
+        response = client.get("/tipos/vehiculo")
+    finally:
+        engine.dispose()
+
+    assert response.status_code == 200
+    assert response.json()[0]["tipo"] == "Camion"
+    assert response.headers["X-DB-Connections"] == "1"
+    assert int(response.headers["X-DB-Queries"]) >= 1
+
+
+def test_run_read_uses_threadpool_for_sync_sessions(tmp_path):
+    import asyncio
+    import threading
+
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'read.db'}")
+    db = sessionmaker(bind=engine)()
+    main_thread = threading.get_ident()
+
+    def read(session, value):
+        return session.execute(text("SELECT :value"), {"value": value}).scalar(), threading.get_ident()
+
+    try:
+        value, thread_id = asyncio.run(database.run_read(db, read, 7))
+    finally:
+        db.close()
+        engine.dispose()
+    assert value == 7
+    assert thread_id != main_thread
+
+    assert database.to_async_url("postgresql+psycopg2://u:p@db:5432/polo") == "postgresql+asyncpg://u:p@db:5432/polo"
+    assert database.to_async_url("sqlite:///./polo.db") == "sqlite+aiosqlite:///./polo.db"
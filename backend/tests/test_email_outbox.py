@@ -0,0 +1,186 @@
+import socketserver
+import threading
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy.orm import sessionmaker
+
+from app import email_outbox, models
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """SMTP mínimo (sin TLS ni AUTH) que guarda los mensajes recibidos."""
+
+    def _reply(self, line):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        server.connections += 1
+        self._reply("220 stand-in")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command in ("EHLO", "HELO"):
+                self._reply("250 stand-in")
+            elif command == "MAIL" and server.reject_next:
+                server.reject_next -= 1
+                self._reply("451 reintentar más tarde")
+            elif command in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self._reply("250 OK")
+            elif command == "DATA":
+                self._reply("354 fin con .")
+                data = []
+                while (chunk := self.rfile.readline().decode()) not in (".\r\n", ""):
+                    data.append(chunk)
+                server.messages.append("".join(data))
+                self._reply("250 OK")
+            elif command == "QUIT":
+                self._reply("221 chau")
+                return
+            else:
+                self._reply("502 no implementado")
+
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", 0), _SmtpHandler)
+    server.daemon_threads = True
+    server.connections, server.messages, server.reject_next = 0, [], 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def outbox_db(memory_engine):
+    return sessionmaker(bind=memory_engine)
+
+
+def _worker(SessionLocal, smtp_server, batch_size=2):
+    host, port = smtp_server.server_address
+    return email_outbox.OutboxWorker(
+        session_factory=SessionLocal,
+        connection_factory=lambda: email_outbox.SmtpConnection(host, port, None, None, starttls=False),
+        batch_size=batch_size,
+    )
+
+
+def test_worker_sends_batches_over_one_connection(outbox_db, smtp_server):
+    session = outbox_db()
+    for index in range(5):
+        email_outbox.enqueue(session, f"user{index}@test.com", f"Asunto {index}", "Contraseña temporal: X1")
+    session.rollback()
+    assert session.query(models.EmailPendiente).count() == 0
+
+    for index in range(5):
+        email_outbox.enqueue(session, f"user{index}@test.com", f"Asunto {index}", "Contraseña temporal: X1")
+    session.commit()
+    session.close()
+
+    worker = _worker(outbox_db, smtp_server)
+    assert worker.run_once() == 5
+    worker.stop()
+
+    assert len(smtp_server.messages) == 5
+    assert smtp_server.connections == 1
+    assert worker.snapshot()["batches"] == 3
+    session = outbox_db()
+    sent = session.query(models.EmailPendiente).all()
+    assert {email.estado for email in sent} == {email_outbox.ENVIADO}
+    # El cuerpo (credenciales) no queda guardado después del envío
+    assert {email.cuerpo for email in sent} == {""}
+    session.close()
+
+
+def test_failed_send_is_retried_with_backoff(outbox_db, smtp_server, monkeypatch):
+    monkeypatch.setattr(email_outbox, "EMAIL_OUTBOX_MAX_ATTEMPTS", 2)
+    session = outbox_db()
+    email_outbox.enqueue(session, "user@test.com", "Asunto", "Cuerpo")
+    session.commit()
+    session.close()
+
+    smtp_server.reject_next = 1
+    worker = _worker(outbox_db, smtp_server)
+    assert worker.run_once() == 0
+    session = outbox_db()
+    email = session.query(models.EmailPendiente).one()
+    assert email.estado == email_outbox.PENDIENTE
+    assert email.intentos == 1
+    assert email.proximo_intento > datetime.utcnow() + timedelta(seconds=20)
+    assert "451" in email.ultimo_error
+
+    # Vencido el backoff se reintenta por la misma conexión
+    email.proximo_intento = datetime.utcnow()
+    session.commit()
+    session.close()
+    assert worker.run_once() == 1
+    worker.stop()
+    assert len(smtp_server.messages) == 1
+    assert smtp_server.connections == 1
+    assert worker.snapshot()["retried"] == 1
+
+
+def test_commit_with_queued_email_wakes_worker(outbox_db, monkeypatch):
+    woken = []
+    monkeypatch.setattr(email_outbox.outbox_worker, "wake", lambda: woken.append(True))
+    session = outbox_db()
+    session.commit()
+    assert woken == []
+    email_outbox.enqueue(session, "user@test.com", "Asunto", "Cuerpo")
+    session.commit()
+    assert woken == [True]
+    session.close()
+
+
+def test_batch_is_claimed_and_sent_outside_a_transaction(outbox_db):
+    session = outbox_db()
+    for index in range(2):
+        email_outbox.enqueue(session, f"user{index}@test.com", "Asunto", "Cuerpo")
+    session.commit()
+
+    class _Connection:
+        def __init__(self):
+            self.states = []
+
+        def send(self, to, subject, body):
+            # Ni transacción abierta ni filas bloqueadas mientras se habla con SMTP
+            assert not session.in_transaction()
+            check = outbox_db()
+            self.states.append(sorted(email.estado for email in check.query(models.EmailPendiente)))
+            check.close()
+
+    connection = _Connection()
+    result = email_outbox.send_batch(session, connection, batch_size=5)
+    assert result["sent"] == 2
+    # Cada resultado se guarda enseguida, sin esperar al final del lote
+    assert connection.states == [
+        [email_outbox.ENVIANDO, email_outbox.ENVIANDO],
+        [email_outbox.ENVIADO, email_outbox.ENVIANDO],
+    ]
+    assert not session.in_transaction()
+    session.close()
+
+
+def test_expired_lease_is_claimed_again(outbox_db, smtp_server):
+    session = outbox_db()
+    email_outbox.enqueue(session, "user@test.com", "Asunto", "Cuerpo")
+    session.commit()
+    # Un worker reservó la fila y murió antes de registrar el envío
+    claimed = email_outbox._claim(session, 5, datetime.utcnow())
+    assert len(claimed) == 1
+    assert email_outbox._claim(session, 5, datetime.utcnow()) == []
+
+    email = session.query(models.EmailPendiente).one()
+    email.proximo_intento = datetime.utcnow() - timedelta(seconds=1)
+    session.commit()
+    session.close()
+
+    worker = _worker(outbox_db, smtp_server)
+    assert worker.run_once() == 1
+    worker.stop()
+    assert len(smtp_server.messages) == 1
@@ -0,0 +1,76 @@
+import pytest
+from fastapi import HTTPException
+
+from app import hashing, services
+
+
+def test_process_pool_hashes_and_reports_metrics():
+    hasher = hashing.PasswordHasher("process", max_workers=2, max_pending=4, queue_timeout=5)
+    try:
+        hashed = hasher.hash("Clave123!")
+        assert hasher.verify("Clave123!", hashed) is True
+        assert hasher.verify("otra", hashed) is False
+    finally:
+        hasher.shutdown()
+
+    metrics = hasher.snapshot()
+    assert metrics["executor"] in ("process", "thread")
+    assert metrics["operations"] == 3
+    assert metrics["pending"] == 0
+    assert metrics["latency_ms"]["samples"] == 3
+
+
+def test_verify_any_checks_history_in_parallel():
+    hasher = hashing.PasswordHasher("thread", max_workers=3, max_pending=2, queue_timeout=5)
+    history = [hashing.pwd_context.hash(f"Vieja{index}") for index in range(5)]
+    try:
+        assert hasher.verify_any("Vieja3", history) is True
+        assert hasher.verify_any("Nueva", history) is False
+        assert hasher.verify_any("Nueva", []) is False
+    finally:
+        hasher.shutdown()
+    # Más hashes que lugares en la cola: se toman solo los disponibles
+    assert hasher.snapshot()["max_pending_seen"] == 2
+
+
+def test_saturated_hasher_rejects_with_503():
+    hasher = hashing.PasswordHasher("inline", max_workers=1, max_pending=1, queue_timeout=0.05)
+    hasher._acquire(1)
+    with pytest.raises(HTTPException) as exc:
+        hasher.hash("Clave123!")
+    assert exc.value.status_code == 503
+    assert hasher.snapshot()["rejected"] == 1
+
+    # services sigue exponiendo pwd_context para quien lo importe
+    assert services.pwd_context is hashing.pwd_context
+
+
+def test_broken_process_pool_is_recreated_and_retried():
+    hasher = hashing.PasswordHasher("process", max_workers=1, max_pending=2, queue_timeout=5)
+    try:
+        hashed = hasher.hash("Clave123!")
+        executor = hasher._get_executor()
+        if not isinstance(executor, hashing.ProcessPoolExecutor):
+            pytest.skip("Sin procesos en este entorno")
+        # Simular un worker muerto (OOM): el pool queda roto
+        for process in list(executor._processes.values()):
+            process.kill()
+            process.join()
+        assert hasher.verify("Clave123!", hashed) is True
+        assert hasher._get_executor() is not executor
+        assert hasher.verify_any("Clave123!", [hashed]) is True
+    finally:
+        hasher.shutdown()
+
+
+def test_multi_slot_requests_take_all_slots_at_once():
+    hasher = hashing.PasswordHasher("inline", max_workers=1, max_pending=4, queue_timeout=0.2)
+    hasher._acquire(3)
+    with pytest.raises(HTTPException):
+        # Faltan lugares: no se queda con el que sobra mientras espera
+        hasher._acquire(2)
+    hasher._acquire(1)
+    hasher._release(4, 0.0)
+    hasher._acquire(4)
+    hasher._release(4, 0.0)
+    assert hasher.snapshot()["pending"] == 0
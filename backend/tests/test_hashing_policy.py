@@ -0,0 +1,69 @@
+import pytest
+from fastapi import HTTPException, Request, Response
+from fastapi.security import OAuth2PasswordRequestForm
+
+from app import hashing, hashing_policy, security_epochs, services
+from app.routes import auth as auth_routes
+
+
+def test_context_flags_other_cost_and_scheme_for_rehash():
+    current = hashing_policy.build_context(["bcrypt", "sha256_crypt"], 4)
+    assert current.needs_update(current.hash("Clave123!")) is False
+    assert current.needs_update(hashing_policy.build_context(["bcrypt"], 5).hash("Clave123!")) is True
+    # Esquema viejo: se sigue verificando pero pide migrar
+    legacy = current.handler("sha256_crypt").hash("Clave123!")
+    assert current.verify("Clave123!", legacy) is True
+    assert current.needs_update(legacy) is True
+
+
+def test_calibrate_suggests_highest_cost_within_target():
+    suggested, results = hashing_policy.calibrate(target_ms=10_000, min_rounds=4, max_rounds=5, samples=1)
+    assert [rounds for rounds, _ in results] == [4, 5]
+    assert suggested == 5
+
+    suggested, results = hashing_policy.calibrate(target_ms=0, min_rounds=4, max_rounds=6, samples=1)
+    # Nada entra en el objetivo: corta en el primero y sugiere el mínimo
+    assert suggested == 4
+    assert len(results) == 1
+
+
+@pytest.fixture
+def login_context(monkeypatch, seeded_db):
+    # Política de 4 rounds en el hasher inline (los procesos spawn no ven el monkeypatch)
+    monkeypatch.setattr(hashing, "pwd_context", hashing_policy.build_context(["bcrypt"], 4))
+    monkeypatch.setattr(services, "password_hasher", hashing.PasswordHasher("inline", 1, 4, 5))
+
+    session, user = seeded_db(
+        contrasena=hashing_policy.build_context(["bcrypt"], 5).hash("Clave123!"), roles=("admin_empresa",)
+    )
+    security_epochs.epoch_cache.invalidate()
+    return session, user
+
+
+def _login(session, password):
+    form = OAuth2PasswordRequestForm(username="empresa", password=password)
+    request = Request({"type": "http", "client": ("127.0.0.1", 50000), "headers": []})
+    return auth_routes.login(request=request, response=Response(), form_data=form, db=session)
+
+
+def test_login_rehashes_outdated_hash_without_revoking_tokens(login_context):
+    session, user = login_context
+    old_hash = user.contrasena
+    with pytest.raises(HTTPException) as exc:
+        _login(session, "otra")
+    assert exc.value.status_code == 401
+    token = auth_routes.create_user_access_token(session, auth_routes.Principal.from_user(user))
+
+    assert _login(session, "Clave123!")["tipo_rol"] == "admin_empresa"
+    session.refresh(user)
+    assert user.contrasena != old_hash
+    assert user.contrasena.startswith("$2b$04$")
+    assert "password_rehash" not in session.info
+    # Mismo secreto, distinto costo: los tokens emitidos siguen vigentes
+    assert auth_routes.get_current_user(token=token, db=session).id_usuario == user.id_usuario
+
+    # Segundo login: el hash ya cumple la política, no se reescribe
+    current_hash = user.contrasena
+    _login(session, "Clave123!")
+    session.refresh(user)
+    assert user.contrasena == current_hash
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+import pytest
+from sqlalchemy import inspect
+
+from app import hashing, hashing_policy, models, services
+
+_FAST = hashing_policy.build_context(["bcrypt"], 4)
+
+
+@pytest.fixture
+def history_context(monkeypatch, seeded_db, recorded_statements, memory_engine):
+    monkeypatch.setattr(services, "password_hasher", hashing.PasswordHasher("inline", 1, 8, 5))
+    session, user = seeded_db(nombre="usuario", contrasena=_FAST.hash("Actual1!"))
+    return session, user, recorded_statements, memory_engine
+
+
+def test_prune_keeps_newest_entries_in_one_delete(history_context):
+    session, user, statements, _ = history_context
+    for days in range(6, 0, -1):
+        session.add(models.PasswordHistory(
+            id_usuario=user.id_usuario, password_hash=f"vieja-{days}", created_at=date.today() - timedelta(days=days),
+        ))
+    session.commit()
+
+    statements.clear()
+    services.save_password_to_history(session, user.id_usuario, "nueva")
+    session.commit()
+
+    deletes = [sql for sql in statements if sql.lstrip().upper().startswith("DELETE")]
+    assert len(deletes) == 1
+    kept = session.query(models.PasswordHistory.password_hash).order_by(models.PasswordHistory.created_at.desc()).all()
+    assert [row.password_hash for row in kept] == ["nueva", "vieja-1", "vieja-2", "vieja-3", "vieja-4"]
+
+
+def test_reuse_check_reads_current_hash_and_history_in_one_query(history_context):
+    session, user, statements, _ = history_context
+    session.add(models.PasswordHistory(
+        id_usuario=user.id_usuario, password_hash=_FAST.hash("Vieja1!"), created_at=date.today(),
+    ))
+    session.commit()
+    user_id = user.id_usuario
+
+    statements.clear()
+    assert services.is_password_reused(session, user_id, "Vieja1!") is True
+    assert len([sql for sql in statements if sql.lstrip().upper().startswith("SELECT")]) == 1
+    assert services.is_password_reused(session, user_id, "Actual1!") is True
+    assert services.is_password_reused(session, user_id, "Nueva1!") is False
+
+
+def test_history_index_is_created_on_existing_tables(history_context):
+    _, _, _, engine = history_context
+    index = "ix_password_history_usuario_recientes"
+    next(ix for ix in models.PasswordHistory.__table__.indexes if ix.name == index).drop(bind=engine)
+    assert index not in {ix["name"] for ix in inspect(engine).get_indexes("password_history")}
+
+    services.ensure_password_history_index(engine)
+    services.ensure_password_history_index(engine)
+    assert index in {ix["name"] for ix in inspect(engine).get_indexes("password_history")}
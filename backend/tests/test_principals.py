@@ -0,0 +1,70 @@
+import pytest
+from fastapi import HTTPException
+
+from app import models, services
+from app.principals import principal_cache
+from app.routes import auth as auth_routes
+
+
+@pytest.fixture
+def principal_context(seeded_db, recorded_statements):
+    session, user = seeded_db(nombre="admin", roles=("admin_polo",))
+    recorded_statements.clear()
+    token = services.create_access_token(data={"sub": "admin"})
+    return session, user, token, recorded_statements
+
+
+def _authenticate(session, token):
+    principal = auth_routes.get_current_user(token=token, db=session)
+    return auth_routes.require_admin_polo(current_user=principal)
+
+
+def test_principal_is_resolved_in_one_query_and_cached(principal_context):
+    session, user, token, statements = principal_context
+
+    principal = _authenticate(session, token)
+    assert principal.id_usuario == user.id_usuario
+    assert principal.roles == ("admin_polo",)
+    assert principal.empresa_estado is True
+    assert len(statements) == 1
+
+    statements.clear()
+    assert _authenticate(session, token) is principal
+    assert statements == []
+
+    with pytest.raises(HTTPException) as exc:
+        auth_routes.require_empresa_role(current_user=principal)
+    assert exc.value.status_code == 403
+
+
+def test_principal_is_invalidated_on_commit(principal_context):
+    session, user, token, _ = principal_context
+    _authenticate(session, token)
+
+    # Quitar el rol
+    session.delete(session.get(models.RolUsuario, (1, user.id_usuario)))
+    session.commit()
+    with pytest.raises(HTTPException) as exc:
+        _authenticate(session, token)
+    assert exc.value.status_code == 403
+
+    session.add(models.RolUsuario(id_usuario=user.id_usuario, id_rol=1))
+    session.commit()
+    _authenticate(session, token)
+
+    # Desactivar la empresa
+    session.get(models.Empresa, 1234).estado = False
+    session.commit()
+    with pytest.raises(HTTPException) as exc:
+        _authenticate(session, token)
+    assert exc.value.detail == "La empresa asociada está desactivada."
+
+    # Un rollback no invalida nada
+    principal_cache.clear()
+    session.get(models.Empresa, 1234).estado = True
+    session.commit()
+    principal = _authenticate(session, token)
+    user.estado = False
+    session.flush()
+    session.rollback()
+    assert _authenticate(session, token) is principal
@@ -0,0 +1,189 @@
+from contextlib import contextmanager
+from datetime import date
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app import loaders, models
+from app.routes import admin_users as admin_routes
+from app.routes import company_user as company_routes
+
+
+@pytest.fixture
+def session_factory(memory_engine):
+    return memory_engine, sessionmaker(bind=memory_engine)
+
+
+@contextmanager
+def count_statements(engine):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+def _seed_catalog(session) -> dict:
+    tipos = {
+        "contacto": models.TipoContacto(tipo="Email"),
+        "servicio_polo": models.TipoServicioPolo(tipo="Depósito"),
+        "vehiculo": models.TipoVehiculo(tipo="Camión"),
+        "servicio": models.TipoServicio(tipo="Transporte"),
+    }
+    session.add_all(tipos.values())
+    session.commit()
+    return tipos
+
+
+def _seed_companies(session, tipos: dict, count: int, first_cuil: int = 1000) -> None:
+    tipo_contacto, tipo_servicio_polo = tipos["contacto"], tipos["servicio_polo"]
+    tipo_vehiculo, tipo_servicio = tipos["vehiculo"], tipos["servicio"]
+    for index in range(count):
+        cuil = first_cuil + index
+        session.add(models.Empresa(
+            cuil=cuil, nombre=f"Empresa {index}", rubro="Logística", cant_empleados=10,
+            observaciones="", fecha_ingreso=date(2021, 1, 1), horario_trabajo="08-18", estado=True,
+        ))
+        session.flush()
+        for contact in range(2):
+            session.add(models.Contacto(
+                nombre=f"Contacto {contact}", telefono="123", datos={}, direccion="Calle 1",
+                cuil_empresa=cuil, id_tipo_contacto=tipo_contacto.id_tipo_contacto,
+            ))
+        servicio_polo = models.ServicioPolo(
+            nombre=f"Depósito {index}", horario="24h", datos={}, propietario="Polo",
+            id_tipo_servicio_polo=tipo_servicio_polo.id_tipo_servicio_polo, cuil=cuil,
+        )
+        session.add(servicio_polo)
+        session.flush()
+        for lote in range(2):
+            session.add(models.Lote(
+                id_servicio_polo=servicio_polo.id_servicio_polo, dueno="Polo", lote=lote, manzana=index,
+            ))
+        vehiculo = models.Vehiculo(
+            horarios="08-12", frecuencia="diaria", datos={}, id_tipo_vehiculo=tipo_vehiculo.id_tipo_vehiculo,
+        )
+        servicio = models.Servicio(datos={}, id_tipo_servicio=tipo_servicio.id_tipo_servicio)
+        session.add_all([vehiculo, servicio])
+        session.flush()
+        session.add(models.VehiculosEmpresa(id_vehiculo=vehiculo.id_vehiculo, cuil=cuil))
+        session.add(models.EmpresaServicio(cuil=cuil, id_servicio=servicio.id_servicio))
+    session.commit()
+
+
+def _directory_statements(engine, SessionLocal) -> int:
+    db = SessionLocal()
+    try:
+        with count_statements(engine) as statements:
+            details = admin_routes._list_all_companies(db)
+        assert all(len(detail.contactos) == 2 for detail in details)
+        assert all(len(detail.servicios_polo[0].lotes) == 2 for detail in details)
+        return len(statements)
+    finally:
+        db.close()
+
+
+def test_directory_statement_count_is_constant(session_factory):
+    engine, SessionLocal = session_factory
+    session = SessionLocal()
+    tipos = _seed_catalog(session)
+    _seed_companies(session, tipos, 3)
+    small = _directory_statements(engine, SessionLocal)
+
+    _seed_companies(session, tipos, 7, first_cuil=2000)
+    session.close()
+    large = _directory_statements(engine, SessionLocal)
+
+    # empresa + contactos (con tipo) + servicios_polo (con tipo) + lotes
+    assert small == large == 4
+
+
+def test_company_detail_statement_count(session_factory):
+    engine, SessionLocal = session_factory
+    session = SessionLocal()
+    _seed_companies(session, _seed_catalog(session), 2)
+    session.close()
+
+    db = SessionLocal()
+    try:
+        with count_statements(engine) as statements:
+            emp = db.query(models.Empresa).options(*loaders.EMPRESA_DETAIL).filter_by(cuil=1000).first()
+            detail = company_routes.build_empresa_detail(emp)
+    finally:
+        db.close()
+
+    assert detail.vehiculos[0].tipo_vehiculo.tipo == "Camión"
+    assert len(detail.servicios) == 1
+    assert len(detail.contactos) == 2
+    # empresa + vehículos + contactos + servicios + servicios_polo + lotes
+    assert len(statements) == 6
+
+
+@pytest.fixture
+def directory_client(session_factory, client):
+    from app.config import get_db
+    from app.main import app
+
+    engine, SessionLocal = session_factory
+    session = SessionLocal()
+    tipos = _seed_catalog(session)
+    # Nombres repetidos entre lotes: el cursor desempata por cuil
+    _seed_companies(session, tipos, 5)
+    _seed_companies(session, tipos, 5, first_cuil=2000)
+    session.close()
+
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    app.dependency_overrides[admin_routes.require_admin_polo] = lambda: object()
+    return client, engine
+
+
+def test_directory_walks_pages_with_cursor(directory_client):
+    client, _ = directory_client
+    seen, cursor, pages = [], None, 0
+    while True:
+        params = {"limit": 4, **({"cursor": cursor} if cursor else {})}
+        page = client.get("/directory", params=params).json()
+        pages += 1
+        assert page["total"] == 10
+        assert all(item["contactos"] is None and item["servicios_polo"] is None for item in page["items"])
+        seen.extend(item["nombre"] for item in page["items"])
+        cursor = page["next_cursor"]
+        if not cursor:
+            break
+
+    assert pages == 3
+    assert len(seen) == 10
+    assert seen == sorted(seen)
+
+    filtered = client.get("/directory", params={"name": "Empresa 1", "servicio_polo": "dep"}).json()
+    assert filtered["total"] == 2
+
+
+def test_directory_include_and_validation(directory_client):
+    client, engine = directory_client
+    with count_statements(engine) as statements:
+        response = client.get("/directory", params={"limit": 500, "include": "contactos,lotes"})
+    page = response.json()
+    assert response.status_code == 200
+    assert page["limit"] == admin_routes.DIRECTORY_MAX_PAGE_SIZE
+    assert len(page["items"]) == 10
+    assert len(page["items"][0]["contactos"]) == 2
+    assert len(page["items"][0]["servicios_polo"][0]["lotes"]) == 2
+    # count + página + contactos + servicios_polo + lotes
+    assert len(statements) == 5
+
+    assert client.get("/directory", params={"include": "vehiculos"}).status_code == 400
+    assert client.get("/directory", params={"cursor": "no-es-un-cursor"}).status_code == 400
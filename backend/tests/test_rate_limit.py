@@ -0,0 +1,122 @@
+import pytest
+from fastapi import HTTPException, Request, Response
+from fastapi.security import OAuth2PasswordRequestForm
+from app import rate_limit, services
+from app.routes import auth as auth_routes
+
+
+class FakeClock:
+    def __init__(self, now=6000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_sliding_window_weights_previous_window():
+    clock = FakeClock()
+    limiter = rate_limit.SlidingWindowLimiter("t", 4, 60, store=rate_limit.MemoryBackend(), clock=clock)
+
+    assert [limiter.acquire("ip") for _ in range(4)] == [0, 0, 0, 0]
+    retry_after = limiter.acquire("ip")
+    assert retry_after == 60
+
+    # 15 s en la ventana siguiente: la anterior pesa 0.75 → 3 de 4 ocupados
+    clock.now += 75
+    assert limiter.acquire("ip") == 0
+    retry_after = limiter.acquire("ip")
+    # Entra otro cuando el peso baja a 2/4 (a los 30 s de la ventana)
+    assert retry_after == pytest.approx(15)
+    clock.now += retry_after
+    assert limiter.acquire("ip") == 0
+
+
+def test_failures_lock_key_and_memory_is_bounded():
+    clock = FakeClock()
+    store = rate_limit.MemoryBackend(max_keys=2)
+    limiter = rate_limit.SlidingWindowLimiter("f", 3, 900, lockout_seconds=60, store=store, clock=clock)
+
+    assert limiter.record_failure("u") == 0
+    assert limiter.record_failure("u") == 0
+    assert limiter.blocked("u") == 0
+    assert limiter.record_failure("u") == 60
+    clock.now += 20
+    assert limiter.blocked("u") == pytest.approx(40)
+    clock.now += 41
+    assert limiter.blocked("u") == 0
+
+    limiter.record_failure("a")
+    limiter.record_failure("b")
+    assert store.size() == 2
+    assert store.evicted == 1
+
+
+def test_database_backend_is_shared_between_workers(memory_engine):
+    clock = FakeClock()
+    worker_a = rate_limit.SlidingWindowLimiter("r", 2, 60, store=rate_limit.DatabaseBackend(memory_engine), clock=clock)
+    worker_b = rate_limit.SlidingWindowLimiter("r", 2, 60, store=rate_limit.DatabaseBackend(memory_engine), clock=clock)
+
+    assert worker_a.acquire("ip") == 0
+    assert worker_b.acquire("ip") == 0
+    assert worker_a.acquire("ip") > 0
+    worker_b.clear()
+    assert worker_a.acquire("ip") == 0
+
+
+@pytest.fixture
+def login_db(seeded_db):
+    session, _ = seeded_db(contrasena="hash")
+    return session
+
+
+def test_login_rejects_before_hashing_with_retry_after(login_db, monkeypatch):
+    hashed = []
+    monkeypatch.setattr(services, "verify_and_update_password", lambda *args: hashed.append(args) or (False, None))
+    request = Request({"type": "http", "client": ("10.0.0.1", 50000), "headers": []})
+    form = OAuth2PasswordRequestForm(username="empresa", password="mala")
+
+    for _ in range(rate_limit.login_failures.limit):
+        with pytest.raises(HTTPException) as exc:
+            auth_routes.login(request=request, response=Response(), form_data=form, db=login_db)
+        assert exc.value.status_code == 401
+
+    with pytest.raises(HTTPException) as exc:
+        auth_routes.login(request=request, response=Response(), form_data=form, db=login_db)
+    assert exc.value.status_code == 429
+    assert int(exc.value.headers["Retry-After"]) > 0
+    assert len(hashed) == rate_limit.login_failures.limit
+
+    # Otra IP con el mismo usuario no queda bloqueada
+    other = Request({"type": "http", "client": ("10.0.0.2", 50000), "headers": []})
+    with pytest.raises(HTTPException) as exc:
+        auth_routes.login(request=other, response=Response(), form_data=form, db=login_db)
+    assert exc.value.status_code == 401
+
+
+def test_client_ip_uses_trusted_forwarded_hop():
+    request = Request({
+        "type": "http", "client": ("169.254.1.1", 443),
+        "headers": [(b"x-forwarded-for", b"6.6.6.6, 203.0.113.7")],
+    })
+    # Sin proxies configurados: la IP de la conexión
+    assert rate_limit.client_ip(request, trusted_hops=0) == "169.254.1.1"
+    # Un proxy de confianza (Cloud Run): la IP que agregó, no la que inventó el cliente
+    assert rate_limit.client_ip(request, trusted_hops=1) == "203.0.113.7"
+    # Menos saltos de los esperados: no se confía en el encabezado
+    assert rate_limit.client_ip(request, trusted_hops=3) == "169.254.1.1"
+
+
+def test_database_blocked_check_is_a_plain_select(memory_engine, recorded_statements):
+    clock = FakeClock()
+    limiter = rate_limit.SlidingWindowLimiter(
+        "b", 2, 60, lockout_seconds=60, store=rate_limit.DatabaseBackend(memory_engine), clock=clock
+    )
+    assert limiter.blocked("ip") == 0
+    limiter.record_failure("ip")
+    limiter.record_failure("ip")
+
+    recorded_statements.clear()
+    assert limiter.blocked("ip") > 0
+    assert len(recorded_statements) == 1
+    assert recorded_statements[0].lstrip().upper().startswith("SELECT")
+    assert "FOR UPDATE" not in recorded_statements[0].upper()
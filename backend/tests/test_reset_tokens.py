@@ -0,0 +1,55 @@
+from app import reset_tokens
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def test_memory_store_expires_entries_at_token_exp():
+    clock = FakeClock()
+    store = reset_tokens.MemoryTokenStore(slot_seconds=60, clock=clock)
+
+    assert store.consume("a", clock.now + 30) is True
+    assert store.consume("b", clock.now + 600) is True
+    assert store.consume("a", clock.now + 30) is False
+    assert "a" in store and len(store) == 2
+
+    # Pasado el exp de "a" deja de contar aunque su bucket siga en la rueda
+    clock.now += 45
+    assert "a" not in store
+    # Al cerrar el bucket se desaloja sin tocar el de "b"
+    clock.now += 120
+    assert len(store) == 1
+    stats = store.stats()
+    assert stats["evicted"] == 1
+    assert stats["reuse_rejected"] == 1
+    assert stats["consumed"] == 2
+    assert stats["size"] == 1
+    assert store.clear() == 1
+    assert len(store) == 0
+
+
+def test_database_store_is_shared_between_instances(memory_engine):
+    clock = FakeClock()
+    worker_a = reset_tokens.DatabaseTokenStore(memory_engine, purge_interval=300, clock=clock)
+    worker_b = reset_tokens.DatabaseTokenStore(memory_engine, purge_interval=300, clock=clock)
+
+    assert worker_a.consume("jti-1", clock.now + 60) is True
+    # Otro worker ve el consumo y no puede usar el mismo token
+    assert "jti-1" in worker_b
+    assert worker_b.consume("jti-1", clock.now + 60) is False
+    assert worker_b.consume("jti-2", clock.now + 3600) is True
+
+    clock.now += 400
+    assert "jti-1" not in worker_a
+    assert worker_a.purge() == 1
+    assert len(worker_a) == 1
+    stats = worker_a.stats()
+    assert stats["backend"] == "database"
+    assert stats["evicted"] == 1
+    assert stats["size"] == 1
+    assert worker_b.stats()["reuse_rejected"] == 1
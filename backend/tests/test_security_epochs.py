@@ -0,0 +1,108 @@
+import pytest
+from fastapi import HTTPException
+from jose import jwt
+
+from app import models, security_epochs, services
+from app.config import ALGORITHM, SECRET_KEY
+from app.principals import Principal
+from app.routes import auth as auth_routes
+
+
+@pytest.fixture
+def epoch_context(seeded_db, recorded_statements):
+    session, user = seeded_db(roles=("admin_empresa",))
+    session.add(models.Rol(id_rol=2, tipo_rol="publico"))
+    session.commit()
+    security_epochs.epoch_cache.invalidate()
+    recorded_statements.clear()
+    return session, user, recorded_statements
+
+
+def _issue_token(session, user) -> str:
+    return auth_routes.create_user_access_token(session, Principal.from_user(user))
+
+
+def _assert_revoked(session, token):
+    with pytest.raises(HTTPException) as exc:
+        auth_routes.get_current_user(token=token, db=session)
+    assert exc.value.status_code == 401
+
+
+def test_role_checks_use_token_claims(epoch_context):
+    session, user, statements = epoch_context
+    token = _issue_token(session, user)
+    claims = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
+    assert claims["roles"] == ["admin_empresa"]
+    assert claims["cuil"] == 1234
+    assert claims["ep"] == security_epochs.current_epoch(session, user.id_usuario)
+
+    statements.clear()
+    principal = auth_routes.require_empresa_role(auth_routes.get_current_user(token=token, db=session))
+    assert principal.id_usuario == user.id_usuario
+    assert principal.email == "empresa@test.com"
+    # Época cacheada: ni el usuario ni la tabla de épocas se consultan
+    assert statements == []
+
+    # Tokens sin claims siguen resolviéndose contra la base
+    legacy = services.create_access_token(data={"sub": "empresa"})
+    assert auth_routes.get_current_user(token=legacy, db=session).roles == ("admin_empresa",)
+
+
+@pytest.mark.parametrize("change", ["deactivate", "role", "password", "company"])
+def test_security_changes_revoke_issued_tokens(epoch_context, change):
+    session, user, _ = epoch_context
+    token = _issue_token(session, user)
+    auth_routes.get_current_user(token=token, db=session)
+
+    if change == "deactivate":
+        user.estado = False
+    elif change == "role":
+        session.add(models.RolUsuario(id_usuario=user.id_usuario, id_rol=2))
+    elif change == "password":
+        user.contrasena = "otra"
+    else:
+        session.get(models.Empresa, 1234).estado = False
+    session.commit()
+
+    _assert_revoked(session, token)
+    if change in ("role", "password"):
+        # Un token nuevo lleva la época vigente
+        fresh = auth_routes.get_current_user(token=_issue_token(session, user), db=session)
+        assert fresh.id_usuario == user.id_usuario
+
+
+def test_unrelated_changes_keep_tokens_valid(epoch_context):
+    session, user, _ = epoch_context
+    token = _issue_token(session, user)
+    session.get(models.Empresa, 1234).rubro = "Servicios"
+    session.commit()
+    assert auth_routes.get_current_user(token=token, db=session).cuil == 1234
+
+
+def test_deleted_user_tokens_are_revoked(epoch_context):
+    session, user, _ = epoch_context
+    token = _issue_token(session, user)
+    user_id = user.id_usuario
+    auth_routes.get_current_user(token=token, db=session)
+
+    session.delete(user)
+    session.commit()
+    # Sin usuario no hay época vigente: el token queda revocado
+    assert security_epochs.current_epoch(session, user_id) is None
+    _assert_revoked(session, token)
+
+
+def test_issued_token_reads_epoch_from_database_not_cache(epoch_context):
+    session, user, _ = epoch_context
+    cached = security_epochs.current_epoch(session, user.id_usuario)
+
+    # Otro worker cambia la contraseña: la cache local sigue con la época vieja
+    security_epochs.bump(session.connection(), [user.id_usuario])
+    session.commit()
+    assert security_epochs.current_epoch(session, user.id_usuario) == cached
+
+    token = _issue_token(session, user)
+    assert jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])["ep"] == cached + 1
+    # Al refrescarse la cache el token sigue vigente
+    security_epochs.epoch_cache.invalidate()
+    assert auth_routes.get_current_user(token=token, db=session).id_usuario == user.id_usuario
@@ -1,19 +1,78 @@
-from app import models
-from app.routes import tipos as tipos_routes
+import pytest
+from sqlalchemy.orm import sessionmaker
 
+from app import database, models
+from app.config import Base, get_db
+from app.main import app
+from app.reference_data import etag_matches, reference_catalog
 
-def test_tipos_functions_return_data(monkeypatch):
-    class DummySession:
-        def __init__(self):
-            self._items = [models.TipoVehiculo(id_tipo_vehiculo=1, tipo="Camion")]
 
-        def query(self, model):
-            return self
+@pytest.fixture
+def tipos_client(client, tmp_path):
+    # Engine instrumentado: cuenta conexiones por petición (X-DB-Connections)
+    engine = database.create_db_engine(f"sqlite:///{tmp_path / 'tipos.db'}")
+    Base.metadata.create_all(bind=engine)
+    SessionLocal = sessionmaker(bind=engine)
+    session = SessionLocal()
+    session.add_all([
+        models.TipoVehiculo(id_tipo_vehiculo=1, tipo="Camion"),
+        models.TipoServicioPolo(id_tipo_servicio_polo=1, tipo="Cowork"),
+        models.Rol(id_rol=1, tipo_rol="admin_polo"),
+    ])
+    session.commit()
+    session.close()
 
-        def all(self):
-            return self._items
+    def override_get_db():
+        db = SessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
 
-    dummy_db = DummySession()
+    app.dependency_overrides[get_db] = override_get_db
+    yield client, SessionLocal
+    Base.metadata.drop_all(bind=engine)
+    engine.dispose()
 
-    vehiculos = tipos_routes.get_tipos_vehiculo(db=dummy_db)
-    assert vehiculos[0].tipo == "Camion"
+
+def test_tipos_are_served_from_catalog_with_etag(tipos_client):
+    client, _ = tipos_client
+    first = client.get("/tipos/vehiculo")
+    assert first.status_code == 200
+    assert first.json() == [{"id_tipo_vehiculo": 1, "tipo": "Camion"}]
+    etag = first.headers["ETag"]
+    assert etag.startswith('"') and "max-age" in first.headers["Cache-Control"]
+    assert first.headers["X-DB-Connections"] == "1"
+
+    # Segunda lectura: sale de memoria, sin conexión a la base
+    second = client.get("/tipos/servicio-polo")
+    assert second.json() == [{"id_tipo_servicio_polo": 1, "tipo": "Cowork"}]
+    assert second.headers["X-DB-Connections"] == "0"
+
+    revalidated = client.get("/tipos/vehiculo", headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert revalidated.headers["ETag"] == etag
+    assert revalidated.content == b""
+    assert reference_catalog.rol_by_tipo(None, "admin_polo").id_rol == 1
+
+
+def test_catalog_is_invalidated_on_commit(tipos_client):
+    client, SessionLocal = tipos_client
+    etag = client.get("/tipos/vehiculo").headers["ETag"]
+
+    session = SessionLocal()
+    session.add(models.TipoVehiculo(id_tipo_vehiculo=2, tipo="Moto"))
+    session.commit()
+    session.close()
+
+    response = client.get("/tipos/vehiculo", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert [item["tipo"] for item in response.json()] == ["Camion", "Moto"]
+    assert response.headers["ETag"] != etag
+
+
+def test_etag_matches_lists_and_weak_validators():
+    assert etag_matches('"a", W/"b"', '"b"')
+    assert etag_matches("*", '"b"')
+    assert not etag_matches(None, '"b"')
+    assert not etag_matches('"a"', '"b"')
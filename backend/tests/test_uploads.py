@@ -0,0 +1,85 @@
+import asyncio
+import mmap
+
+import pytest
+from fastapi import HTTPException
+
+from app.utils import uploads
+
+
+class _SlowStream:
+    """Request falso cuyo cuerpo llega en bloques con demora."""
+
+    def __init__(self, chunks, delay=0.0):
+        self.headers = {}
+        self._chunks = chunks
+        self._delay = delay
+
+    async def stream(self):
+        for chunk in self._chunks:
+            await asyncio.sleep(self._delay)
+            yield chunk
+
+
+def test_spooled_audio_rolls_to_disk_and_exposes_mmap():
+    with uploads.SpooledAudio(spool_bytes=16) as spooled:
+        spooled.write(b"a" * 10, max_bytes=100)
+        assert not spooled.on_disk
+        spooled.write(b"b" * 30, max_bytes=100)
+        assert spooled.on_disk
+
+        view = spooled.view()
+        assert isinstance(view, mmap.mmap)
+        assert bytes(view[:12]) == b"a" * 10 + b"bb"
+        assert b"".join(bytes(chunk) for chunk in spooled.iter_chunks(chunk_size=7)) == b"a" * 10 + b"b" * 30
+
+
+def test_spooled_audio_in_memory_view_is_zero_copy():
+    with uploads.SpooledAudio(spool_bytes=1024) as spooled:
+        spooled.write(b"audio", max_bytes=100)
+        view = spooled.view()
+        assert isinstance(view, memoryview)
+        assert bytes(view) == b"audio"
+
+
+def test_read_request_body_capped_enforces_size():
+    request = _SlowStream([b"x" * 600, b"x" * 600])
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(uploads.read_request_body_capped(request, max_bytes=1000, timeout_seconds=5))
+    assert exc.value.status_code == 413
+
+
+def test_read_request_body_capped_times_out_slow_uploads():
+    request = _SlowStream([b"x"] * 10, delay=0.05)
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(uploads.read_request_body_capped(request, max_bytes=1000, timeout_seconds=0.12))
+    assert exc.value.status_code == 408
+
+
+def test_check_content_length_rejects_declared_oversize():
+    request = _SlowStream([])
+    request.headers = {"content-length": "5000"}
+    with pytest.raises(HTTPException) as exc:
+        uploads.check_content_length(request, max_bytes=1000)
+    assert exc.value.status_code == 413
+
+
+def test_read_json_body_capped_limits_chunked_bodies_without_length():
+    # Sin Content-Length el tamaño se controla mientras se lee
+    request = _SlowStream([b'{"audio_base64": "', b"A" * 2000, b'"}'])
+    with pytest.raises(HTTPException) as exc:
+        asyncio.run(uploads.read_json_body_capped(request, max_bytes=1000, timeout_seconds=5))
+    assert exc.value.status_code == 413
+
+    request = _SlowStream([b'{"text": ', b'"hola"}'])
+    assert asyncio.run(uploads.read_json_body_capped(request, max_bytes=1000, timeout_seconds=5)) == {"text": "hola"}
+
+
+def test_decode_base64_audio_applies_upload_limit():
+    assert uploads.decode_base64_audio("ZmFrZQ==", max_bytes=4) == b"fake"
+    with pytest.raises(HTTPException) as exc:
+        uploads.decode_base64_audio("ZmFrZWZha2U=", max_bytes=4)
+    assert exc.value.status_code == 413
+    with pytest.raises(HTTPException) as exc:
+        uploads.decode_base64_audio("no es base64!", max_bytes=100)
+    assert exc.value.status_code == 400
@@ -0,0 +1,145 @@
+from datetime import date
+
+import pytest
+from fastapi import HTTPException
+from sqlalchemy import select, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+
+from app import models, schemas, user_counters
+from app.routes import admin_users as admin_routes
+
+
+@pytest.fixture
+def SessionLocal(memory_engine):
+    session = sessionmaker(bind=memory_engine)()
+    for cuil, nombre in ((admin_routes.POLO_CUIL, "Polo"), (1234, "Empresa")):
+        session.add(models.Empresa(
+            cuil=cuil, nombre=nombre, rubro="Logística", cant_empleados=10, observaciones="",
+            fecha_ingreso=date(2021, 1, 1), horario_trabajo="08-18", estado=True,
+        ))
+    session.add_all([models.Rol(id_rol=1, tipo_rol="admin_polo"), models.Rol(id_rol=2, tipo_rol="admin_empresa")])
+    session.commit()
+    session.close()
+    return sessionmaker(bind=memory_engine)
+
+
+def _add_user(session, name: str, cuil: int, id_rol: int, estado: bool = True) -> models.Usuario:
+    user = models.Usuario(
+        nombre=name, email=f"{name}@test.com", contrasena="x", estado=estado,
+        fecha_registro=date.today(), cuil=cuil,
+    )
+    session.add(user)
+    session.flush()
+    session.add(models.RolUsuario(id_usuario=user.id_usuario, id_rol=id_rol))
+    session.commit()
+    return user
+
+
+def _counters(session) -> dict:
+    rows = session.execute(select(
+        models.ContadorUsuariosActivos.cuil,
+        models.ContadorUsuariosActivos.tipo_rol,
+        models.ContadorUsuariosActivos.activos,
+    )).all()
+    return {(cuil, tipo_rol): activos for cuil, tipo_rol, activos in rows if activos}
+
+
+def test_counters_follow_creation_and_state_changes(SessionLocal):
+    session = SessionLocal()
+    first = _add_user(session, "uno", 1234, 2)
+    _add_user(session, "dos", 1234, 2)
+    _add_user(session, "inactivo", 1234, 2, estado=False)
+    _add_user(session, "polo", admin_routes.POLO_CUIL, 1)
+    assert _counters(session) == {(1234, "admin_empresa"): 2, (admin_routes.POLO_CUIL, "admin_polo"): 1}
+
+    first.estado = False
+    session.commit()
+    assert _counters(session)[(1234, "admin_empresa")] == 1
+
+    # Inhabilitar la empresa apaga a todos sus usuarios en un solo flush
+    for user in session.query(models.Usuario).filter_by(cuil=1234):
+        user.estado = False
+    session.commit()
+    assert (1234, "admin_empresa") not in _counters(session)
+
+    # Un rollback no deja el contador desfasado
+    session.query(models.Usuario).filter_by(nombre="dos").one().estado = True
+    session.flush()
+    assert _counters(session)[(1234, "admin_empresa")] == 1
+    session.rollback()
+    assert (1234, "admin_empresa") not in _counters(session)
+    session.close()
+
+
+def test_counters_apply_deltas_without_recounting(SessionLocal, recorded_statements):
+    session = SessionLocal()
+    _add_user(session, "uno", 1234, 2)
+
+    recorded_statements.clear()
+    second = _add_user(session, "dos", 1234, 2)
+    sql = " ".join(recorded_statements).lower()
+    # Solo ±1 sobre la fila afectada: ni COUNT ni FOR UPDATE en cada alta
+    assert "count(" not in sql
+    assert "activos + " in sql
+    assert _counters(session) == {(1234, "admin_empresa"): 2}
+
+    # Cambio de empresa, rol extra y baja de enlace en un mismo flush
+    session.add(models.RolUsuario(id_usuario=second.id_usuario, id_rol=1))
+    second.cuil = admin_routes.POLO_CUIL
+    session.commit()
+    assert _counters(session) == {
+        (1234, "admin_empresa"): 1,
+        (admin_routes.POLO_CUIL, "admin_empresa"): 1,
+        (admin_routes.POLO_CUIL, "admin_polo"): 1,
+    }
+    session.delete(session.get(models.RolUsuario, (2, second.id_usuario)))
+    session.commit()
+    assert (admin_routes.POLO_CUIL, "admin_empresa") not in _counters(session)
+
+    session.delete(second)
+    session.commit()
+    assert _counters(session) == {(1234, "admin_empresa"): 1}
+    assert user_counters.reconcile(session) == []
+    session.close()
+
+
+def test_limit_checks_read_locked_counters(SessionLocal):
+    session = SessionLocal()
+    for index in range(admin_routes.MAX_ADMIN_EMPRESA_PER_COMPANY):
+        _add_user(session, f"emp{index}", 1234, 2)
+
+    dto = schemas.UserCreate(nombre="extra", email="extra@test.com", cuil=1234, id_rol=2)
+    with pytest.raises(HTTPException) as exc:
+        admin_routes.validate_user_creation_limits(session, dto)
+    assert exc.value.status_code == 400
+    session.rollback()
+
+    # Empresa sin fila todavía: se crea al validar
+    session.execute(text("DELETE FROM contador_usuarios_activos"))
+    session.commit()
+    assert user_counters.locked_active_count(session, 1234, "admin_empresa") == admin_routes.MAX_ADMIN_EMPRESA_PER_COMPANY
+    assert user_counters.locked_active_count(session, admin_routes.POLO_CUIL, "admin_polo", all_companies=True) == 0
+    session.close()
+
+    lock = select(models.ContadorUsuariosActivos.activos).with_for_update()
+    assert "FOR UPDATE" in str(lock.compile(dialect=postgresql.dialect()))
+
+
+def test_reconcile_fixes_drift(SessionLocal):
+    session = SessionLocal()
+    _add_user(session, "uno", 1234, 2)
+    # Cambios por fuera del ORM no pasan por el listener
+    session.execute(text("UPDATE usuario SET estado = 0"))
+    session.execute(text(
+        "INSERT INTO contador_usuarios_activos (cuil, tipo_rol, activos) VALUES (999, 'admin_empresa', 4)"
+    ))
+    session.commit()
+
+    corrections = user_counters.reconcile(session)
+    session.commit()
+    assert (1234, "admin_empresa", 1, 0) in corrections
+    assert (999, "admin_empresa", 4, 0) in corrections
+    assert _counters(session) == {}
+    assert user_counters.reconcile(session) == []
+    session.close()
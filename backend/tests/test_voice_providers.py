@@ -0,0 +1,110 @@
+import time
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import services, voice_providers
+
+
+@pytest.fixture
+def fake_voice(monkeypatch):
+    """Activa los proveedores locales con un guion y contadores limpios."""
+    monkeypatch.setattr(services, "VOICE_PROVIDER", voice_providers.FAKE)
+    stt = voice_providers.FakeSpeechToText(latency_ms=0, default_transcript="consulta por defecto")
+    tts = voice_providers.FakeTextToSpeech(latency_ms=0)
+    monkeypatch.setattr(voice_providers, "fake_speech_to_text", stt)
+    monkeypatch.setattr(voice_providers, "fake_text_to_speech", tts)
+    return stt, tts
+
+
+def test_fake_tts_returns_silent_mp3_proportional_to_text(fake_voice):
+    short_audio = services.text_to_speech("Hola")
+    long_audio = services.text_to_speech("Hola " * 40)
+
+    assert short_audio.startswith(b"\xff\xfb")
+    assert len(short_audio) % len(voice_providers.SILENT_MP3_FRAME) == 0
+    assert len(long_audio) > 10 * len(short_audio)
+    # Determinístico: el mismo texto produce los mismos bytes
+    assert services.text_to_speech("Hola") == short_audio
+
+
+def test_fake_stt_uses_scripted_transcript_by_fingerprint(fake_voice):
+    stt, _ = fake_voice
+    stt.script(b"audio-guionado", "¿Dónde queda la empresa Logística Sur?")
+
+    with patch.object(services.audio_processing, "preprocess_for_stt", return_value=None):
+        assert services.transcribe_audio(b"audio-guionado") == "¿Dónde queda la empresa Logística Sur?"
+        assert services.transcribe_audio(b"otro-audio") == "consulta por defecto"
+    assert stt.calls == 2
+
+
+def test_fake_stt_script_matches_preprocessed_audio(fake_voice):
+    audio_processing = pytest.importorskip("app.audio_processing")
+    pytest.importorskip("numpy")
+    stt, _ = fake_voice
+    wav = audio_processing.generate_sample_wav(speech_seconds=0.5, seed=7)
+    stt.script(wav, "horarios del parque")
+
+    assert services.transcribe_audio(wav) == "horarios del parque"
+
+
+def test_fake_provider_latency_is_configurable():
+    tts = voice_providers.FakeTextToSpeech(latency_ms=50)
+    start = time.perf_counter()
+    tts.synthesize("Hola", "es-ES", "es-ES-Neural2-A")
+    assert time.perf_counter() - start >= 0.045
+
+
+def test_voice_chat_runs_offline_with_fake_providers(client: TestClient, fake_voice):
+    with patch.object(services, "get_chat_response", return_value=("Respuesta del bot", [], None)):
+        response = client.post(
+            "/api/voice/chat",
+            files={"audio": ("audio.webm", b"audio-del-totem", "audio/webm")},
+        )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["transcript"] == "consulta por defecto"
+    assert data["text"] == "Respuesta del bot"
+    assert data["audio_base64"]
+
+
+def test_fake_tts_formats_and_cache_key_includes_format(fake_voice):
+    _, tts = fake_voice
+    services.tts_cache.clear()
+    text = "La empresa Logística Sur está en el lote 12."
+
+    mp3 = services.text_to_speech(text, audio_format="mp3")
+    opus = services.text_to_speech(text, audio_format="ogg_opus")
+    wav = services.text_to_speech(text, audio_format="linear16")
+
+    assert opus.startswith(b"OggS") and wav.startswith(b"RIFF") and mp3.startswith(b"\xff\xfb")
+    assert len(opus) < len(mp3) < len(wav)
+    assert tts.calls == 3
+
+    # Mismo texto y formato: se sirve desde la cache sin volver a sintetizar
+    assert services.text_to_speech(text, audio_format="ogg_opus") == opus
+    assert tts.calls == 3
+    assert services.tts_cache.stats()["hits"] == 1
+    services.tts_cache.clear()
+
+
+def test_text_to_speech_rejects_unknown_format(fake_voice):
+    with pytest.raises(services.HTTPException) as exc:
+        services.text_to_speech("Hola", audio_format="flac")
+    assert exc.value.status_code == 400
+
+
+def test_incomplete_provider_fails_on_instantiation():
+    class SinReconocer(voice_providers.SpeechToTextProvider):
+        name = "incompleto"
+
+    with pytest.raises(TypeError):
+        SinReconocer()
+    with pytest.raises(TypeError):
+        voice_providers.TextToSpeechProvider()
+    # Los proveedores reales implementan toda la interfaz
+    voice_providers.FakeSpeechToText(latency_ms=0)
+    voice_providers.FakeTextToSpeech(latency_ms=0)
+    voice_providers.GoogleSpeechToText(client=None)
+    voice_providers.GoogleTextToSpeech(client=None)
@@ -1,3 +1,5 @@
+import base64
+import json
 from unittest.mock import patch
 
 import pytest
@@ -146,3 +148,350 @@ def test_transcribe_returns_empty_warning(client: TestClient):
     payload = response.json()
     assert payload["success"] is False
     assert payload["transcript"] == ""
+
+
+def _split_multipart(response):
+    content_type = response.headers["content-type"]
+    assert content_type.startswith("multipart/mixed")
+    boundary = content_type.split("boundary=")[1].encode()
+    parts = []
+    for raw_part in response.content.split(b"--" + boundary):
+        raw_part = raw_part.strip(b"\r\n")
+        if not raw_part or raw_part == b"--":
+            continue
+        headers, body = raw_part.split(b"\r\n\r\n", 1)
+        parts.append((headers.decode(), body))
+    return parts
+
+
+def test_voice_chat_binary_mode_returns_multipart(client: TestClient):
+    fake_audio = b"\xff\xfb\x90\x00raw-mp3"
+    fake_result = {
+        "text": "Respuesta",
+        "audio_bytes": fake_audio,
+        "db_results": [{"nombre": "Logistica"}],
+        "transcript": "Pregunta",
+        "corrected_entity": None,
+        "error": False,
+    }
+    received = {}
+
+    def fake_chat(**kwargs):
+        # La vista del audio solo es válida durante la llamada
+        received["audio"] = bytes(kwargs["audio_content"])
+        return fake_result
+
+    with patch(
+        "app.routes.voice.services.get_chat_response_with_audio", side_effect=fake_chat
+    ) as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            content=b"raw-webm-audio",
+            headers={"Content-Type": "audio/webm", "Accept": "multipart/mixed"},
+            params={"history": '[{"user": "hola"}]'},
+        )
+
+    assert response.status_code == 200
+    kwargs = chat_mock.call_args.kwargs
+    assert received["audio"] == b"raw-webm-audio"
+    assert kwargs["history"] == [{"user": "hola"}]
+    assert kwargs["encode_audio"] is False
+
+    (json_headers, json_body), (audio_headers, audio_body) = _split_multipart(response)
+    assert "application/json" in json_headers
+    payload = json.loads(json_body)
+    assert payload["data"]["text"] == "Respuesta"
+    assert payload["data"]["audio"]["size_bytes"] == len(fake_audio)
+    assert "audio_base64" not in payload["data"]
+    assert "audio/mpeg" in audio_headers
+    assert audio_body == fake_audio
+
+
+def test_voice_chat_raw_audio_with_json_response_keeps_base64(client: TestClient):
+    fake_result = {
+        "text": "Resp",
+        "audio_base64": "ZmFrZQ==",
+        "db_results": [],
+        "transcript": "Pregunta",
+        "corrected_entity": None,
+        "error": False,
+    }
+    with patch(
+        "app.routes.voice.services.get_chat_response_with_audio", return_value=fake_result
+    ) as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            content=b"audio",
+            headers={"Content-Type": "application/octet-stream"},
+        )
+    assert response.status_code == 200
+    assert chat_mock.call_args.kwargs["encode_audio"] is True
+    assert response.json()["data"]["audio_base64"] == "ZmFrZQ=="
+
+
+def test_voice_chat_raw_audio_rejects_empty_body(client: TestClient):
+    response = client.post(
+        "/api/voice/chat",
+        content=b"",
+        headers={"Content-Type": "audio/webm"},
+    )
+    assert response.status_code == 400
+
+
+def test_transcribe_passes_long_audio_flag(client: TestClient):
+    received = []
+
+    def fake_transcribe(audio_content, language, long_audio=False):
+        received.append((bytes(audio_content), language, long_audio))
+        return "texto largo"
+
+    with patch("app.routes.voice.services.transcribe_audio", side_effect=fake_transcribe):
+        response = client.post(
+            "/api/voice/transcribe?language=es-AR&long_audio=true",
+            files={"audio": ("audio.wav", b"123", "audio/wav")},
+        )
+    assert response.status_code == 200
+    assert response.json()["transcript"] == "texto largo"
+    assert received == [(b"123", "es-AR", True)]
+
+
+def test_transcribe_rejects_upload_over_size_limit(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+    with patch("app.routes.voice.services.transcribe_audio") as transcribe_mock:
+        response = client.post(
+            "/api/voice/transcribe",
+            files={"audio": ("audio.wav", b"x" * 4096, "audio/wav")},
+        )
+    assert response.status_code == 413
+    transcribe_mock.assert_not_called()
+
+
+def test_transcribe_rejects_declared_multipart_oversize_before_parsing(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_FORM_OVERHEAD_BYTES", 1024)
+    with patch("starlette.requests.Request.form") as form_mock:
+        response = client.post(
+            "/api/voice/transcribe",
+            files={"audio": ("audio.wav", b"x" * 4096, "audio/wav")},
+        )
+    assert response.status_code == 413
+    form_mock.assert_not_called()
+
+
+def test_voice_chat_cuts_chunked_multipart_over_limit_while_receiving(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_FORM_OVERHEAD_BYTES", 1024)
+
+    def chunked_form():
+        yield (
+            b"--limite\r\n"
+            b'Content-Disposition: form-data; name="audio"; filename="audio.webm"\r\n'
+            b"Content-Type: audio/webm\r\n\r\n"
+        )
+        for _ in range(10):
+            yield b"x" * 16384
+        yield b"\r\n--limite--\r\n"
+
+    with patch("app.routes.voice.read_upload_capped") as read_mock, \
+            patch("app.routes.voice.services.get_chat_response_with_audio") as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            content=chunked_form(),
+            headers={"Content-Type": "multipart/form-data; boundary=limite"},
+        )
+    assert response.status_code == 413
+    # Se corta al recibir el cuerpo, antes de que el endpoint llegue a correr
+    read_mock.assert_not_called()
+    chat_mock.assert_not_called()
+
+
+def test_voice_chat_raw_audio_rejects_body_over_size_limit(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+    with patch("app.routes.voice.services.get_chat_response_with_audio") as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            content=b"x" * 4096,
+            headers={"Content-Type": "audio/webm"},
+        )
+    assert response.status_code == 413
+    chat_mock.assert_not_called()
+
+
+def test_voice_chat_json_rejects_decoded_audio_over_size_limit(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+    with patch("app.routes.voice.services.get_chat_response_with_audio") as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            json={"audio_base64": base64.b64encode(b"x" * 4096).decode()},
+        )
+    assert response.status_code == 413
+    chat_mock.assert_not_called()
+
+
+def test_voice_chat_json_rejects_chunked_body_over_limit(client: TestClient, monkeypatch):
+    monkeypatch.setattr("app.utils.uploads.UPLOAD_MAX_BYTES", 1024)
+
+    def chunked_body():
+        yield b'{"text": "'
+        for _ in range(10):
+            yield b"x" * 16384
+        yield b'"}'
+
+    with patch("app.routes.voice.services.get_chat_response_with_audio") as chat_mock:
+        response = client.post(
+            "/api/voice/chat",
+            content=chunked_body(),
+            headers={"Content-Type": "application/json"},
+        )
+    assert response.status_code == 413
+    chat_mock.assert_not_called()
+
+
+def test_voice_profile_requires_admin_polo(client: TestClient):
+    response = client.get("/api/voice/profile")
+    assert response.status_code == 401
+
+
+def test_voice_profile_reports_stage_breakdown_with_fakes(client: TestClient):
+    pytest.importorskip("numpy")
+    from app.main import app
+    from app.routes.voice import require_admin_polo
+
+    app.dependency_overrides[require_admin_polo] = lambda: object()
+    response = client.get(
+        "/api/voice/profile",
+        params={"iterations": 3, "fake": True, "include_chat": False, "sample_seconds": 0.5},
+    )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["provider"] == "fake"
+    assert data["successful_iterations"] == 3
+    for stage in ("preprocess", "stt", "tts", "base64", "total"):
+        summary = data["stages"][stage]
+        assert summary["count"] == 3
+        assert summary["min_ms"] <= summary["median_ms"] <= summary["p95_ms"]
+    assert data["stages"]["chat"] == {"count": 0}
+    assert data["bytes"]["base64_out"] > data["bytes"]["tts_audio_out"] > 0
+    assert 0.3 < data["bytes"]["base64_overhead_ratio"] < 0.4
+    assert data["memory"]["peak_traced_bytes"] > 0
+
+
+def test_voice_profile_leaves_shared_fake_stt_untouched(client: TestClient):
+    pytest.importorskip("numpy")
+    from app import services, voice_providers
+    from app.main import app
+    from app.routes.voice import require_admin_polo
+
+    app.dependency_overrides[require_admin_polo] = lambda: object()
+    scripted = dict(voice_providers.fake_speech_to_text.transcripts)
+    for seconds in (0.5, 0.6):
+        response = client.get(
+            "/api/voice/profile",
+            params={"iterations": 1, "fake": True, "include_chat": False, "sample_seconds": seconds},
+        )
+        assert response.status_code == 200
+    # El guion del audio de muestra vive en una instancia local del perfilado
+    assert voice_providers.fake_speech_to_text.transcripts == scripted
+    assert services._fake_speech_to_text() is voice_providers.fake_speech_to_text
+
+
+def test_voice_profile_runs_one_at_a_time(client: TestClient):
+    from app import services
+    from app.main import app
+    from app.routes.voice import require_admin_polo
+
+    app.dependency_overrides[require_admin_polo] = lambda: object()
+    with services._profile_lock:
+        with patch("app.services._profile_voice_pipeline") as profile_mock:
+            response = client.get("/api/voice/profile", params={"iterations": 1, "fake": True})
+    # tracemalloc es global: un segundo perfilado no debe arrancar ni detenerlo
+    assert response.status_code == 503
+    assert "en curso" in response.json()["detail"]
+    profile_mock.assert_not_called()
+
+
+def test_synthesize_negotiates_format_from_accept_header(client: TestClient):
+    with patch("app.routes.voice.services.text_to_speech", return_value=b"OggS-audio") as tts_mock:
+        response = client.post(
+            "/api/voice/synthesize",
+            json={"text": "Hola"},
+            headers={"Accept": "audio/mpeg;q=0.5, audio/ogg"},
+        )
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("audio/ogg")
+    assert tts_mock.call_args.kwargs["audio_format"] == "ogg_opus"
+
+
+def test_synthesize_rejects_unknown_format(client: TestClient):
+    response = client.post("/api/voice/synthesize?format=flac", json={"text": "Hola"})
+    assert response.status_code == 400
+
+
+def test_voice_chat_multipart_uses_requested_audio_format(client: TestClient):
+    fake_result = {
+        "text": "Respuesta",
+        "audio_bytes": b"RIFF-wav",
+        "db_results": [],
+        "transcript": None,
+        "corrected_entity": None,
+        "error": False,
+    }
+    with patch(
+        "app.routes.voice.services.get_chat_response_with_audio", return_value=fake_result
+    ) as chat_mock:
+        response = client.post(
+            "/api/voice/chat?format=linear16",
+            json={"text": "Hola"},
+            headers={"Accept": "multipart/mixed"},
+        )
+    assert response.status_code == 200
+    assert chat_mock.call_args.kwargs["audio_format"] == "linear16"
+    (_, json_body), (audio_headers, audio_body) = _split_multipart(response)
+    assert json.loads(json_body)["data"]["audio"]["format"] == "linear16"
+    assert "audio/wav" in audio_headers
+    assert audio_body == b"RIFF-wav"
+
+
+def test_voice_chat_deferred_audio_returns_ticket_then_audio(client: TestClient):
+    from app import voice_tickets
+
+    voice_tickets.audio_tickets.clear()
+    text_result = {
+        "text": "Respuesta rápida",
+        "db_results": [{"nombre": "Logistica"}],
+        "transcript": None,
+        "corrected_entity": None,
+        "error": False,
+    }
+    with patch("app.routes.voice.services.get_chat_text_response", return_value=text_result), \
+         patch("app.services.text_to_speech", return_value=b"OggS-audio") as tts_mock, \
+         patch("app.routes.voice.services.get_chat_response_with_audio") as full_mock:
+        response = client.post(
+            "/api/voice/chat?deferred_audio=true&format=ogg_opus", json={"text": "Hola"}
+        )
+    assert response.status_code == 200
+    data = response.json()["data"]
+    assert data["text"] == "Respuesta rápida"
+    assert data["db_results"] == [{"nombre": "Logistica"}]
+    assert "audio_base64" not in data
+    full_mock.assert_not_called()
+    tts_mock.assert_called_once_with("Respuesta rápida", audio_format="ogg_opus")
+
+    ticket = data["audio_ticket"]
+    assert ticket["url"] == f"/api/voice/audio/{ticket['id']}"
+    audio_response = client.get(ticket["url"], params={"wait": 0})
+    assert audio_response.status_code == 200
+    assert audio_response.content == b"OggS-audio"
+    assert audio_response.headers["content-type"].startswith("audio/ogg")
+
+
+def test_ticket_audio_pending_returns_202_and_unknown_returns_404(client: TestClient):
+    from app import voice_tickets
+
+    ticket = voice_tickets.audio_tickets.create("mp3")
+    pending = client.get(f"/api/voice/audio/{ticket.ticket_id}", params={"wait": 0.2})
+    assert pending.status_code == 202
+    assert pending.headers["retry-after"] == "1"
+
+    missing = client.get("/api/voice/audio/no-existe", params={"wait": 0})
+    assert missing.status_code == 404
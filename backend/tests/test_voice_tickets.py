@@ -0,0 +1,37 @@
+import time
+
+from app import voice_tickets
+
+
+def test_tickets_expire_after_ttl():
+    store = voice_tickets.AudioTicketStore(ttl_seconds=0.05, max_bytes=1024)
+    ticket = store.create("mp3")
+    assert store.complete(ticket.ticket_id, b"audio")
+    assert store.get(ticket.ticket_id).status == voice_tickets.READY
+
+    time.sleep(0.08)
+    assert store.get(ticket.ticket_id) is None
+    assert store.stats()["size_bytes"] == 0
+
+
+def test_store_evicts_oldest_ready_audio_to_stay_within_bytes():
+    store = voice_tickets.AudioTicketStore(ttl_seconds=60, max_bytes=100)
+    first = store.create("mp3")
+    pending = store.create("mp3")
+    second = store.create("mp3")
+    store.complete(first.ticket_id, b"a" * 60)
+    store.complete(second.ticket_id, b"b" * 60)
+
+    assert store.get(first.ticket_id) is None
+    # Los pendientes no se descartan para hacer lugar
+    assert store.get(pending.ticket_id).status == voice_tickets.PENDING
+    assert store.get(second.ticket_id).audio == b"b" * 60
+    assert store.stats()["size_bytes"] == 60
+    assert store.stats()["evicted"] == 1
+
+
+def test_audio_larger_than_limit_marks_ticket_as_failed():
+    store = voice_tickets.AudioTicketStore(ttl_seconds=60, max_bytes=10)
+    ticket = store.create("mp3")
+    assert store.complete(ticket.ticket_id, b"x" * 11) is False
+    assert store.get(ticket.ticket_id).status == voice_tickets.FAILED
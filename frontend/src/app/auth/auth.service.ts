@@ -374,6 +374,20 @@ export class AuthenticationService {
     );
   }
 
+  /**
+   * Reemplazar el token vigente en el mismo almacenamiento donde estaba
+   * (tradicional en localStorage/sessionStorage o Google OAuth)
+   */
+  private replaceToken(token: string): void {
+    if (localStorage.getItem(this.sessionKey)) {
+      localStorage.setItem(this.sessionKey, token);
+    } else if (sessionStorage.getItem(this.sessionKey)) {
+      sessionStorage.setItem(this.sessionKey, token);
+    } else {
+      this.setToken(token);
+    }
+  }
+
   // ✅ MÉTODO MEJORADO - Guardar rol para Google OAuth
   setUserRole(role: string): void {
     localStorage.setItem('tipo_rol', role);
@@ -455,8 +469,12 @@ export class AuthenticationService {
     return this.http
       .post(`${environment.apiUrl}/change-password-direct`, data, { headers })
       .pipe(
-        tap((response) => {
+        tap((response: any) => {
           console.log('✅ Cambio de contraseña directo exitoso:', response);
+          // El cambio revoca los tokens emitidos: seguir con el nuevo
+          if (response?.access_token) {
+            this.replaceToken(response.access_token);
+          }
         }),
         catchError((err) => {
           console.error('❌ Error en cambio de contraseña directo:', err);